@@ -0,0 +1,226 @@
+"""
+An asyncio (ASGI) entry point that serves the same routes as flask_app.py. Grading, batch grading and
+next-token requests run on a bounded thread or process pool, so a slow parse never holds up the event
+loop. Pages and static files are served by the Flask app directly on the event loop. When the
+grading pool already has max_pending requests queued or running, further grading requests are
+rejected right away with 503 and a Retry-After header instead of queueing without limit.
+
+Run it with any ASGI server, e.g. `uvicorn asgi_app:app`, or `python asgi_app.py` if uvicorn is
+installed. The pool is configured with these environment variables:
+    SCAFFOLDED_WRITING_EXECUTOR     "thread" (default) or "process"
+    SCAFFOLDED_WRITING_WORKERS      number of workers (default: the number of CPUs)
+    SCAFFOLDED_WRITING_MAX_PENDING  requests queued or running at once (default: 4 * workers)
+
+The default is a thread pool because /metrics is served from this process's registry, which does not
+include what process pool workers record: with "process", grading can use every CPU, but the grading
+and constraint metrics stay at zero.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, MutableMapping, Optional, Tuple
+
+import flask_app
+
+ScopeT = MutableMapping[str, Any]
+MessageT = MutableMapping[str, Any]
+ReceiveT = Callable[[], Awaitable[MessageT]]
+SendT = Callable[[MessageT], Awaitable[None]]
+
+# Maps the last path segment of each POST route under /<problem_name>/ to the function that does
+# its work and the content type of its response. Responses are sent the way flask_app sends them.
+GRADING_ROUTES: Dict[str, Tuple[Callable[[str, Any], Any], str]] = {
+    "submit": (flask_app.grade_submission, "text/html; charset=utf-8"),
+    "submit_batch": (flask_app.grade_submission_batch, "application/json"),
+    "next_tokens": (flask_app.compute_next_tokens, "application/json"),
+}
+GRADING_ROUTE_RE = re.compile(r"^/([^/]+)/(" + "|".join(GRADING_ROUTES) + r")$")
+
+RETRY_AFTER_SECONDS = 1
+
+logger = logging.getLogger(__name__)
+
+class ExecutorBusyError(Exception):
+    pass
+
+
+class BoundedExecutor():
+    """
+    Runs functions on an executor, allowing at most max_pending of them to be queued or running
+    at once. It is only used from the event loop's thread, so the count needs no lock.
+    """
+    def __init__(self, executor: Executor, max_pending: int) -> None:
+        self.executor = executor
+        self.max_pending = max_pending
+        self.num_pending = 0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        "Runs fn(*args) on the executor, raising ExecutorBusyError if max_pending calls are already pending"
+        if self.num_pending >= self.max_pending:
+            raise ExecutorBusyError
+
+        self.num_pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.num_pending -= 1
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+async def read_body(receive: ReceiveT) -> bytes:
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+
+    return b"".join(chunks)
+
+
+async def send_response(send: SendT, status: int, headers: List[Tuple[str, str]], body: bytes) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+                   + [(b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def to_wsgi_environ(scope: ScopeT, body: bytes) -> Dict[str, Any]:
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ: Dict[str, Any] = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+
+    for raw_name, raw_value in scope.get("headers", []):
+        name, value = raw_name.decode("latin-1").upper().replace("-", "_"), raw_value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+
+    return environ
+
+
+async def serve_with_flask(scope: ScopeT, body: bytes, send: SendT) -> None:
+    "Serves a (fast) page or static file request with the Flask app, without leaving the event loop"
+    response_start: List[Any] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]], exc_info: Any = None) -> Callable[[bytes], None]:
+        response_start[:] = [int(status.split(" ", 1)[0]), headers]
+        return lambda data: None
+
+    result = flask_app.app(to_wsgi_environ(scope, body), start_response)
+    try:
+        response_body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+    status, headers = response_start
+    headers = [(name, value) for name, value in headers if name.lower() != "content-length"]
+    await send_response(send, status, headers, response_body)
+
+
+def create_app(executor_type: str = "thread", workers: Optional[int] = None,
+               max_pending: Optional[int] = None) -> Callable[[ScopeT, ReceiveT, SendT], Awaitable[None]]:
+    workers = workers or os.cpu_count() or 1
+    executor: Executor
+    if executor_type == "process":
+        executor = ProcessPoolExecutor(workers)
+    elif executor_type == "thread":
+        executor = ThreadPoolExecutor(workers)
+    else:
+        raise ValueError(f'Unknown executor type {executor_type} (expected "thread" or "process")')
+
+    grading_executor = BoundedExecutor(executor, max_pending or 4 * workers)
+
+    async def serve_grading_request(fn: Callable[[str, Any], Any], content_type: str, problem_name: str,
+                                    body: bytes, send: SendT) -> None:
+        try:
+            request_json = json.loads(body)
+        except ValueError:
+            await send_response(send, 400, [("Content-Type", "text/plain")], b"Bad Request")
+            return
+
+        try:
+            result = await grading_executor.run(fn, problem_name, request_json)
+        except ExecutorBusyError:
+            await send_response(
+                send, 503,
+                [("Content-Type", "text/plain"), ("Retry-After", str(RETRY_AFTER_SECONDS))],
+                b"The server is busy grading other submissions. Please try again."
+            )
+            return
+        except Exception:
+            logger.exception("Error while handling a request to /%s", problem_name)
+            await send_response(send, 500, [("Content-Type", "text/plain")], b"Internal Server Error")
+            return
+
+        if content_type == "application/json":
+            response_body = (json.dumps(result, separators=(",", ":"), sort_keys=True) + "\n").encode()
+        else:
+            response_body = result.encode()
+        await send_response(send, 200, [("Content-Type", content_type)], response_body)
+
+    async def app(scope: ScopeT, receive: ReceiveT, send: SendT) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    grading_executor.shutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if scope["type"] != "http":
+            return
+
+        body = await read_body(receive)
+        match = GRADING_ROUTE_RE.match(scope["path"])
+        if match and scope["method"] == "POST":
+            problem_name, route = match.groups()
+            fn, content_type = GRADING_ROUTES[route]
+            await serve_grading_request(fn, content_type, problem_name, body, send)
+        else:
+            await serve_with_flask(scope, body, send)
+
+    app.grading_executor = grading_executor  # type: ignore[attr-defined]
+    return app
+
+
+app = create_app(
+    os.environ.get("SCAFFOLDED_WRITING_EXECUTOR", "thread"),
+    int(os.environ.get("SCAFFOLDED_WRITING_WORKERS", 0)) or None,
+    int(os.environ.get("SCAFFOLDED_WRITING_MAX_PENDING", 0)) or None,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi_app:app", host="0.0.0.0", port=5000)
@@ -0,0 +1,78 @@
+"""
+Compares grading a batch of submissions one at a time (the way handle_submit does) with grading the
+whole batch through IncrementalConstraintGrader.grade_many, both in-process and over HTTP.
+
+Submissions are drawn from the problem's language with a skewed distribution, since in a real
+course section many students converge on the same few answers.
+
+Usage: python -m benchmarks.batch_grading [--problem max_profit] [--submissions 5000] [--distinct 300]
+"""
+import argparse
+import importlib
+import random
+import time
+from typing import Callable, List
+
+from flask_app import app
+from scaffolded_writing.grader_registry import get_grader
+from scaffolded_writing.student_submission import PARSE_CACHE
+
+def time_per_submission(grade_batch: Callable[[], None], num_submissions: int) -> float:
+    "Returns the average time per submission in microseconds, starting from an empty parse cache"
+    PARSE_CACHE.clear()
+    start = time.perf_counter()
+    grade_batch()
+    return (time.perf_counter() - start) / num_submissions * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--problem", default="partition_digits_basic_version")
+    parser.add_argument("--submissions", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=300, help="number of distinct sentences to draw from")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    problem = importlib.import_module("problems." + args.problem)
+    grader = get_grader(args.problem)
+
+    rng = random.Random(args.seed)
+    sentences = [list(sentence) for sentence in grader.question_cfg.generate_sentences()]
+    distinct_sentences = rng.sample(sentences, min(args.distinct, len(sentences)))
+    weights = [1 / (rank + 1) for rank in range(len(distinct_sentences))]
+    batch: List[List[str]] = rng.choices(distinct_sentences, weights=weights, k=args.submissions)
+
+    def grade_one_at_a_time() -> None:
+        for tokens in batch:
+            data = {
+                "submitted_answers": {"subproblem_definition": tokens},
+                "partial_scores": {},
+                "feedback": {},
+                "format_errors": {},
+            }
+            problem.grade(data)
+
+    def grade_as_batch() -> None:
+        grader.grade_many(batch)
+
+    client = app.test_client()
+
+    def submit_one_at_a_time() -> None:
+        for tokens in batch:
+            client.post(f"/{args.problem}/submit", json=tokens)
+
+    def submit_as_batch() -> None:
+        client.post(f"/{args.problem}/submit_batch", json=batch)
+
+    print(f"{args.submissions} submissions of {len(distinct_sentences)} distinct sentences for {args.problem}")
+    for description, single, batched in [
+        ("library", grade_one_at_a_time, grade_as_batch),
+        ("HTTP", submit_one_at_a_time, submit_as_batch),
+    ]:
+        single_time = time_per_submission(single, len(batch))
+        batch_time = time_per_submission(batched, len(batch))
+        print(f"{description:>8}: {single_time:8.1f} us/submission one at a time, "
+              f"{batch_time:8.1f} us/submission batched ({single_time / batch_time:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
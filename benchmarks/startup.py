@@ -0,0 +1,82 @@
+"""
+Measures what a fresh worker pays to load every problem module: the wall-clock import time and the
+peak resident memory of the process. Each measurement runs in a new interpreter, and the median of
+several runs is reported. For comparison, the same is measured for importing nltk on its own (if it
+is installed), which the grader used to pull in on every import.
+
+Usage: python -m benchmarks.startup [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+MEASURE = """
+import importlib, json, pkgutil, resource, sys, time
+start = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - start
+# ru_maxrss can include the parent process's peak on Linux, so prefer the peak that the kernel
+# tracks for this process since exec
+max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+try:
+    with open("/proc/self/status") as f:
+        max_rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+except OSError:
+    pass
+print(json.dumps({{
+    "import_ms": elapsed * 1000,
+    "max_rss_mb": max_rss_kb / 1024,
+    "nltk_loaded": "nltk" in sys.modules,
+}}))
+"""
+
+LOAD_NOTHING = "pass"
+
+LOAD_PROBLEMS = """
+import problems
+for module in pkgutil.iter_modules(problems.__path__):
+    importlib.import_module("problems." + module.name)
+"""
+
+LOAD_NLTK = """
+import nltk.grammar, nltk.tree
+"""
+
+def measure(body: str, runs: int) -> Dict[str, float]:
+    "Returns the median import time and peak RSS of running body in a fresh interpreter"
+    results: List[Dict[str, float]] = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", MEASURE.format(body=body)], capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output))
+
+    return {
+        "import_ms": statistics.median(result["import_ms"] for result in results),
+        "max_rss_mb": statistics.median(result["max_rss_mb"] for result in results),
+        "nltk_loaded": any(result["nltk_loaded"] for result in results),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    scenarios = [("bare interpreter", LOAD_NOTHING), ("all problems", LOAD_PROBLEMS)]
+    try:
+        import nltk  # noqa: F401
+        scenarios.append(("nltk alone", LOAD_NLTK))
+    except ImportError:
+        pass
+
+    for description, body in scenarios:
+        result = measure(body, args.runs)
+        print(f"{description:>16}: {result['import_ms']:8.1f} ms to import, {result['max_rss_mb']:6.1f} MB peak RSS"
+              + (" (loads nltk)" if result["nltk_loaded"] else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Times the grading pipeline on every problem in problems/, and writes the latency distribution of each
+operation as JSON so that runs can be compared across commits.
+
+For each problem, three samples of sentences are drawn from its grammar: "realistic" sentences, drawn
+uniformly from the language, "longest" sentences, drawn from the sentences with the most tokens, and
+"unparseable" sentences, which are longest sentences missing their last token. After a warm-up pass,
+each operation is timed once per sentence (or once per path, field or prefix), with the parse cache,
+the grader's result cache and its grade table disabled:
+    submission        constructing the grader's StudentSubmission subclass (i.e. parsing)
+    does_path_exist   checking each parent -> child path in the grammar
+    get_parameters    get_parameters_in_field for each field that the grader's constraints inspect
+    grade             the problem's grade() function, as called by PrairieLearn and flask_app.py
+    next_tokens       computing the next tokens after each prefix of the sentence, in order
+
+Usage: python -m benchmarks.suite [--sentences 200] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import importlib
+import json
+import math
+import platform
+import pkgutil
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import problems
+from scaffolded_writing.cfg import ScaffoldedWritingCFG
+from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader
+from scaffolded_writing.dp_utils import DecoupledParametersConstraint, DPStudentSubmission, ReducesRecursivelyConstraint
+from scaffolded_writing.grader_registry import get_grader
+from scaffolded_writing.grammar import CFG, Nonterminal, SymbolT, expand_terminal_families
+from scaffolded_writing.next_tokens import NextTokenParser
+from scaffolded_writing.student_submission import PARSE_CACHE
+
+PERCENTILES = [50, 95, 99]
+WARM_UP_SENTENCES = 20
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    "Returns the count, mean, max and percentiles (nearest rank) of durations in seconds, in microseconds"
+    durations = sorted(durations)
+    summary = {"count": len(durations), "mean_us": sum(durations) / len(durations) * 1e6}
+    for percentile in PERCENTILES:
+        rank = max(math.ceil(percentile / 100 * len(durations)), 1)
+        summary[f"p{percentile}_us"] = durations[rank - 1] * 1e6
+    summary["max_us"] = durations[-1] * 1e6
+    return summary
+
+
+def time_call(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    try:
+        fn()
+    except ValueError:
+        # Parse errors are part of what's being timed
+        pass
+    return time.perf_counter() - start
+
+
+class SentenceSampler():
+    "Draws sentences from a finite grammar, either uniformly or among the longest sentences"
+    def __init__(self, cfg: ScaffoldedWritingCFG, rng: random.Random) -> None:
+        # Terminal families are expanded, so each of their members is drawn as often as a plain terminal
+        self.cfg = CFG(cfg.start(), expand_terminal_families(cfg.productions()))
+        self.rng = rng
+        self.counts: Dict[SymbolT, int] = {}
+        self.max_lengths: Dict[SymbolT, int] = {}
+
+    def count(self, symbol: SymbolT) -> int:
+        "The number of derivations of symbol"
+        if not isinstance(symbol, Nonterminal):
+            return 1
+
+        if symbol not in self.counts:
+            self.counts[symbol] = sum(
+                math.prod(self.count(child) for child in prod.rhs()) for prod in self.cfg.productions(lhs=symbol)
+            )
+        return self.counts[symbol]
+
+    def max_length(self, symbol: SymbolT) -> int:
+        "The number of tokens in the longest sentence that symbol derives"
+        if not isinstance(symbol, Nonterminal):
+            return 1
+
+        if symbol not in self.max_lengths:
+            self.max_lengths[symbol] = max(
+                sum(self.max_length(child) for child in prod.rhs()) for prod in self.cfg.productions(lhs=symbol)
+            )
+        return self.max_lengths[symbol]
+
+    def sample(self, longest: bool = False) -> List[str]:
+        tokens: List[str] = []
+        stack: List[SymbolT] = [self.cfg.start()]
+        while stack:
+            symbol = stack.pop()
+            if not isinstance(symbol, Nonterminal):
+                tokens.append(symbol)
+                continue
+
+            productions = self.cfg.productions(lhs=symbol)
+            if longest:
+                productions = [
+                    prod for prod in productions
+                    if sum(self.max_length(child) for child in prod.rhs()) == self.max_length(symbol)
+                ]
+                prod = self.rng.choice(productions)
+            else:
+                weights = [math.prod(self.count(child) for child in prod.rhs()) for prod in productions]
+                prod, = self.rng.choices(productions, weights=weights)
+            stack.extend(reversed(prod.rhs()))
+
+        return tokens
+
+
+def inspected_fields(grader: IncrementalConstraintGrader) -> List[str]:
+    "The fields whose parameters the grader's constraints look up"
+    fields: Set[str] = set()
+    for constraint, _ in grader.constraints:
+        if isinstance(constraint, DecoupledParametersConstraint):
+            fields.update(constraint.independent_fields)
+        elif isinstance(constraint, ReducesRecursivelyConstraint):
+            fields.add(constraint.field_requiring_parameters)
+
+    return sorted(fields)
+
+
+def benchmark_sentences(problem_name: str, sentences: Sequence[List[str]]) -> Dict[str, Dict[str, float]]:
+    problem = importlib.import_module("problems." + problem_name)
+    grader = get_grader(problem_name)
+    cfg = grader.question_cfg
+    paths: List[Tuple[str, str]] = sorted({
+        (prod.lhs().symbol(), child.symbol() if isinstance(child, Nonterminal) else child)
+        for prod in expand_terminal_families(cfg.productions()) for child in prod.rhs()
+    })
+    fields = inspected_fields(grader) if issubclass(grader.submission_type, DPStudentSubmission) else []
+
+    durations: Dict[str, List[float]] = {
+        "submission": [], "does_path_exist": [], "get_parameters": [], "grade": [], "next_tokens": []
+    }
+    for tokens in sentences:
+        durations["submission"].append(time_call(lambda: grader.submission_type(tokens, cfg)))
+
+        data = {
+            "submitted_answers": {"subproblem_definition": tokens},
+            "partial_scores": {},
+            "feedback": {},
+            "format_errors": {},
+        }
+        durations["grade"].append(time_call(lambda: problem.grade(data)))
+
+        parser = NextTokenParser(cfg)
+        for length in range(len(tokens) + 1):
+            durations["next_tokens"].append(time_call(lambda: parser.next_tokens(tokens[:length])))
+
+        try:
+            submission = grader.submission_type(tokens, cfg)
+        except ValueError:
+            continue
+        for path in paths:
+            durations["does_path_exist"].append(time_call(lambda: submission.does_path_exist(*path)))
+        for field in fields:
+            durations["get_parameters"].append(time_call(lambda: submission.get_parameters_in_field(field)))
+
+    return {operation: summarize(times) for operation, times in durations.items() if times}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_problem(problem_name: str, num_sentences: int, seed: int) -> Dict[str, Any]:
+    grader = get_grader(problem_name)
+    cfg = grader.question_cfg
+    if not cfg.is_finite():
+        return {"skipped": "The grammar generates infinitely many sentences"}
+
+    sampler = SentenceSampler(cfg, random.Random(seed))
+    samples = {
+        "realistic": [sampler.sample() for _ in range(num_sentences)],
+        "longest": [sampler.sample(longest=True) for _ in range(num_sentences)],
+    }
+    samples["unparseable"] = [tokens[:-1] for tokens in samples["longest"]]
+
+    # Grading is timed without the grade table and result cache, which would only time a lookup
+    grade_table, result_cache = grader.grade_table, grader.result_cache
+    grader.grade_table = grader.result_cache = None
+    try:
+        benchmark_sentences(problem_name, samples["realistic"][:WARM_UP_SENTENCES])
+        return {sample: benchmark_sentences(problem_name, sentences) for sample, sentences in samples.items()}
+    finally:
+        grader.grade_table, grader.result_cache = grade_table, result_cache
+
+
+def run_suite(problem_names: Sequence[str], num_sentences: int, seed: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    parse_cache_size = PARSE_CACHE.maxsize
+    PARSE_CACHE.resize(0)
+    try:
+        for problem_name in problem_names:
+            results[problem_name] = benchmark_problem(problem_name, num_sentences, seed)
+    finally:
+        PARSE_CACHE.resize(parse_cache_size)
+
+    return {
+        "metadata": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "sentences": num_sentences,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def print_comparison(baseline: Dict[str, Any], current: Dict[str, Any]) -> None:
+    "Prints how each operation's p50 and p95 changed relative to the baseline run"
+    for problem_name, samples in current["results"].items():
+        for sample, operations in samples.items():
+            baseline_operations = baseline["results"].get(problem_name, {}).get(sample)
+            if not isinstance(operations, dict) or not isinstance(baseline_operations, dict):
+                continue
+
+            for operation, summary in operations.items():
+                if operation not in baseline_operations:
+                    continue
+                ratios = [
+                    f"p{percentile} {summary[f'p{percentile}_us'] / baseline_operations[operation][f'p{percentile}_us']:5.2f}x"
+                    for percentile in (50, 95)
+                ]
+                print(f"{problem_name:>45} {sample:>11} {operation:>16}: {', '.join(ratios)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--problem", action="append", help="only benchmark this problem (can be repeated)")
+    parser.add_argument("--sentences", type=int, default=200, help="number of sentences per sample")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the JSON results to (defaults to stdout)")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    problem_names = args.problem or sorted(module.name for module in pkgutil.iter_modules(problems.__path__))
+    results = run_suite(problem_names, args.sentences, args.seed)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
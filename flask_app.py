@@ -1,5 +1,10 @@
-from flask import Flask, request, render_template, redirect
+from flask import Flask, Response, request, render_template, redirect, jsonify, url_for
 import importlib
+from typing import Any, Dict, List
+
+from scaffolded_writing.grader_registry import get_grader
+from scaffolded_writing.metrics import METRICS
+from scaffolded_writing.next_tokens import get_possible_next_tokens
 
 app = Flask(__name__)
 
@@ -16,20 +21,45 @@ def display_problem(problem_name: str) -> str:
 
     problem = importlib.import_module("problems." + problem_name)
 
-    data = {"params": {}}
-    problem.generate(data)
-
+    # The page fetches the CFG from serve_cfg, which browsers can cache across page views
     return render_template(
         'autograded_problem.html',
         statement=problem.statement,
-        cfg=data["params"]["subproblem_definition_cfg"]
+        cfg_url=url_for("serve_cfg", problem_name=problem_name)
     )
 
-@app.route("/<problem_name>/submit", methods=["POST"])
-def handle_submit(problem_name: str) -> str:
+@app.route("/<problem_name>/cfg.json")
+def serve_cfg(problem_name: str) -> Response:
+    """
+    Serves the problem's CFG as JSON, precompressed in the best encoding the client accepts. Clients
+    revalidate with If-None-Match on every use, and get a 304 if the CFG hasn't changed.
+    """
+    payload = get_grader(problem_name).question_cfg.json_payload
+    variant = payload.negotiate(request.headers.get("Accept-Encoding"))
+
+    if request.if_none_match.contains_weak(variant.etag):
+        response = Response(status=304)
+    else:
+        response = Response(variant.body, content_type=payload.content_type)
+        if variant.encoding != "identity":
+            response.headers["Content-Encoding"] = variant.encoding
+
+    response.set_etag(variant.etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/metrics")
+def serve_metrics() -> Response:
+    "Grading counters and latency histograms for this process, in the Prometheus text format"
+    return Response(METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+# The grading work behind each POST route, as plain functions of the parsed request body, so that
+# asgi_app.py can run them on its executor
+
+def grade_submission(problem_name: str, tokenized_sentence: List[str]) -> str:
     problem = importlib.import_module("problems." + problem_name)
 
-    tokenized_sentence = request.get_json()
     data = {
         "submitted_answers": {"subproblem_definition": tokenized_sentence},
         "partial_scores": {},
@@ -40,5 +70,37 @@ def handle_submit(problem_name: str) -> str:
 
     return data["feedback"].get("subproblem_definition", "Good job!")
 
+def grade_submission_batch(problem_name: str, tokenized_sentences: List[List[str]]) -> List[Dict[str, Any]]:
+    """
+    Grades a list of tokenized sentences, returning a list (in the same order) of
+    {"score": ..., "feedback": ...} objects, or {"format_error": ...} for sentences that could not be parsed
+    """
+    grader = get_grader(problem_name)
+
+    results = []
+    for outcome in grader.grade_many(tokenized_sentences):
+        if isinstance(outcome, ValueError):
+            results.append({"format_error": str(outcome)})
+        else:
+            results.append({"score": outcome.score, "feedback": outcome.feedback or "Good job!"})
+
+    return results
+
+def compute_next_tokens(problem_name: str, prefix: List[str]) -> List[str]:
+    "Returns the tokens that can follow the (partial) token list, in the order the browser lists them"
+    return get_possible_next_tokens(get_grader(problem_name).question_cfg, prefix)
+
+@app.route("/<problem_name>/submit", methods=["POST"])
+def handle_submit(problem_name: str) -> str:
+    return grade_submission(problem_name, request.get_json())
+
+@app.route("/<problem_name>/submit_batch", methods=["POST"])
+def handle_submit_batch(problem_name: str):
+    return jsonify(grade_submission_batch(problem_name, request.get_json()))
+
+@app.route("/<problem_name>/next_tokens", methods=["POST"])
+def handle_next_tokens(problem_name: str):
+    return jsonify(compute_next_tokens(problem_name, request.get_json()))
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0")
@@ -3,6 +3,7 @@ from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrad
 from scaffolded_writing.dp_cfgs import GRASSLEARN_CFG
 from shared_utils import set_weighted_score_data
 import scaffolded_writing.dp_utils as sw_du
+from scaffolded_writing.grader_registry import register_grader
 
 class ArrayReducesConstraint(sw_du.ReducesRecursivelyConstraint):
     def get_unhandled_scenario(self, submission: sw_du.DPStudentSubmission) -> str:
@@ -44,7 +45,7 @@ def generate(data: Dict[str, Any]) -> None:
     data["params"]["subproblem_definition_cfg"] = GRASSLEARN_CFG.to_json_string()
 
 
-def grade(data: Dict[str, Any]) -> None:
+def build_grader() -> IncrementalConstraintGrader[sw_du.DPStudentSubmission]:
     grader = IncrementalConstraintGrader(sw_du.DPStudentSubmission, GRASSLEARN_CFG)
 
     grader.add_constraint(sw_du.DeclareFunctionConstraint(), 0.05)
@@ -65,7 +66,14 @@ def grade(data: Dict[str, Any]) -> None:
     grader.add_constraint(StreakLengthReducesConstraint("STREAK_LENGTH"), 0.7)
     grader.add_constraint(sw_du.NoDoubleEndedParameterization())
 
-    grader.grade_question(data, "subproblem_definition")
+    return grader
+
+
+GRADER = register_grader(__name__, build_grader())
+
+
+def grade(data: Dict[str, Any]) -> None:
+    GRADER.grade_question(data, "subproblem_definition")
     set_weighted_score_data(data)
 
 statement = """
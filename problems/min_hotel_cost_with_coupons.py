@@ -1,11 +1,11 @@
 from typing import Dict, Any
-from scaffolded_writing.cfg import ScaffoldedWritingCFG
 from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader
 import scaffolded_writing.dp_utils as sw_du
+from scaffolded_writing.grader_registry import register_grader
 
 from shared_utils import set_weighted_score_data
 
-MIN_HOTEL_COST_CFG = ScaffoldedWritingCFG.fromstring(f"""
+MIN_HOTEL_COST_CFG = sw_du.DPScaffoldedWritingCFG.fromstring(f"""
 SENTENCE -> "Define" FUNCTION_DECLARATION "to be the" FUNCTION_OUTPUT "."
 
 FUNCTION_DECLARATION -> "the subproblem" | "DP(i)" | "DP(i,j)" | "MinCost(i)" | "MinCost(i,j)"
@@ -53,7 +53,7 @@ def generate(data: Dict[str, Any]) -> None:
     data["params"]["subproblem_definition_cfg"] = MIN_HOTEL_COST_CFG.to_json_string()
 
 
-def grade(data: Dict[str, Any]) -> None:
+def build_grader() -> IncrementalConstraintGrader[sw_du.DPStudentSubmission]:
     grader = IncrementalConstraintGrader(sw_du.DPStudentSubmission, MIN_HOTEL_COST_CFG)
 
     grader.add_constraint(sw_du.DeclareFunctionConstraint(), 0.05)
@@ -90,7 +90,14 @@ def grade(data: Dict[str, Any]) -> None:
     # grader.add_constraint(sw_du.NoDoubleEndedParameterization())
     # TODO: implement check for double ended parameterization (needed for no-coupon version)
 
-    grader.grade_question(data, "subproblem_definition")
+    return grader
+
+
+GRADER = register_grader(__name__, build_grader())
+
+
+def grade(data: Dict[str, Any]) -> None:
+    GRADER.grade_question(data, "subproblem_definition")
     set_weighted_score_data(data)
 
 statement = """
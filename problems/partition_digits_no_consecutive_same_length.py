@@ -1,6 +1,7 @@
 from typing import Dict, Any
 from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader
 import scaffolded_writing.dp_utils as sw_du
+from scaffolded_writing.grader_registry import register_grader
 
 from scaffolded_writing.dp_cfgs import PARTITION_SUM_CFG
 from shared_utils import set_weighted_score_data
@@ -38,7 +39,7 @@ def generate(data: Dict[str, Any]) -> None:
     data["params"]["subproblem_definition_cfg"] = PARTITION_SUM_CFG.to_json_string()
 
 
-def grade(data: Dict[str, Any]) -> None:
+def build_grader() -> IncrementalConstraintGrader[sw_du.DPStudentSubmission]:
     grader = IncrementalConstraintGrader(sw_du.DPStudentSubmission, PARTITION_SUM_CFG)
 
     grader.add_constraint(sw_du.DeclareFunctionConstraint(), 0.05)
@@ -56,7 +57,14 @@ def grade(data: Dict[str, Any]) -> None:
     grader.add_constraint(sw_du.NoIrrelevantRestrictions("NUM_TWO_DIGIT_TERMS_RESTRICTION"), 0.7)
     grader.add_constraint(sw_du.NoDoubleEndedParameterization())
 
-    grader.grade_question(data, "subproblem_definition")
+    return grader
+
+
+GRADER = register_grader(__name__, build_grader())
+
+
+def grade(data: Dict[str, Any]) -> None:
+    GRADER.grade_question(data, "subproblem_definition")
     set_weighted_score_data(data)
 
 statement = """
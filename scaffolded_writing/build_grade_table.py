@@ -0,0 +1,70 @@
+"""
+Grades every sentence in the (finite) language of a problem's CFG and writes the results to the
+problem's grade table (see grade_table.py), which the problem's grader then loads the next time it is
+registered. Rebuild the table whenever the grader changes; until then, the grader ignores the out of
+date table and grades live.
+
+Usage: python -m scaffolded_writing.build_grade_table <problem_name> [--processes N] [--output path.sgt]
+"""
+import argparse
+import functools
+import os
+from typing import List, Optional, Sequence, Tuple
+
+from scaffolded_writing.grade_table import RowT, grade_table_path, write_grade_table
+from scaffolded_writing.grader_registry import get_grader, get_live_grader
+from scaffolded_writing.parallel import bounded_map, chunked
+from scaffolded_writing.student_submission import AmbiguousParseException
+
+def _grade_chunk(problem_name: str, sentences: List[Tuple[str, ...]]) -> List[Tuple[Tuple[str, ...], RowT]]:
+    "Returns the rows for the sentences that have a unique parse tree"
+    # Every sentence must be graded live, not looked up in the table being replaced
+    grader = get_live_grader(problem_name)
+    rows: List[Tuple[Tuple[str, ...], RowT]] = []
+    for tokens in sentences:
+        try:
+            result = grader.grade_result(list(tokens))
+        except (AmbiguousParseException, ValueError):
+            # Sentences left out of the table are graded live, which raises the same exception
+            continue
+        rows.append((tokens, (result.score, result.feedback, result.failed_constraint)))
+
+    return rows
+
+
+def build_grade_table(problem_name: str, output_path: Optional[str] = None, *, processes: int = 1,
+                      chunk_size: int = 1000) -> int:
+    "Writes the problem's grade table, returning the number of sentences in it"
+    grader = get_grader(problem_name)
+    grader.validate()
+    output_path = output_path or grade_table_path(problem_name)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    rows = (
+        row
+        for chunk_rows in bounded_map(
+            functools.partial(_grade_chunk, problem_name),
+            chunked(grader.question_cfg.generate_sentences(), chunk_size),
+            processes=processes,
+        )
+        for row in chunk_rows
+    )
+    return write_grade_table(output_path, grader.fingerprint, rows)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Precompute the grade of every sentence in a problem's CFG.")
+    parser.add_argument("problem_name", help="name of a module in problems/, e.g. max_profit")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--output", help="file to write the table to (defaults to grade_tables/<problem_name>.sgt)")
+    args = parser.parse_args(argv)
+
+    output_path = args.output or grade_table_path(args.problem_name)
+    num_sentences = build_grade_table(
+        args.problem_name, output_path, processes=args.processes, chunk_size=args.chunk_size
+    )
+    print(f"Wrote the grades of {num_sentences} sentences to {output_path}")
+
+if __name__ == "__main__":
+    main()
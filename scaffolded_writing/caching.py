@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Generic, Hashable, NamedTuple, Optional, Tuple, TypeVar
+
+KeyT = TypeVar('KeyT', bound=Hashable)
+ValueT = TypeVar('ValueT')
+
+_MISSING = object()
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    size: int
+    maxsize: int
+
+
+class LRUCache(Generic[KeyT, ValueT]):
+    """
+    A bounded, thread-safe cache that evicts the least recently used entry once it holds more than
+    maxsize entries. A maxsize of 0 disables caching entirely. If ttl is set, entries also expire
+    ttl seconds after they were stored.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        if maxsize < 0:
+            raise ValueError(f"Cache size {maxsize} must be nonnegative")
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"Time to live {ttl} must be positive")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Maps each key to (expiration time, value)
+        self._entries: "OrderedDict[KeyT, Tuple[float, ValueT]]" = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: KeyT, default: Optional[ValueT] = None) -> Optional[ValueT]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                return default
+
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: KeyT, value: ValueT) -> None:
+        with self._lock:
+            if self.maxsize == 0:
+                return
+
+            expiration = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+            self._entries[key] = (expiration, value)
+            self._entries.move_to_end(key)
+            self._evict_overflow()
+
+    def get_or_compute(self, key: KeyT, compute: Callable[[], ValueT]) -> ValueT:
+        """
+        Returns the cached value for key, calling compute() and caching its result on a miss.
+        compute() runs without holding the lock, so two threads may occasionally compute the same value.
+        """
+        value = self.get(key, _MISSING)  # type: ignore
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+
+        return value  # type: ignore
+
+    def resize(self, maxsize: int) -> None:
+        if maxsize < 0:
+            raise ValueError(f"Cache size {maxsize} must be nonnegative")
+
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict_overflow()
+
+    def clear(self) -> None:
+        "Removes every entry and resets the counters"
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = self._evictions = self._expirations = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                self._hits, self._misses, self._evictions, self._expirations, len(self._entries), self.maxsize
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict_overflow(self) -> None:
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._evictions += 1
@@ -1,13 +1,37 @@
+import hashlib
 import html
 import json
-from nltk.grammar import CFG, Nonterminal, Production
-from typing import Dict, List, Set, Union
+import logging
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
 
-TerminalT = str
-SymbolT = Union[Nonterminal, TerminalT]
+from scaffolded_writing.dfa import DFAParser, GrammarNotCompilableError, GrammarTooLargeError
+from scaffolded_writing.grammar import (
+    CFG, Nonterminal, Production, SymbolT, SymbolTable, TerminalClassifier, TerminalFamily, TerminalT,
+    expand_terminal_families, read_grammar
+)
+from scaffolded_writing.parsers import EarleyParser, LL1Parser, compute_nullable, find_ambiguous_sentence
+from scaffolded_writing.payloads import CompressedPayload
+
+# Marks the end of the input in FOLLOW sets and in the LL(1) table
+END_OF_INPUT = None
+LookaheadT = Optional[TerminalT]
+
+logger = logging.getLogger(__name__)
+
+class AmbiguousGrammarError(Exception):
+    "Raised when a CFG is loaded if some sentence (the witness) has more than one parse tree"
+    def __init__(self, witness: List[str]) -> None:
+        super().__init__(f"The CFG is ambiguous: {witness} has more than one parse tree")
+        self.witness = witness
 
 class ScaffoldedWritingCFG(CFG):
-    def __init__(self, start: Nonterminal, productions: List[Production]) -> None:
+    def __init__(self, start: Nonterminal, productions: List[Production], check_ambiguity: bool = True) -> None:
+        """
+        Unless check_ambiguity is False, raises an AmbiguousGrammarError if the CFG is ambiguous. The check
+        is exact for grammars that are compiled into a DFA or have no LL(1) conflicts, and only covers
+        short sentences for the rest. Once a CFG has passed an exact check, its parser stops at the first
+        parse tree.
+        """
         super().__init__(start, productions)
 
         lhs_nonterminals = {prod.lhs() for prod in self.productions()}
@@ -32,18 +56,195 @@ class ScaffoldedWritingCFG(CFG):
 
         self.terminals = {
             symbol for prod in self.productions() for symbol in prod.rhs()
-            if isinstance(symbol, TerminalT)
+            if not isinstance(symbol, Nonterminal)
+        }
+        # Raises a ValueError if a token could be an instance of more than one terminal
+        self.terminal_classifier = TerminalClassifier(self.productions())
+
+        # Give every symbol an integer id (the same ids that parse trees use), and represent sets of
+        # symbols as bitsets over those ids.
+        self.symbol_table = SymbolTable(self.start(), self.productions())
+        self.symbol_ids: Dict[SymbolT, int] = self.symbol_table.ids
+        self.symbols: List[SymbolT] = self.symbol_table.symbols
+
+        # Maps each nonterminal's label to its id
+        self.nonterminal_ids: Dict[str, int] = {
+            symbol.symbol(): symbol_id for symbol, symbol_id in self.symbol_ids.items()
+            if isinstance(symbol, Nonterminal)
         }
 
-        # Maps each nonterminal to the set of terminal and nonterminal symbols that
-        # it can *directly* produce in one step.
-        self.symbols_produced_by_nonterminal: Dict[Nonterminal, Set[SymbolT]] = \
-            {nonterminal: set() for nonterminal in self.nonterminals}
+        # Maps each label to the bitset of symbols with that label (a terminal and a nonterminal could share one).
+        # Terminal families never label a node of a parse tree; their members do.
+        self.label_bits: Dict[str, int] = {}
+        for symbol, symbol_id in self.symbol_ids.items():
+            if isinstance(symbol, TerminalFamily):
+                continue
+            label = symbol.symbol() if isinstance(symbol, Nonterminal) else symbol
+            self.label_bits[label] = self.label_bits.get(label, 0) | (1 << symbol_id)
 
+        # child_bits[id] is the set of symbols that the nonterminal with that id can produce in one step,
+        # and descendant_bits[id] is the set of symbols that it can eventually produce.
+        self.child_bits: List[int] = [0] * len(self.symbols)
         for prod in self.productions():
-            self.symbols_produced_by_nonterminal[prod.lhs()].update(prod.rhs())
+            for symbol in prod.rhs():
+                for child in (symbol.members() if isinstance(symbol, TerminalFamily) else [symbol]):
+                    self.child_bits[self.symbol_ids[prod.lhs()]] |= 1 << self.symbol_ids[child]
+
+        self.descendant_bits = list(self.child_bits)
+        for intermediate_id in self.nonterminal_ids.values():
+            for symbol_id in self.nonterminal_ids.values():
+                if self.descendant_bits[symbol_id] >> intermediate_id & 1:
+                    self.descendant_bits[symbol_id] |= self.descendant_bits[intermediate_id]
+
+        # A stable hash of the grammar's content, so anything cached per grammar is invalidated
+        # automatically whenever a production is edited. Terminal families are hashed as their members,
+        # so writing a grammar with families does not change its fingerprint.
+        self.fingerprint = hashlib.sha256(
+            "\n".join([str(self.start())] + [str(prod) for prod in expand_terminal_families(self.productions())]).encode()
+        ).hexdigest()
+
+        self.nullable = compute_nullable(self.productions())
+        self.first_sets: Dict[Nonterminal, Set[TerminalT]] = {nonterminal: set() for nonterminal in self.nonterminals}
+        self.__compute_first_sets()
+        self.follow_sets = self.__compute_follow_sets()
+        self.ll1_table, self.ll1_conflicts = self.__compute_ll1_table()
+
+        # The grammar never changes after construction, so its JSON is serialized (and compressed) only once
+        self._json_string: Optional[str] = None
+        self._json_payload: Optional[CompressedPayload] = None
+
+        # Finite grammars are compiled into a DFA when it is small enough. Otherwise, grammars without
+        # LL(1) conflicts are parsed in a single linear pass, and the rest fall back to the general
+        # Earley parser.
+        self.parser: Union[DFAParser, LL1Parser, EarleyParser]
+        dfa_error: Optional[Exception] = None
+        if self.is_finite():
+            try:
+                self.parser = DFAParser(self)
+            except (GrammarTooLargeError, GrammarNotCompilableError) as err:
+                dfa_error = err
+        else:
+            dfa_error = GrammarNotCompilableError("The CFG is recursive")
+
+        if dfa_error is None:
+            self.parsing_strategy = "DFA"
+        elif not self.ll1_conflicts:
+            self.parsing_strategy = "LL(1)"
+            self.parser = LL1Parser(self.start(), list(self.productions()), self.ll1_table)
+        else:
+            self.parsing_strategy = "Earley"
+            self.parser = EarleyParser(self)
+
+        logger.info(
+            "Using the %s parser for the CFG with start symbol %s (DFA: %s; %d LL(1) conflicts)",
+            self.parsing_strategy, self.start(),
+            f"{len(self.parser.transitions)} states" if isinstance(self.parser, DFAParser) else dfa_error,
+            len(self.ll1_conflicts)
+        )
+
+        if check_ambiguity and not self.parser.unambiguous:
+            if isinstance(self.parser, DFAParser):
+                witness = self.parser.find_ambiguous_sentence()
+            else:
+                witness = find_ambiguous_sentence(self)
+            if witness is not None:
+                raise AmbiguousGrammarError(witness)
+            # The check is only exact for the DFA, so the Earley parser keeps counting parse trees
+            if isinstance(self.parser, DFAParser):
+                self.parser.unambiguous = True
+
+    @classmethod
+    def fromstring(cls, input: str, check_ambiguity: bool = True) -> "ScaffoldedWritingCFG":
+        start, productions = read_grammar(input)
+        return cls(start, productions, check_ambiguity=check_ambiguity)
+
+    def first_of_sequence(self, symbols: Sequence[SymbolT]) -> Set[TerminalT]:
+        "Returns the set of terminals that can begin a string derived from the sequence of symbols"
+        first: Set[TerminalT] = set()
+        for symbol in symbols:
+            if not isinstance(symbol, Nonterminal):
+                first.add(symbol)
+                return first
+
+            first.update(self.first_sets[symbol])
+            if symbol not in self.nullable:
+                return first
+
+        return first
+
+    def is_sequence_nullable(self, symbols: Sequence[SymbolT]) -> bool:
+        return all(symbol in self.nullable for symbol in symbols)
+
+    def __compute_first_sets(self) -> None:
+        changed = True
+        while changed:
+            changed = False
+            for prod in self.productions():
+                first = self.first_of_sequence(prod.rhs())
+                if not first <= self.first_sets[prod.lhs()]:
+                    self.first_sets[prod.lhs()].update(first)
+                    changed = True
+
+    def __compute_follow_sets(self) -> Dict[Nonterminal, Set[LookaheadT]]:
+        follow_sets: Dict[Nonterminal, Set[LookaheadT]] = {nonterminal: set() for nonterminal in self.nonterminals}
+        follow_sets[self.start()].add(END_OF_INPUT)
+
+        changed = True
+        while changed:
+            changed = False
+            for prod in self.productions():
+                rhs = prod.rhs()
+                for index, symbol in enumerate(rhs):
+                    if not isinstance(symbol, Nonterminal):
+                        continue
+
+                    follow: Set[LookaheadT] = set(self.first_of_sequence(rhs[index + 1:]))
+                    if self.is_sequence_nullable(rhs[index + 1:]):
+                        follow.update(follow_sets[prod.lhs()])
+
+                    if not follow <= follow_sets[symbol]:
+                        follow_sets[symbol].update(follow)
+                        changed = True
+
+        return follow_sets
+
+    def __compute_ll1_table(
+        self
+    ) -> Tuple[Dict[Nonterminal, Dict[LookaheadT, int]], List[Tuple[Nonterminal, LookaheadT]]]:
+        """
+        Returns the LL(1) table, which maps (nonterminal, lookahead) to the index of the production to expand,
+        along with the list of (nonterminal, lookahead) pairs for which more than one production applies.
+        """
+        table: Dict[Nonterminal, Dict[LookaheadT, int]] = {nonterminal: {} for nonterminal in self.nonterminals}
+        conflicts: List[Tuple[Nonterminal, LookaheadT]] = []
+
+        for prod_index, prod in enumerate(self.productions()):
+            lookaheads: Set[LookaheadT] = set(self.first_of_sequence(prod.rhs()))
+            if self.is_sequence_nullable(prod.rhs()):
+                lookaheads.update(self.follow_sets[prod.lhs()])
+
+            for lookahead in lookaheads:
+                if table[prod.lhs()].setdefault(lookahead, prod_index) != prod_index:
+                    conflicts.append((prod.lhs(), lookahead))
+
+        return table, conflicts
 
     def to_json_string(self) -> str:
+        if self._json_string is None:
+            self._json_string = self.__serialize_json()
+
+        return self._json_string
+
+    @property
+    def json_payload(self) -> CompressedPayload:
+        "The grammar's JSON as bytes, along with its compressed variants and their ETags"
+        if self._json_payload is None:
+            self._json_payload = CompressedPayload(self.to_json_string().encode())
+
+        return self._json_payload
+
+    def __serialize_json(self) -> str:
+        # The client only understands plain terminals, so it is sent one production per member of each family
         cfg_as_json = {
             "start": html.escape(self.start().symbol()),
             "productions": [
@@ -52,12 +253,12 @@ class ScaffoldedWritingCFG(CFG):
                     "rhs": [
                         {
                             "text": html.escape(str(symbol)),
-                            "isTerminal": isinstance(symbol, TerminalT)
+                            "isTerminal": not isinstance(symbol, Nonterminal)
                         }
                         for symbol in prod.rhs()
                     ]
                 }
-                for prod in self.productions()
+                for prod in expand_terminal_families(self.productions())
             ]
         }
 
@@ -71,14 +272,82 @@ class ScaffoldedWritingCFG(CFG):
         assert len(path) > 0
 
         if len(path) == 1:
-            symbol = path[0]
-            return symbol in self.terminals or Nonterminal(symbol) in self.nonterminals
+            return path[0] in self.label_bits
 
-        def can_parent_produce_child(parent: str, child: str) -> bool:
-            if Nonterminal(parent) not in self.nonterminals:
+        for parent, child in zip(path[:-1], path[1:]):
+            parent_id = self.nonterminal_ids.get(parent)
+            if parent_id is None or not self.child_bits[parent_id] & self.label_bits.get(child, 0):
                 return False
 
-            allowed_children = self.symbols_produced_by_nonterminal[Nonterminal(parent)]
-            return child in allowed_children or Nonterminal(child) in allowed_children
+        return True
+
+    def can_derive(self, ancestor: str, descendant: str) -> bool:
+        """
+        Determines whether the nonterminal labeled ancestor can derive, in one or more steps, a parse tree
+        containing a node labeled descendant.
+        """
+        ancestor_id = self.nonterminal_ids.get(ancestor)
+        return ancestor_id is not None and bool(self.descendant_bits[ancestor_id] & self.label_bits.get(descendant, 0))
+
+    def is_finite(self) -> bool:
+        "Returns True iff the CFG generates finitely many sentences (i.e. no nonterminal can derive itself)"
+        return not any(self.descendant_bits[symbol_id] >> symbol_id & 1 for symbol_id in self.nonterminal_ids.values())
+
+    def count_sentences(self) -> int:
+        """
+        Returns the number of distinct parse trees that the CFG can produce, which is the number
+        of sentences in its language if the CFG is unambiguous.
+        """
+        if not self.is_finite():
+            raise ValueError("This CFG generates infinitely many sentences")
+
+        counts: Dict[SymbolT, int] = {}
+
+        def count_symbol(symbol: SymbolT) -> int:
+            if isinstance(symbol, TerminalFamily):
+                return len(symbol)
+            elif not isinstance(symbol, Nonterminal):
+                return 1
+
+            if symbol not in counts:
+                counts[symbol] = 0
+                for prod in self.productions(lhs=symbol):
+                    product = 1
+                    for child in prod.rhs():
+                        product *= count_symbol(child)
+                    counts[symbol] += product
+
+            return counts[symbol]
+
+        return count_symbol(self.start())
+
+    def generate_sentences(self) -> Iterator[Tuple[str, ...]]:
+        """
+        Lazily yields every sentence that the CFG can produce (once per parse tree). Only a single
+        derivation is held in memory at a time, so this is safe to use on very large finite languages.
+        """
+        if not self.is_finite():
+            raise ValueError("This CFG generates infinitely many sentences")
+
+        def expand(symbols: Tuple[SymbolT, ...]) -> Iterator[Tuple[str, ...]]:
+            if len(symbols) == 0:
+                yield ()
+                return
+
+            first, rest = symbols[0], symbols[1:]
+            if isinstance(first, TerminalFamily):
+                for member in first.members():
+                    for tail in expand(rest):
+                        yield (member,) + tail
+                return
+            elif not isinstance(first, Nonterminal):
+                for tail in expand(rest):
+                    yield (first,) + tail
+                return
+
+            for prod in self.productions(lhs=first):
+                for head in expand(prod.rhs()):
+                    for tail in expand(rest):
+                        yield head + tail
 
-        return all(can_parent_produce_child(parent, child) for parent, child in zip(path[:-1], path[1:]))
+        return expand((self.start(),))
@@ -1,18 +1,147 @@
+import hashlib
+import inspect
+import logging
+import sys
+import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from types import CodeType
+from scaffolded_writing.caching import CacheStats, LRUCache
 from scaffolded_writing.cfg import ScaffoldedWritingCFG
-from scaffolded_writing.student_submission import StudentSubmission
+from scaffolded_writing.grade_table import GradeTable
+from scaffolded_writing.metrics import (
+    AMBIGUOUS_PARSES,
+    CONSTRAINT_FAILURES,
+    CONSTRAINT_SECONDS,
+    GRADE_TABLE_HITS,
+    PARSE_ERRORS,
+    PARSE_SECONDS,
+)
+from scaffolded_writing.student_submission import AmbiguousParseException, StudentSubmission
+from scaffolded_writing.submission_log import SubmissionLogger
 from shared_utils import grade_question_parameterized
-from typing import Generic, List, Optional, Tuple, TypeVar, Dict, Any, Type
+from typing import Generic, Iterable, List, NamedTuple, Optional, Sequence, Tuple, TypeVar, Dict, Any, Type, Union
 
 SubmissionT = TypeVar('SubmissionT', bound=StudentSubmission)
 
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Verdict():
+    """
+    The result of evaluating a constraint on a single submission. A constraint whose feedback depends
+    on details computed while checking the submission returns a subclass of Verdict holding those
+    details, rather than storing them on the constraint, so that one constraint object can be shared
+    by concurrent requests.
+    """
+    is_satisfied: bool
+
+
 class Constraint(ABC, Generic[SubmissionT]):
+    """
+    Constraints must not store per-submission state on self. Subclasses override either
+    is_satisfied() and get_feedback(), or, if the feedback depends on details computed while checking
+    the submission, evaluate() and explain(). A subclass that overrides neither method of a pair is
+    abstract, so instantiating it (i.e. building its problem's grader) raises a TypeError.
+    """
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        # Overriding evaluate() or explain() implements its counterpart, which would otherwise stay abstract
+        if cls.is_satisfied is Constraint.is_satisfied and cls.evaluate is not Constraint.evaluate:
+            cls.is_satisfied = Constraint._is_satisfied_from_verdict  # type: ignore[assignment]
+        if cls.get_feedback is Constraint.get_feedback and cls.explain is not Constraint.explain:
+            cls.get_feedback = Constraint._feedback_from_verdict  # type: ignore[assignment]
+
     @abstractmethod
     def is_satisfied(self, submission: SubmissionT) -> bool: ...
 
     @abstractmethod
     def get_feedback(self, submission: SubmissionT) -> str: ...
 
+    def _is_satisfied_from_verdict(self, submission: SubmissionT) -> bool:
+        return self.evaluate(submission).is_satisfied
+
+    def _feedback_from_verdict(self, submission: SubmissionT) -> str:
+        return self.explain(submission, self.evaluate(submission))
+
+    def evaluate(self, submission: SubmissionT) -> Verdict:
+        return Verdict(self.is_satisfied(submission))
+
+    def explain(self, submission: SubmissionT, verdict: Verdict) -> str:
+        "Returns feedback for a submission that was evaluated as unsatisfied"
+        return self.get_feedback(submission)
+
+
+def stable_repr(value: Any) -> str:
+    "Like repr, but sets and dicts are sorted so that the result does not depend on hash ordering"
+    if isinstance(value, (set, frozenset)):
+        return "{" + ", ".join(sorted(stable_repr(item) for item in value)) + "}"
+    elif isinstance(value, dict):
+        return "{" + ", ".join(sorted(f"{stable_repr(k)}: {stable_repr(v)}" for k, v in value.items())) + "}"
+    elif isinstance(value, (list, tuple)):
+        return "[" + ", ".join(stable_repr(item) for item in value) + "]"
+
+    return repr(value)
+
+
+def _hash_bytecode(code: CodeType, digest: "hashlib._Hash") -> None:
+    digest.update(code.co_code + repr(code.co_names).encode())
+    for const in code.co_consts:
+        # The repr of a code object includes its address, so nested functions are hashed recursively
+        if isinstance(const, CodeType):
+            _hash_bytecode(const, digest)
+        else:
+            digest.update(repr(const).encode())
+
+
+_source_fingerprints: Dict[type, str] = {}
+
+def _source_fingerprint(cls: type) -> str:
+    "A hash of the source of the module that defines cls, or of cls's bytecode if the source is not available"
+    if cls not in _source_fingerprints:
+        digest = hashlib.sha256()
+        try:
+            digest.update(inspect.getsource(sys.modules[cls.__module__]).encode())
+        except (KeyError, OSError, TypeError):
+            # e.g. the class was defined by exec
+            for name, value in sorted(vars(cls).items()):
+                if inspect.isfunction(value):
+                    digest.update(name.encode())
+                    _hash_bytecode(value.__code__, digest)
+        _source_fingerprints[cls] = digest.hexdigest()
+
+    return _source_fingerprints[cls]
+
+
+def code_fingerprint(cls: type, base: type) -> str:
+    """
+    A hash of the code of cls and of its base classes up to (and including) base, i.e. of the modules
+    that define them, so that fixing a bug in a constraint or submission type (or in a helper function
+    next to it) changes the fingerprint of every grader that uses it
+    """
+    return hashlib.sha256(" ".join(
+        _source_fingerprint(ancestor) for ancestor in cls.__mro__ if issubclass(ancestor, base)
+    ).encode()).hexdigest()
+
+
+def constraint_fingerprint(constraint: Constraint) -> str:
+    "Describes the constraint's class (including its code) and configuration"
+    constraint_type = type(constraint)
+    return (
+        f"{constraint_type.__module__}.{constraint_type.__qualname__}{stable_repr(vars(constraint))}"
+        f" {code_fingerprint(constraint_type, Constraint)}"
+    )
+
+
+class GradeResult(NamedTuple):
+    score: float
+    feedback: Optional[str]
+    # Index (into grader.constraints) of the first constraint that was not satisfied, if any
+    failed_constraint: Optional[int]
+
+
+# The cached outcome of grading a token list: either the result or the format error that was raised
+GradeOutcomeT = Union[GradeResult, ValueError]
 
 class IncrementalConstraintGrader(Generic[SubmissionT]):
     "Class for incrementally constructing a grader for scaffolded writing questions"
@@ -24,6 +153,62 @@ class IncrementalConstraintGrader(Generic[SubmissionT]):
         self.submission_type = submission_type
         self.question_cfg = question_cfg
         self.constraints: List[Tuple[Constraint[SubmissionT], float]] = []
+        # Labels the grader's metrics; register_grader sets it to the problem name
+        self.name = "unregistered"
+        self.constraint_names: List[str] = []
+
+        # Each constraint is fingerprinted when it is added, since its configuration is set by then.
+        self.constraint_fingerprints: List[str] = []
+        self.result_cache: Optional[LRUCache[Tuple[str, Tuple[str, ...]], GradeOutcomeT]] = None
+        self.grade_table: Optional[GradeTable] = None
+        # Set by register_grader if submissions are logged. Only grade_tokens and grade_many (which
+        # serve students' requests) log submissions, so offline regrading does not.
+        self.submission_logger: Optional[SubmissionLogger] = None
+        self.fingerprint = self.__compute_fingerprint()
+
+    def __compute_fingerprint(self) -> str:
+        "A hash of the grammar, submission type, constraints (including their code) and partial credit values"
+        description = "\n".join([
+            self.question_cfg.fingerprint,
+            f"{self.submission_type.__module__}.{self.submission_type.__qualname__}"
+            f" {code_fingerprint(self.submission_type, StudentSubmission)}",
+            *(
+                f"{fingerprint} {partial_credit!r}"
+                for fingerprint, (_, partial_credit) in zip(self.constraint_fingerprints, self.constraints)
+            )
+        ])
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def enable_result_cache(self, maxsize: int = 4096, ttl: Optional[float] = None) -> None:
+        """
+        Opt in to caching the (score, feedback) result for each token list, so that repeated
+        submissions skip parsing and constraint evaluation. Entries expire after ttl seconds if set.
+        """
+        self.result_cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def result_cache_stats(self) -> Optional[CacheStats]:
+        return self.result_cache.stats() if self.result_cache is not None else None
+
+    def load_grade_table(self, path: str) -> bool:
+        """
+        Looks up results in the precomputed grade table at path (see grade_table.py) before grading
+        live. Sentences that are not in the table (i.e. that cannot be parsed) are still graded live.
+        Returns False, and keeps grading everything live, if the table cannot be read or was built
+        for a different grammar or grader.
+        """
+        try:
+            grade_table = GradeTable(path)
+        except (OSError, ValueError) as err:
+            logger.warning("Not using the grade table %s: %s", path, err)
+            return False
+
+        if grade_table.fingerprint != self.fingerprint:
+            logger.warning("Not using the grade table %s, since it was built for a different version of the grader", path)
+            grade_table.close()
+            return False
+
+        self.grade_table = grade_table
+        return True
 
 
     def add_constraint(self, constraint: Constraint[SubmissionT], partial_credit: float = 1.0) -> None:
@@ -34,25 +219,123 @@ class IncrementalConstraintGrader(Generic[SubmissionT]):
             raise ValueError("New partial credit value not increasing")
 
         self.constraints.append((constraint, partial_credit))
+        self.constraint_fingerprints.append(constraint_fingerprint(constraint))
+        self.constraint_names.append(type(constraint).__qualname__)
+        self.fingerprint = self.__compute_fingerprint()
 
 
-    def grade_question(self, data: Dict[str, Any], question_name: str) -> None:
-        "Grade question_name using the constraints in the given list"
+    def validate(self) -> None:
+        "Raises a ValueError if the grader is not fully configured"
         if len(self.constraints) == 0:
             raise ValueError("No constraints set for this grader")
         elif self.constraints[-1][1] != 1.0:
             raise ValueError("Final constraint in grader doesn't grant full credit")
 
-        def constraint_grader(tokens: List[str]) -> Tuple[float, Optional[str]]:
+    def grade_question(self, data: Dict[str, Any], question_name: str) -> None:
+        "Grade question_name using the constraints in the given list"
+        self.validate()
+
+        grade_question_parameterized(data, question_name, self.grade_tokens)
+
+    def grade_tokens(self, tokens: List[str]) -> Tuple[float, Optional[str]]:
+        "Returns (score, feedback) for the token list, raising a ValueError if it cannot be parsed"
+        start = time.perf_counter()
+        try:
+            score, feedback, failed_constraint = self.grade_result(tokens)
+        except ValueError as err:
+            self.__log(tokens, err, time.perf_counter() - start)
+            raise
+
+        self.__log(tokens, GradeResult(score, feedback, failed_constraint), time.perf_counter() - start)
+        return score, feedback
+
+    def grade_many(self, token_lists: Iterable[Sequence[str]]) -> List[GradeOutcomeT]:
+        """
+        Grades a batch of token lists, returning (in order) the GradeResult for each one, or the
+        ValueError it raised if it could not be parsed. The grader is validated once for the whole
+        batch, and token lists that occur more than once in the batch are only graded once.
+        """
+        self.validate()
+
+        outcomes: Dict[Tuple[str, ...], GradeOutcomeT] = {}
+        results: List[GradeOutcomeT] = []
+        for tokens in token_lists:
+            key = tuple(tokens)
+            start = time.perf_counter()
+            if key not in outcomes:
+                try:
+                    outcomes[key] = self.grade_result(list(key))
+                except ValueError as err:
+                    outcomes[key] = err
+
+            self.__log(key, outcomes[key], time.perf_counter() - start)
+            results.append(outcomes[key])
+
+        return results
+
+    def __log(self, tokens: Sequence[str], outcome: GradeOutcomeT, grading_seconds: float) -> None:
+        if self.submission_logger is None:
+            return
+
+        if isinstance(outcome, ValueError):
+            self.submission_logger.log(self.name, tokens, None, None, str(outcome), grading_seconds)
+        else:
+            self.submission_logger.log(
+                self.name, tokens, outcome.score, outcome.failed_constraint, outcome.feedback, grading_seconds
+            )
+
+    def grade_result(self, tokens: List[str]) -> GradeResult:
+        "Like grade_tokens, but also reports which constraint failed"
+        if self.grade_table is not None:
+            row = self.grade_table.get(tokens)
+            if row is not None:
+                GRADE_TABLE_HITS.inc(self.name)
+                result = GradeResult(*row)
+                if result.failed_constraint is not None:
+                    CONSTRAINT_FAILURES.inc(self.name, self.constraint_names[result.failed_constraint])
+                return result
+
+        if self.result_cache is None:
+            return self.__evaluate_constraints(tokens)
+
+        key = (self.fingerprint, tuple(tokens))
+        outcome = self.result_cache.get(key)
+        if outcome is None:
+            try:
+                outcome = self.__evaluate_constraints(tokens)
+            except ValueError as err:
+                outcome = err
+
+            self.result_cache.put(key, outcome)
+
+        if isinstance(outcome, ValueError):
+            raise outcome
+
+        return outcome
+
+    def __evaluate_constraints(self, tokens: List[str]) -> GradeResult:
+        start = time.perf_counter()
+        try:
             submission = self.submission_type(tokens, self.question_cfg)
+        except AmbiguousParseException:
+            AMBIGUOUS_PARSES.inc(self.name)
+            raise
+        except ValueError:
+            PARSE_ERRORS.inc(self.name)
+            raise
+        finally:
+            PARSE_SECONDS.observe(time.perf_counter() - start, self.name)
 
-            prev_score = 0.0
-            for (constraint, partial_credit) in self.constraints:
-                if not constraint.is_satisfied(submission):
-                    return prev_score, constraint.get_feedback(submission)
+        prev_score = 0.0
+        for index, (constraint, partial_credit) in enumerate(self.constraints):
+            start = time.perf_counter()
+            verdict = constraint.evaluate(submission)
+            CONSTRAINT_SECONDS.observe(time.perf_counter() - start, self.name, self.constraint_names[index])
 
-                prev_score = partial_credit
+            if not verdict.is_satisfied:
+                CONSTRAINT_FAILURES.inc(self.name, self.constraint_names[index])
+                return GradeResult(prev_score, constraint.explain(submission, verdict), index)
 
-            return prev_score, None
+            prev_score = partial_credit
 
-        grade_question_parameterized(data, question_name, constraint_grader)
+        return GradeResult(prev_score, None, None)
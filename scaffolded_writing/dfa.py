@@ -0,0 +1,444 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from scaffolded_writing.grammar import CFG, Nonterminal, SymbolTable, TerminalClassifier, TerminalFamily, TerminalT
+from scaffolded_writing.parsers import MANY, ParseResult
+from scaffolded_writing.tree import CompactTreeBuilder, TreeNode
+
+# Grammars whose inlined form has more positions, or whose DFA has more states, are not compiled
+DEFAULT_MAX_POSITIONS = 50_000
+DEFAULT_MAX_STATES = 20_000
+
+class GrammarTooLargeError(Exception):
+    "Raised if a grammar cannot be compiled into a DFA within the size limits"
+    pass
+
+class GrammarNotCompilableError(Exception):
+    "Raised if a grammar is recursive, or derives the empty string in more than one way somewhere"
+    pass
+
+
+class Position(NamedTuple):
+    "An occurrence of a terminal in the inlined grammar"
+    terminal: TerminalT
+    # The nonterminal instance and alternative (index into its productions) that it occurs in
+    instance: int
+    alternative: int
+
+
+class Instance(NamedTuple):
+    """
+    An occurrence of a nonterminal in the inlined grammar. Since the grammar is not recursive, every
+    occurrence of a nonterminal in a production can be expanded separately, which turns the grammar
+    into a tree of instances (effectively a regular expression without stars).
+    """
+    nonterminal: Nonterminal
+    # (instance, alternative) that this instance occurs in, or None for the start symbol
+    parent: Optional[Tuple[int, int]]
+    # For each of the nonterminal's productions, the children: ("T", position) or ("N", instance)
+    alternatives: List[List[Tuple[str, int]]]
+
+
+class DFAParser():
+    """
+    Parses sentences of a finite CFG with a deterministic finite automaton over tokens, so that checking
+    a sentence, listing the tokens that can follow a prefix, and rebuilding a parse tree are all single
+    left-to-right scans with no search.
+
+    The grammar is inlined into a tree of instances, and each terminal occurrence in that tree is a
+    position of a Glushkov automaton. The subset construction turns that automaton into a DFA whose
+    states are sets of positions, which is then minimized for membership tests. A parse tree is rebuilt
+    from the sequence of positions that a sentence passes through, since every position knows which
+    instance and alternative it belongs to; subtrees that derive the empty string are filled in with
+    their (unique) empty derivation.
+    """
+    def __init__(self, cfg: CFG, max_positions: int = DEFAULT_MAX_POSITIONS,
+                 max_states: int = DEFAULT_MAX_STATES) -> None:
+        self.max_positions = max_positions
+        self.max_states = max_states
+
+        self.symbol_table = SymbolTable(cfg.start(), cfg.productions())
+        self.terminal_classifier = TerminalClassifier(cfg.productions())
+        self.positions: List[Position] = []
+        self.instances: List[Instance] = []
+        self.__inline(cfg)
+        self.instance_symbol_ids = [self.symbol_table.ids[instance.nonterminal] for instance in self.instances]
+        self.__compute_empty_derivations()
+        self.__compute_glushkov_sets()
+        self.__build_subset_dfa()
+        self.__minimize()
+        # Set by ScaffoldedWritingCFG once it has checked that the grammar is unambiguous, in which case
+        # the trees of a sentence are never counted
+        self.unambiguous = False
+
+    def __inline(self, cfg: CFG) -> None:
+        productions_by_lhs: Dict[Nonterminal, List[Tuple[Union[Nonterminal, TerminalT], ...]]] = {}
+        for prod in cfg.productions():
+            productions_by_lhs.setdefault(prod.lhs(), []).append(prod.rhs())
+
+        # Instances and positions are numbered in preorder, so positions are in the order they appear
+        # in the grammar. The recursion is only as deep as the grammar, since recursive grammars are rejected.
+        def expand(nonterminal: Nonterminal, parent: Optional[Tuple[int, int]],
+                   ancestors: Tuple[Nonterminal, ...]) -> int:
+            if nonterminal in ancestors:
+                raise GrammarNotCompilableError(f"The CFG is recursive in {nonterminal}")
+
+            instance_id = len(self.instances)
+            self.instances.append(Instance(nonterminal, parent, []))
+
+            for alternative, rhs in enumerate(productions_by_lhs.get(nonterminal, ())):
+                children: List[Tuple[str, int]] = []
+                self.instances[instance_id].alternatives.append(children)
+
+                for symbol in rhs:
+                    if len(self.positions) + len(self.instances) > self.max_positions:
+                        raise GrammarTooLargeError(
+                            f"The inlined CFG has more than {self.max_positions} terminal and nonterminal occurrences"
+                        )
+
+                    if isinstance(symbol, Nonterminal):
+                        child_id = expand(symbol, (instance_id, alternative), ancestors + (nonterminal,))
+                        children.append(("N", child_id))
+                    else:
+                        children.append(("T", len(self.positions)))
+                        self.positions.append(Position(symbol, instance_id, alternative))
+
+            return instance_id
+
+        expand(cfg.start(), None, ())
+
+    def __compute_empty_derivations(self) -> None:
+        """
+        Finds, for every instance that can derive the empty string, the alternative that it does so with.
+        Children are always added after their parents, so visiting instances in reverse order visits
+        every child before its parent.
+        """
+        # empty_alternative[i] is None if instance i cannot derive the empty string
+        self.empty_alternative: List[Optional[int]] = [None] * len(self.instances)
+        for instance_id in reversed(range(len(self.instances))):
+            nullable_alternatives = [
+                alternative for alternative, children in enumerate(self.instances[instance_id].alternatives)
+                if all(kind == "N" and self.empty_alternative[child] is not None for kind, child in children)
+            ]
+            if len(nullable_alternatives) > 1:
+                raise GrammarNotCompilableError(
+                    f"{self.instances[instance_id].nonterminal} can derive the empty string in more than one way"
+                )
+            elif nullable_alternatives:
+                self.empty_alternative[instance_id], = nullable_alternatives
+
+    def __compute_glushkov_sets(self) -> None:
+        "Computes the first and last positions of every instance, and the positions that can follow each position"
+        # Sets of positions are bitsets
+        self.follow: List[int] = [0] * len(self.positions)
+        first: List[int] = [0] * len(self.instances)
+        last: List[int] = [0] * len(self.instances)
+
+        def child_sets(kind: str, child: int) -> Tuple[bool, int, int]:
+            if kind == "T":
+                return False, 1 << child, 1 << child
+            return self.empty_alternative[child] is not None, first[child], last[child]
+
+        for instance_id in reversed(range(len(self.instances))):
+            for children in self.instances[instance_id].alternatives:
+                sets = [child_sets(kind, child) for kind, child in children]
+
+                # Positions that can end the prefix of the alternative read so far
+                preceding_last = 0
+                alternative_first = 0
+                prefix_nullable = True
+                for nullable, child_first, child_last in sets:
+                    for position in iterate_bits(preceding_last):
+                        self.follow[position] |= child_first
+                    preceding_last = preceding_last | child_last if nullable else child_last
+
+                    if prefix_nullable:
+                        alternative_first |= child_first
+                    prefix_nullable = prefix_nullable and nullable
+
+                first[instance_id] |= alternative_first
+                last[instance_id] |= preceding_last
+
+        self.start_positions = first[0]
+        self.final_positions = last[0]
+        self.accepts_empty = self.empty_alternative[0] is not None
+
+    def __build_subset_dfa(self) -> None:
+        # State 0 is the initial state, in which no position has been read yet
+        self.state_positions: List[int] = [0]
+        self.state_ids: Dict[int, int] = {}
+        self.subset_transitions: List[Dict[TerminalT, int]] = []
+
+        for state_id in range(self.max_states):
+            if state_id == len(self.state_positions):
+                break
+
+            positions = self.state_positions[state_id]
+            if state_id == 0:
+                next_positions = self.start_positions
+            else:
+                next_positions = 0
+                for position in iterate_bits(positions):
+                    next_positions |= self.follow[position]
+
+            # Group the next positions by their terminal, keeping the terminals in grammar order
+            positions_by_terminal: Dict[TerminalT, int] = {}
+            for position in iterate_bits(next_positions):
+                terminal = self.positions[position].terminal
+                positions_by_terminal[terminal] = positions_by_terminal.get(terminal, 0) | (1 << position)
+
+            transitions: Dict[TerminalT, int] = {}
+            for terminal, target_positions in positions_by_terminal.items():
+                if target_positions not in self.state_ids:
+                    self.state_ids[target_positions] = len(self.state_positions)
+                    self.state_positions.append(target_positions)
+                transitions[terminal] = self.state_ids[target_positions]
+
+            self.subset_transitions.append(transitions)
+        else:
+            raise GrammarTooLargeError(f"The DFA for the CFG has more than {self.max_states} states")
+
+        self.subset_accepting = [
+            bool(positions & self.final_positions) for positions in self.state_positions
+        ]
+        self.subset_accepting[0] = self.accepts_empty
+
+    def __minimize(self) -> None:
+        "Merges equivalent states of the subset DFA with Moore's partition refinement algorithm"
+        num_states = len(self.state_positions)
+        block = [int(accepting) for accepting in self.subset_accepting]
+
+        while True:
+            signatures: Dict[Tuple, int] = {}
+            new_block = [
+                signatures.setdefault(
+                    (block[state], tuple(sorted(
+                        ((str(terminal), terminal, block[target]) for terminal, target in transitions.items()),
+                        key=lambda transition: (isinstance(transition[1], TerminalFamily), transition[0], transition[2])
+                    ))),
+                    len(signatures)
+                )
+                for state, transitions in enumerate(self.subset_transitions)
+            ]
+            if len(signatures) == len(set(block)):
+                break
+            block = new_block
+
+        # Renumber the blocks in order of their first state (so the initial state is 0), and take each
+        # block's transitions from its first state
+        block_ids: Dict[int, int] = {}
+        representatives: List[int] = []
+        for state in range(num_states):
+            if block[state] not in block_ids:
+                block_ids[block[state]] = len(block_ids)
+                representatives.append(state)
+
+        self.transitions: List[Dict[TerminalT, int]] = [
+            {terminal: block_ids[block[target]] for terminal, target in self.subset_transitions[state].items()}
+            for state in representatives
+        ]
+        self.accepting: List[bool] = [self.subset_accepting[state] for state in representatives]
+
+    def run(self, tokens: Sequence[str]) -> Optional[int]:
+        "Returns the state of the minimal DFA after reading tokens, or None if no sentence starts with them"
+        state = 0
+        for token in tokens:
+            next_state = self.transitions[state].get(token)
+            if next_state is None:
+                # The token may be a member of a terminal family
+                next_state = self.transitions[state].get(self.terminal_classifier.classify(token))  # type: ignore[arg-type]
+                if next_state is None:
+                    return None
+            state = next_state
+
+        return state
+
+    def accepts(self, tokens: Sequence[str]) -> bool:
+        state = self.run(tokens)
+        return state is not None and self.accepting[state]
+
+    def next_tokens(self, prefix: Sequence[str]) -> List[str]:
+        "Returns the tokens that can follow prefix in some sentence, in the order they appear in the grammar"
+        state = self.run(prefix)
+        if state is None:
+            return []
+
+        tokens: Dict[str, None] = {}
+        for terminal in self.transitions[state]:
+            for token in (terminal.members() if isinstance(terminal, TerminalFamily) else [terminal]):
+                tokens.setdefault(token)
+
+        return list(tokens)
+
+    def parse(self, tokens: Sequence[str]) -> ParseResult:
+        if not self.accepts(tokens):
+            return ParseResult(0, None)
+        elif len(tokens) == 0:
+            return ParseResult(1, self.__build_tree([], tokens))
+
+        states = [0]
+        for terminal in self.terminal_classifier.classify_all(tokens):
+            states.append(self.subset_transitions[states[-1]][terminal])  # type: ignore[index]
+
+        if self.unambiguous:
+            return ParseResult(1, self.__build_tree(self.__unique_sequence(states), tokens))
+
+        # Count the ways to reach each position after reading each token. Since the empty derivations
+        # are unique, every sequence of positions corresponds to exactly one parse tree.
+
+        counts: List[Dict[int, int]] = [{position: 1 for position in iterate_bits(self.state_positions[states[1]])}]
+        for state in states[2:]:
+            step_counts: Dict[int, int] = {}
+            for position, count in counts[-1].items():
+                for next_position in iterate_bits(self.follow[position] & self.state_positions[state]):
+                    step_counts[next_position] = min(step_counts.get(next_position, 0) + count, MANY)
+            counts.append(step_counts)
+
+        num_trees = min(
+            sum(count for position, count in counts[-1].items() if self.final_positions >> position & 1), MANY
+        )
+        if num_trees > 1:
+            return ParseResult(num_trees, None)
+
+        # Walk back through the unique sequence of positions
+        final_position, = [position for position in counts[-1] if self.final_positions >> position & 1]
+        sequence = [final_position]
+        for step_counts in reversed(counts[:-1]):
+            previous_position, = [
+                position for position in step_counts if self.follow[position] >> sequence[-1] & 1
+            ]
+            sequence.append(previous_position)
+        sequence.reverse()
+
+        return ParseResult(1, self.__build_tree(sequence, tokens))
+
+    def __unique_sequence(self, states: List[int]) -> List[int]:
+        """
+        Returns the sequence of positions of an accepted sentence, given the subset DFA states it passes
+        through, if the grammar is unambiguous. Every position in a state can be reached by reading the
+        tokens so far, so each final position in the last state (and each of its predecessors in the
+        previous state, and so on) ends a parse tree; in an unambiguous grammar, there is only one.
+        """
+        sequence = [iterate_bits(self.state_positions[states[-1]] & self.final_positions)[0]]
+        for state in reversed(states[1:-1]):
+            sequence.append(next(
+                position for position in iterate_bits(self.state_positions[state])
+                if self.follow[position] >> sequence[-1] & 1
+            ))
+        sequence.reverse()
+
+        return sequence
+
+    def find_ambiguous_sentence(self) -> Optional[List[str]]:
+        """
+        Returns a sentence with more than one parse tree, or None if the grammar is unambiguous. Since
+        every parse tree corresponds to exactly one sequence of positions, the grammar is ambiguous iff
+        two different sequences of positions spell the same sentence, i.e. iff the product of the
+        position automaton with itself has a pair of different positions that can be reached from a
+        pair of start positions and can reach a pair of final positions.
+        """
+        # For each position, the positions that can follow it grouped by their terminal
+        follow_by_terminal: List[Dict[TerminalT, int]] = []
+        for position in range(len(self.positions)):
+            grouped: Dict[TerminalT, int] = {}
+            for next_position in iterate_bits(self.follow[position]):
+                terminal = self.positions[next_position].terminal
+                grouped[terminal] = grouped.get(terminal, 0) | (1 << next_position)
+            follow_by_terminal.append(grouped)
+
+        def pairs(left: int, right: int) -> List[Tuple[int, int]]:
+            "Returns the pairs of a position from left and one from right that have the same terminal"
+            return [
+                (p, q) for p in iterate_bits(left) for q in iterate_bits(right)
+                if self.positions[p].terminal == self.positions[q].terminal
+            ]
+
+        # Breadth-first search from the pairs of start positions, remembering how each pair was reached
+        reached_from: Dict[Tuple[int, int], Optional[Tuple[int, int]]] = {
+            pair: None for pair in pairs(self.start_positions, self.start_positions)
+        }
+        predecessors: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        queue = list(reached_from)
+        for pair in queue:
+            p, q = pair
+            for terminal, p_follow in follow_by_terminal[p].items():
+                q_follow = follow_by_terminal[q].get(terminal, 0)
+                for next_pair in pairs(p_follow, q_follow):
+                    predecessors.setdefault(next_pair, []).append(pair)
+                    if next_pair not in reached_from:
+                        reached_from[next_pair] = pair
+                        queue.append(next_pair)
+
+        # Breadth-first search back from the pairs of final positions, remembering a shortest way to finish
+        finished_by: Dict[Tuple[int, int], Optional[Tuple[int, int]]] = {
+            pair: None for pair in queue if self.final_positions >> pair[0] & 1 and self.final_positions >> pair[1] & 1
+        }
+        backward_queue = list(finished_by)
+        for pair in backward_queue:
+            for previous_pair in predecessors.get(pair, ()):
+                if previous_pair not in finished_by:
+                    finished_by[previous_pair] = pair
+                    backward_queue.append(previous_pair)
+
+        diverged = next((pair for pair in queue if pair[0] != pair[1] and pair in finished_by), None)
+        if diverged is None:
+            return None
+
+        path: List[Tuple[int, int]] = []
+        step: Optional[Tuple[int, int]] = diverged
+        while step is not None:
+            path.append(step)
+            step = reached_from[step]
+        path.reverse()
+        step = finished_by[diverged]
+        while step is not None:
+            path.append(step)
+            step = finished_by[step]
+
+        return [
+            next(terminal.members()) if isinstance(terminal, TerminalFamily) else terminal
+            for terminal in (self.positions[p].terminal for p, _ in path)
+        ]
+
+    def __build_tree(self, sequence: List[int], tokens: Sequence[str]) -> TreeNode:
+        # Every instance that contains a position of the sentence uses the alternative containing that position
+        chosen_alternative: Dict[int, int] = {}
+        for position in sequence:
+            instance_id, alternative = self.positions[position].instance, self.positions[position].alternative
+            while instance_id not in chosen_alternative:
+                chosen_alternative[instance_id] = alternative
+                parent = self.instances[instance_id].parent
+                if parent is None:
+                    break
+                instance_id, alternative = parent
+
+        builder = CompactTreeBuilder(self.symbol_table)
+        # Nodes must be added in preorder, so each entry is a child ("T", position) or ("N", instance)
+        # still to be added to the tree, along with its parent. In preorder, the leaves are the tokens in order.
+        stack: List[Tuple[str, int, int]] = [("N", 0, -1)]
+        num_leaves = 0
+        while stack:
+            kind, child, parent = stack.pop()
+            if kind == "T":
+                builder.add(self.symbol_table.ids[tokens[num_leaves]], parent)
+                num_leaves += 1
+                continue
+
+            node = builder.add(self.instance_symbol_ids[child], parent)
+            alternative = chosen_alternative.get(child, self.empty_alternative[child])
+            assert alternative is not None
+            stack.extend(
+                (grandchild_kind, grandchild, node)
+                for grandchild_kind, grandchild in reversed(self.instances[child].alternatives[alternative])
+            )
+
+        return builder.build()
+
+
+def iterate_bits(bits: int) -> List[int]:
+    "Returns the indices of the set bits, in increasing order"
+    indices = []
+    while bits:
+        lowest = bits & -bits
+        indices.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return indices
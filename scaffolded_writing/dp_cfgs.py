@@ -1,7 +1,6 @@
-from scaffolded_writing.cfg import ScaffoldedWritingCFG
-from scaffolded_writing.dp_utils import concat_into_production_rule
+from scaffolded_writing.dp_utils import DPScaffoldedWritingCFG, concat_into_production_rule
 
-PARTITION_SUM_CFG = ScaffoldedWritingCFG.fromstring(f"""
+PARTITION_SUM_CFG = DPScaffoldedWritingCFG.fromstring(f"""
     START -> "define" FUNCTION_DECLARATION "to be the" FUNCTION_OUTPUT "."
 
     FUNCTION_DECLARATION -> "the subproblem" | {concat_into_production_rule(
@@ -38,7 +37,7 @@ PARTITION_SUM_CFG = ScaffoldedWritingCFG.fromstring(f"""
     EPSILON ->
 """)
 
-GRASSLEARN_CFG =  ScaffoldedWritingCFG.fromstring(f"""
+GRASSLEARN_CFG =  DPScaffoldedWritingCFG.fromstring(f"""
     START -> "define" FUNCTION_DECLARATION "to be the" FUNCTION_OUTPUT "."
 
     FUNCTION_DECLARATION -> "the subproblem" | {concat_into_production_rule(
@@ -78,7 +77,7 @@ GRASSLEARN_CFG =  ScaffoldedWritingCFG.fromstring(f"""
     EPSILON ->
 """)
 
-MAX_PROFIT_CFG = ScaffoldedWritingCFG.fromstring(f"""
+MAX_PROFIT_CFG = DPScaffoldedWritingCFG.fromstring(f"""
     START -> "define" FUNCTION_DECLARATION "to be the" FUNCTION_OUTPUT "."
 
     FUNCTION_DECLARATION -> "the subproblem" | {concat_into_production_rule(
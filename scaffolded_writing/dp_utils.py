@@ -1,54 +1,129 @@
 from abc import abstractmethod
+from dataclasses import dataclass
 import itertools
-from typing import Iterable, List, Optional, Set
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
 import re
 import string
-from nltk.grammar import Nonterminal
 
 from scaffolded_writing.cfg import ScaffoldedWritingCFG
-from scaffolded_writing.constraint_based_grader import Constraint
+from scaffolded_writing.constraint_based_grader import Constraint, Verdict
+from scaffolded_writing.grammar import Nonterminal, Production, TerminalFamily
 from scaffolded_writing.student_submission import StudentSubmission
 
 POTENTIAL_VARIABLE_NAMES = set(string.ascii_lowercase) - {'a'}
 
+def compute_terminal_variables(cfg: ScaffoldedWritingCFG) -> Dict[str, FrozenSet[str]]:
+    "Maps every token that cfg can produce to the one-letter variables that it mentions"
+    terminal_variables: Dict[str, FrozenSet[str]] = {}
+    for terminal in cfg.terminals:
+        for token in (terminal.members() if isinstance(terminal, TerminalFamily) else [terminal]):
+            terminal_variables[token] = frozenset(POTENTIAL_VARIABLE_NAMES.intersection(re.split(r"\W+", token)))
+
+    return terminal_variables
+
+
+class DPScaffoldedWritingCFG(ScaffoldedWritingCFG):
+    """
+    A CFG for subproblem definitions. Every token of a submission is one of the grammar's terminals (or a
+    member of a terminal family), so the variables that each one mentions are found once, when the
+    grammar is loaded, rather than for every token of every submission.
+    """
+    def __init__(self, start: Nonterminal, productions: List[Production], check_ambiguity: bool = True) -> None:
+        super().__init__(start, productions, check_ambiguity)
+        self.terminal_variables = compute_terminal_variables(self)
+
+
+# The terminal variables of plain ScaffoldedWritingCFGs, keyed by fingerprint, computed the first time
+# a DPStudentSubmission uses the grammar
+_TERMINAL_VARIABLES: Dict[str, Dict[str, FrozenSet[str]]] = {}
+
+def get_terminal_variables(cfg: ScaffoldedWritingCFG) -> Dict[str, FrozenSet[str]]:
+    if isinstance(cfg, DPScaffoldedWritingCFG):
+        return cfg.terminal_variables
+
+    if cfg.fingerprint not in _TERMINAL_VARIABLES:
+        _TERMINAL_VARIABLES[cfg.fingerprint] = compute_terminal_variables(cfg)
+    return _TERMINAL_VARIABLES[cfg.fingerprint]
+
+
 class DPStudentSubmission(StudentSubmission):
+    """
+    func_name, func_params, mentioned_variables and the parameters in each field are computed the first
+    time they are used (from the parse tree's label index) and then cached, so submissions that fail an
+    earlier constraint never pay for them. Any ScaffoldedWritingCFG works, but a DPScaffoldedWritingCFG
+    has the variables that each token mentions ready when it is loaded.
+    """
     def __init__(self, token_list: List[str], cfg: ScaffoldedWritingCFG) -> None:
         super().__init__(token_list, cfg)
 
-        self.func_name: Optional[str] = None
-        self.func_params: List[str] = []
-
-        function_declaration_subtree, = self.parse_tree.subtrees(
-            filter=lambda subroot: subroot.label() == "FUNCTION_DECLARATION"
-        )
-        function_declaration, = function_declaration_subtree
-        assert isinstance(function_declaration, str)
+        self._terminal_variables = get_terminal_variables(cfg)
+        self._function_declaration: Optional[Tuple[str, Optional[str], List[str]]] = None
+        self._mentioned_variables: Optional[FrozenSet[str]] = None
+        self._parameters_in_field: Dict[str, FrozenSet[str]] = {}
+
+    def __parse_function_declaration(self) -> Tuple[str, Optional[str], List[str]]:
+        "Returns the FUNCTION_DECLARATION token, along with the function's name and parameters if it declares one"
+        if self._function_declaration is None:
+            function_declaration_subtree, = self.parse_tree_index.subtrees_with_label("FUNCTION_DECLARATION")
+            function_declaration, = function_declaration_subtree
+            assert isinstance(function_declaration, str)
+
+            func_name: Optional[str] = None
+            func_params: List[str] = []
+            # A declaration written as a terminal family of names and parameter lists is split by the family,
+            # and any other declaration by a regex
+            terminal = self.cfg.terminal_classifier.classify(function_declaration)
+            if isinstance(terminal, TerminalFamily) and len(terminal.components()) == 2:
+                func_name, params = terminal.match(function_declaration)  # type: ignore[misc]
+                func_params = params.strip("()").replace(' ', '').split(',')
+            else:
+                match = re.fullmatch(r"(.+)\((.+)\)", function_declaration)
+                if match is not None:
+                    func_name = match.group(1)
+                    func_params = match.group(2).replace(' ', '').split(',')
 
-        match = re.fullmatch(r"(.+)\((.+)\)", function_declaration)
-        if match is not None:
-            self.func_name = match.group(1)
-            self.func_params = match.group(2).replace(' ', '').split(',')
+            self._function_declaration = (function_declaration, func_name, func_params)
 
-        # The set of all one-letter variables which are mentioned in the student's response
-        # outside of the function_declaration.
-        self.mentioned_variables: Set[str] = set.union(*(
-            self.__extract_variables(token) for token in self.token_list if token != function_declaration
-        ))
+        return self._function_declaration
 
-    def get_parameters_in_field(self, field_label: str) -> Set[str]:
-        assert Nonterminal(field_label) in self.cfg.nonterminals
+    @property
+    def func_name(self) -> Optional[str]:
+        return self.__parse_function_declaration()[1]
 
-        subtrees = list(self.parse_tree.subtrees(
-            filter=lambda subroot: subroot.label() == field_label
-        ))
-        if len(subtrees) == 0:
-            return set()
+    @property
+    def func_params(self) -> List[str]:
+        return self.__parse_function_declaration()[2]
 
-        field_subtree, = subtrees
+    @property
+    def mentioned_variables(self) -> FrozenSet[str]:
+        """
+        The set of all one-letter variables which are mentioned in the student's response
+        outside of the function_declaration.
+        """
+        if self._mentioned_variables is None:
+            function_declaration = self.__parse_function_declaration()[0]
+            terminal_variables = self._terminal_variables
+            self._mentioned_variables = frozenset().union(*(
+                terminal_variables[token] for token in self.token_list if token != function_declaration
+            ))
+
+        return self._mentioned_variables
+
+    def get_parameters_in_field(self, field_label: str) -> FrozenSet[str]:
+        assert field_label in self.cfg.nonterminal_ids
+
+        if field_label not in self._parameters_in_field:
+            subtrees = self.parse_tree_index.subtrees_with_label(field_label)
+            if len(subtrees) == 0:
+                self._parameters_in_field[field_label] = frozenset()
+            else:
+                field_subtree, = subtrees
+                terminal_variables = self._terminal_variables
+                self._parameters_in_field[field_label] = frozenset().union(
+                    *[terminal_variables[leaf] for leaf in field_subtree.leaves()]
+                ).intersection(self.func_params)
 
-        return set.union(
-            *[self.__extract_variables(leaf) for leaf in field_subtree.leaves()]
-        ).intersection(self.func_params)
+        return self._parameters_in_field[field_label]
 
     def is_field_value_parameterized(self, field_label: str) -> bool:
         """
@@ -56,10 +131,6 @@ class DPStudentSubmission(StudentSubmission):
         """
         return len(self.get_parameters_in_field(field_label)) > 0
 
-    @staticmethod
-    def __extract_variables(token: str) -> Set[str]:
-        return POTENTIAL_VARIABLE_NAMES.intersection(re.split(r"\W+", token))
-
 
 class DeclareFunctionConstraint(Constraint[DPStudentSubmission]):
     def is_satisfied(self, submission: DPStudentSubmission) -> bool:
@@ -68,22 +139,28 @@ class DeclareFunctionConstraint(Constraint[DPStudentSubmission]):
     def get_feedback(self, submission: DPStudentSubmission) -> str:
         return "Your subproblem definition should declare a function with input parameters that can be memoized."
 
+@dataclass(frozen=True)
+class OutputNounVerdict(Verdict):
+    is_noun_correct: bool
+
 class CorrectOutputNounAndExtremalAdj(Constraint[DPStudentSubmission]):
     def __init__(self, correct_noun: str, correct_adj: str) -> None:
         self.correct_noun = correct_noun
         self.correct_adj = correct_adj
 
-    def is_satisfied(self, submission: DPStudentSubmission) -> bool:
-        self.is_noun_correct = submission.does_path_exist("OUTPUT_NOUN", self.correct_noun)
-        self.is_adj_correct = submission.does_path_exist("EXTREMAL_ADJ", self.correct_adj)
+    def evaluate(self, submission: DPStudentSubmission) -> Verdict:
+        is_noun_correct = submission.does_path_exist("OUTPUT_NOUN", self.correct_noun)
+        is_adj_correct = submission.does_path_exist("EXTREMAL_ADJ", self.correct_adj)
 
-        return self.is_noun_correct and self.is_adj_correct
+        return OutputNounVerdict(is_noun_correct and is_adj_correct, is_noun_correct)
+
+    def explain(self, submission: DPStudentSubmission, verdict: Verdict) -> str:
+        assert isinstance(verdict, OutputNounVerdict)
 
-    def get_feedback(self, submission: DPStudentSubmission) -> str:
         if submission.does_path_exist("OUTPUT_NOUN", "answer"):
             return 'Please be more precise about what quantity the function actually outputs. Just saying "answer" is too vague.'
 
-        if self.is_noun_correct and submission.does_path_exist("EXTREMAL_ADJ", "EPSILON"):
+        if verdict.is_noun_correct and submission.does_path_exist("EXTREMAL_ADJ", "EPSILON"):
             return f'The {self.correct_noun} can vary based on what choices we make. You need to add an adjective in front of "{self.correct_noun}" in order to precisely define the output quantity of the function.'
 
         return "It seems like the quantity outputted by your function is not directly relevant for solving the original problem."
@@ -98,38 +175,57 @@ class DescriptiveFunctionName(Constraint[DPStudentSubmission]):
     def get_feedback(self, submission: DPStudentSubmission) -> str:
         return "Please choose a descriptive function name that accurately represents what the function outputs."
 
+@dataclass(frozen=True)
+class ExplainParamsVerdict(Verdict):
+    unexplained_params: Set[str]
+    undefined_variables: Set[str]
+    mentioned_params_without_explaining: bool
+
 class ExplainParamsConstraint(Constraint[DPStudentSubmission]):
     def __init__(self, *, variables_in_problem: List[str]) -> None:
         self.variables_in_problem = set(variables_in_problem)
 
-    def is_satisfied(self, submission: DPStudentSubmission) -> bool:
-        self.unexplained_params = set(submission.func_params) - submission.mentioned_variables
+    def evaluate(self, submission: DPStudentSubmission) -> Verdict:
+        unexplained_params = set(submission.func_params) - submission.mentioned_variables
 
-        self.undefined_variables = submission.mentioned_variables \
+        undefined_variables = set(submission.mentioned_variables) \
             - set(submission.func_params) - self.variables_in_problem
 
-        self.mentioned_params_without_explaining = submission.does_path_exist("MENTION_PARAMS_WITHOUT_EXPLAINING")
+        mentioned_params_without_explaining = submission.does_path_exist("MENTION_PARAMS_WITHOUT_EXPLAINING")
+
+        return ExplainParamsVerdict(
+            not (unexplained_params or undefined_variables or mentioned_params_without_explaining),
+            unexplained_params,
+            undefined_variables,
+            mentioned_params_without_explaining,
+        )
 
-        return not (self.unexplained_params or self.undefined_variables or self.mentioned_params_without_explaining)
+    def explain(self, submission: DPStudentSubmission, verdict: Verdict) -> str:
+        assert isinstance(verdict, ExplainParamsVerdict)
 
-    def get_feedback(self, submission: DPStudentSubmission) -> str:
-        if self.unexplained_params:
-            if len(self.unexplained_params) == 1:
-                return f"Your function takes {list_to_english(sorted(self.unexplained_params))} as an input parameter, but your subproblem definition does not explain how this parameter affects the output of the function."
+        if verdict.unexplained_params:
+            if len(verdict.unexplained_params) == 1:
+                return f"Your function takes {list_to_english(sorted(verdict.unexplained_params))} as an input parameter, but your subproblem definition does not explain how this parameter affects the output of the function."
             else:
-                return f"Your function takes {list_to_english(sorted(self.unexplained_params))} as input parameters, but your subproblem definition does not explain how these parameters affect the output of the function."
+                return f"Your function takes {list_to_english(sorted(verdict.unexplained_params))} as input parameters, but your subproblem definition does not explain how these parameters affect the output of the function."
 
-        if self.undefined_variables:
-            if len(self.undefined_variables) == 1:
-                return f"Your subproblem definition refers to the variable {list_to_english(sorted(self.undefined_variables))}, which is undefined. You should only refer to variables which are defined in the original problem or declared as input parameters to your function."
+        if verdict.undefined_variables:
+            if len(verdict.undefined_variables) == 1:
+                return f"Your subproblem definition refers to the variable {list_to_english(sorted(verdict.undefined_variables))}, which is undefined. You should only refer to variables which are defined in the original problem or declared as input parameters to your function."
             else:
-                return f"Your subproblem definition refers to the variables {list_to_english(sorted(self.undefined_variables))}, which are undefined. You should only refer to variables which are defined in the original problem or declared as input parameters to your function."
+                return f"Your subproblem definition refers to the variables {list_to_english(sorted(verdict.undefined_variables))}, which are undefined. You should only refer to variables which are defined in the original problem or declared as input parameters to your function."
 
-        if self.mentioned_params_without_explaining:
+        if verdict.mentioned_params_without_explaining:
             return "Your subproblem definition mentions the function's input parameters, but it does not clearly explain how these input parameters affect the output of the function. Can you be more specific about what the function parameters represent in the context of your subproblem?"
 
         raise Exception("This constraint was violated but no feedback was generated.")
 
+@dataclass(frozen=True)
+class DecoupledParametersVerdict(Verdict):
+    overused_param: Optional[str] = None
+    # Descriptions of the two fields that both use overused_param
+    entangled_quantities: Optional[Tuple[str, str]] = None
+
 class DecoupledParametersConstraint(Constraint[DPStudentSubmission]):
     def __init__(self, **independent_fields: str) -> None:
         """
@@ -141,7 +237,7 @@ class DecoupledParametersConstraint(Constraint[DPStudentSubmission]):
         assert len(independent_fields) >= 2
         self.independent_fields = independent_fields
 
-    def is_satisfied(self, submission: DPStudentSubmission) -> bool:
+    def evaluate(self, submission: DPStudentSubmission) -> Verdict:
         for (field1, description1), (field2, description2) in itertools.combinations(
             self.independent_fields.items(), 2
         ):
@@ -149,14 +245,15 @@ class DecoupledParametersConstraint(Constraint[DPStudentSubmission]):
                 submission.get_parameters_in_field(field2))
 
             if intersection:
-                self.overused_param, = intersection
-                self.entangled_quantities = (description1, description2)
-                return False
+                overused_param, = intersection
+                return DecoupledParametersVerdict(False, overused_param, (description1, description2))
 
-        return True
+        return DecoupledParametersVerdict(True)
 
-    def get_feedback(self, submission: DPStudentSubmission) -> str:
-        return f"You used the parameter {self.overused_param} to denote both {self.entangled_quantities[0]} and {self.entangled_quantities[1]}. It doesn't make sense to tie both of these quantities to the same parameter because these quantities can vary independently."
+    def explain(self, submission: DPStudentSubmission, verdict: Verdict) -> str:
+        assert isinstance(verdict, DecoupledParametersVerdict) and verdict.entangled_quantities is not None
+
+        return f"You used the parameter {verdict.overused_param} to denote both {verdict.entangled_quantities[0]} and {verdict.entangled_quantities[1]}. It doesn't make sense to tie both of these quantities to the same parameter because these quantities can vary independently."
 
 class CanComputeFinalAnswer(Constraint[DPStudentSubmission]):
     def __init__(self, required_feature: List[str], feedback_elaboration: str = "") -> None:
@@ -233,8 +330,9 @@ def list_to_english(items: List[str]) -> str:
 
 def concat_into_production_rule(*iterables: Iterable[str]) -> str:
     """
-    concat_into_production_rule([a1, a2, a3], [b1, b2], [c1, c2]) will return:
-    "a1b1c1" | "a1b1c2" | "a1b2c1" | "a1b2c2" | ...
+    concat_into_production_rule([a1, a2, a3], [b1, b2], [c1, c2]) will return a terminal family that
+    matches every concatenation "a1b1c1", "a1b1c2", "a1b2c1", ...:
+    ["a1" | "a2" | "a3"]["b1" | "b2"]["c1" | "c2"]
     """
     def wrap_in_quotes(s: str) -> str:
         if '"' not in s:
@@ -243,5 +341,4 @@ def concat_into_production_rule(*iterables: Iterable[str]) -> str:
             return f"'{s}'"
         raise Exception(f"Cannot wrap {s} in quotes because it already contains single and double quotes.")
 
-    rhs_possibilities = [wrap_in_quotes(''.join(tup)) for tup in itertools.product(*iterables)]
-    return " | ".join(rhs_possibilities)
+    return "".join("[" + " | ".join(wrap_in_quotes(s) for s in iterable) + "]" for iterable in iterables)
@@ -0,0 +1,176 @@
+"""
+Grades every sentence in the (finite) language of a problem's CFG and summarizes the results,
+so that instructors can review all of the scores and feedback a student could possibly receive.
+
+Usage: python -m scaffolded_writing.exhaustive_grading <problem_name> [--processes N] [--output report.json]
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from scaffolded_writing.constraint_based_grader import GradeResult, IncrementalConstraintGrader
+from scaffolded_writing.grader_registry import get_live_grader
+from scaffolded_writing.parallel import bounded_map, chunked
+from scaffolded_writing.student_submission import AmbiguousParseException
+
+class LanguageReport():
+    """
+    Aggregated grading results. Only counts and a bounded number of example sentences are kept,
+    so a report stays small no matter how many sentences were graded. Reports produced by
+    different workers are combined with merge().
+    """
+    def __init__(self, max_examples: int = 5) -> None:
+        self.max_examples = max_examples
+        self.num_sentences = 0
+        self.score_histogram: Counter[float] = Counter()
+        # Feedback strings given to sentences that did not receive full credit
+        self.feedback_counts: Counter[str] = Counter()
+        self.failures_by_constraint: Counter[str] = Counter()
+        self.examples_by_constraint: Dict[str, List[List[str]]] = {}
+        self.num_ambiguous = 0
+        self.ambiguous_examples: List[List[str]] = []
+        self.exception_counts: Counter[str] = Counter()
+        self.exception_examples: Dict[str, List[List[str]]] = {}
+
+    def add_result(self, tokens: Sequence[str], result: GradeResult, failed_constraint_name: Optional[str]) -> None:
+        self.num_sentences += 1
+        self.score_histogram[result.score] += 1
+
+        if result.feedback is not None:
+            self.feedback_counts[result.feedback] += 1
+
+        if failed_constraint_name is not None:
+            self.failures_by_constraint[failed_constraint_name] += 1
+            self.__add_example(self.examples_by_constraint.setdefault(failed_constraint_name, []), tokens)
+
+    def add_ambiguous(self, tokens: Sequence[str]) -> None:
+        self.num_sentences += 1
+        self.num_ambiguous += 1
+        self.__add_example(self.ambiguous_examples, tokens)
+
+    def add_exception(self, tokens: Sequence[str], err: Exception) -> None:
+        self.num_sentences += 1
+        description = f"{type(err).__name__}: {err}"
+        self.exception_counts[description] += 1
+        self.__add_example(self.exception_examples.setdefault(description, []), tokens)
+
+    def merge(self, other: "LanguageReport") -> None:
+        self.num_sentences += other.num_sentences
+        self.score_histogram.update(other.score_histogram)
+        self.feedback_counts.update(other.feedback_counts)
+        self.failures_by_constraint.update(other.failures_by_constraint)
+        self.num_ambiguous += other.num_ambiguous
+        self.exception_counts.update(other.exception_counts)
+
+        for name, examples in other.examples_by_constraint.items():
+            for tokens in examples:
+                self.__add_example(self.examples_by_constraint.setdefault(name, []), tokens)
+
+        for tokens in other.ambiguous_examples:
+            self.__add_example(self.ambiguous_examples, tokens)
+
+        for description, examples in other.exception_examples.items():
+            for tokens in examples:
+                self.__add_example(self.exception_examples.setdefault(description, []), tokens)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "num_sentences": self.num_sentences,
+            "score_histogram": {str(score): count for score, count in sorted(self.score_histogram.items())},
+            "feedback_counts": dict(self.feedback_counts.most_common()),
+            "failures_by_constraint": {
+                name: {"count": count, "examples": self.examples_by_constraint[name]}
+                for name, count in sorted(self.failures_by_constraint.items())
+            },
+            "ambiguous": {"count": self.num_ambiguous, "examples": self.ambiguous_examples},
+            "exceptions": {
+                description: {"count": count, "examples": self.exception_examples[description]}
+                for description, count in self.exception_counts.most_common()
+            },
+        }
+
+    def __add_example(self, examples: List[List[str]], tokens: Sequence[str]) -> None:
+        if len(examples) < self.max_examples:
+            examples.append(list(tokens))
+
+
+def constraint_name(grader: IncrementalConstraintGrader, index: int) -> str:
+    return f"{index}: {type(grader.constraints[index][0]).__name__}"
+
+
+def grade_sentences(grader: IncrementalConstraintGrader, sentences: Sequence[Sequence[str]],
+                    max_examples: int = 5) -> LanguageReport:
+    grader.validate()
+    report = LanguageReport(max_examples)
+
+    for tokens in sentences:
+        try:
+            result = grader.grade_result(list(tokens))
+        except AmbiguousParseException:
+            report.add_ambiguous(tokens)
+        except Exception as err:
+            report.add_exception(tokens, err)
+        else:
+            failed_constraint_name = None
+            if result.failed_constraint is not None:
+                failed_constraint_name = constraint_name(grader, result.failed_constraint)
+            report.add_result(tokens, result, failed_constraint_name)
+
+    return report
+
+
+def _grade_chunk(problem_name: str, max_examples: int, sentences: List[Tuple[str, ...]]) -> LanguageReport:
+    # Each worker process copies the problem's grader once, the first time it grades a chunk
+    return grade_sentences(get_live_grader(problem_name), sentences, max_examples)
+
+
+def grade_language(problem_name: str, *, processes: int = 1, chunk_size: int = 1000,
+                   max_examples: int = 5) -> LanguageReport:
+    """
+    Grades every sentence of the problem's CFG with the problem's registered grader (the same grader
+    that its grade() function uses), always live rather than from its grade table. Sentences are
+    generated lazily and graded in chunks on a pool of worker processes, with a bounded number of
+    chunks in flight.
+    """
+    grader = get_live_grader(problem_name)
+    grader.validate()
+
+    cfg = grader.question_cfg
+    report = LanguageReport(max_examples)
+
+    for partial_report in bounded_map(
+        functools.partial(_grade_chunk, problem_name, max_examples),
+        chunked(cfg.generate_sentences(), chunk_size),
+        processes=processes,
+    ):
+        report.merge(partial_report)
+
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Grade every sentence in a problem's CFG and report the results.")
+    parser.add_argument("problem_name", help="name of a module in problems/, e.g. max_profit")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--max-examples", type=int, default=5, help="example sentences to keep per category")
+    parser.add_argument("--output", help="file to write the JSON report to (defaults to stdout)")
+    args = parser.parse_args(argv)
+
+    report = grade_language(
+        args.problem_name, processes=args.processes, chunk_size=args.chunk_size, max_examples=args.max_examples
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report.to_json(), f, indent=2)
+    else:
+        json.dump(report.to_json(), sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
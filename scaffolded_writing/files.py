@@ -0,0 +1,24 @@
+import os
+from contextlib import contextmanager
+from typing import IO, Any, Iterator
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w") -> Iterator[IO[Any]]:
+    """
+    Opens a temporary file next to path for writing, and replaces path with it once the block exits,
+    so that readers only ever see the old file or the complete new one. The temporary file is fsynced
+    before the rename, so the new file also survives a crash, and it is removed if the block raises.
+    """
+    temporary_path = path + ".tmp"
+    try:
+        with open(temporary_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except FileNotFoundError:
+            pass
+        raise
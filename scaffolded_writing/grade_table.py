@@ -0,0 +1,135 @@
+"""
+Precomputed grade tables. Every problem's language is finite and its grader is deterministic, so
+build_grade_table.py can grade each sentence once, ahead of time, and write the results to a file that
+graders then look results up in instead of grading live.
+
+A table is an open-addressing hash table (with linear probing, at most half full) of fixed-size records,
+keyed by a hash of the sentence's tokens, followed by the distinct feedback strings as a JSON list:
+    header     magic, format version, grader fingerprint, number of slots, number of sentences,
+               offset of the feedback strings
+    slots      (sentence key, score, failed constraint or -1, feedback id or NO_FEEDBACK); empty slots are all zeros
+    feedback   a JSON list of strings, indexed by feedback id
+The file is memory-mapped read-only, so worker processes that load the same table share one copy of it
+through the page cache, and only the slots that are looked up are ever read from disk.
+
+A table is only used if it was built for the grader's current fingerprint (which covers the grammar,
+submission type, constraints, their code and partial credit values); otherwise the grader keeps grading live.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from scaffolded_writing.files import atomic_write
+
+MAGIC = b"SWGT"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sH64sQQQ")
+# Sentence key, score, index of the failed constraint (-1 if none), feedback id
+RECORD = struct.Struct("<16sdiI")
+NO_FEEDBACK = 0xFFFFFFFF
+EMPTY_KEY = bytes(16)
+
+# Where register_grader looks for each problem's table, as <problem name>.sgt
+GRADE_TABLE_DIR = os.environ.get(
+    "SCAFFOLDED_WRITING_GRADE_TABLES", os.path.join(os.path.dirname(os.path.dirname(__file__)), "grade_tables")
+)
+
+# (score, feedback, index of the failed constraint), i.e. the fields of a GradeResult
+RowT = Tuple[float, Optional[str], Optional[int]]
+
+def grade_table_path(problem_name: str) -> str:
+    return os.path.join(GRADE_TABLE_DIR, problem_name + ".sgt")
+
+
+def sentence_key(tokens: Sequence[str]) -> bytes:
+    # JSON encodes the token boundaries unambiguously, so different token lists never share an encoding
+    return hashlib.blake2b(json.dumps(list(tokens), ensure_ascii=False).encode(), digest_size=16).digest()
+
+
+def write_grade_table(path: str, fingerprint: str, rows: Iterable[Tuple[Sequence[str], RowT]]) -> int:
+    """
+    Writes a table of the graded sentences, replacing path atomically so that processes that have the
+    old table mapped keep reading a complete file. Returns the number of sentences written.
+    """
+    feedback_ids: Dict[str, int] = {}
+    records: List[bytes] = []
+    for tokens, (score, feedback, failed_constraint) in rows:
+        feedback_id = NO_FEEDBACK if feedback is None else feedback_ids.setdefault(feedback, len(feedback_ids))
+        records.append(RECORD.pack(
+            sentence_key(tokens), score, -1 if failed_constraint is None else failed_constraint, feedback_id
+        ))
+
+    num_slots = 1
+    while num_slots < 2 * len(records):
+        num_slots *= 2
+
+    slots = bytearray(num_slots * RECORD.size)
+    for record in records:
+        slot = int.from_bytes(record[:8], "little") & (num_slots - 1)
+        while slots[slot * RECORD.size:slot * RECORD.size + 16] != EMPTY_KEY:
+            if slots[slot * RECORD.size:slot * RECORD.size + 16] == record[:16]:
+                raise ValueError("The same sentence was graded more than once")
+            slot = (slot + 1) & (num_slots - 1)
+        slots[slot * RECORD.size:(slot + 1) * RECORD.size] = record
+
+    feedback_offset = HEADER.size + len(slots)
+    with atomic_write(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, fingerprint.encode(), num_slots, len(records), feedback_offset))
+        f.write(slots)
+        f.write(json.dumps(list(feedback_ids)).encode())
+
+    return len(records)
+
+
+class GradeTable():
+    "A memory-mapped grade table. Raises a ValueError if the file is not a grade table of this format version."
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if len(self._map) < HEADER.size:
+                raise ValueError(f"{path} is too short to be a grade table")
+            magic, version, fingerprint, num_slots, num_sentences, feedback_offset = HEADER.unpack_from(self._map)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} grade table")
+            if num_slots & (num_slots - 1) or feedback_offset != HEADER.size + num_slots * RECORD.size:
+                raise ValueError(f"{path} is corrupted")
+            if len(self._map) < feedback_offset:
+                raise ValueError(f"{path} is truncated")
+
+            self.fingerprint: str = fingerprint.decode()
+            self.num_sentences: int = num_sentences
+            self._mask = num_slots - 1
+            self._feedback: List[str] = json.loads(self._map[feedback_offset:])
+        except ValueError:
+            self._map.close()
+            raise
+
+    def __len__(self) -> int:
+        return self.num_sentences
+
+    def get(self, tokens: Sequence[str]) -> Optional[RowT]:
+        "Returns (score, feedback, failed constraint) for tokens, or None if the table does not include them"
+        key = sentence_key(tokens)
+        slot = int.from_bytes(key[:8], "little") & self._mask
+        while True:
+            slot_key, score, failed_constraint, feedback_id = RECORD.unpack_from(
+                self._map, HEADER.size + slot * RECORD.size
+            )
+            if slot_key == key:
+                return (
+                    score,
+                    None if feedback_id == NO_FEEDBACK else self._feedback[feedback_id],
+                    None if failed_constraint == -1 else failed_constraint,
+                )
+            elif slot_key == EMPTY_KEY:
+                return None
+            slot = (slot + 1) & self._mask
+
+    def close(self) -> None:
+        self._map.close()
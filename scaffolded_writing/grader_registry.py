@@ -0,0 +1,59 @@
+import copy
+import importlib
+import os
+from typing import Dict, Tuple
+
+from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader
+from scaffolded_writing.grade_table import grade_table_path
+from scaffolded_writing.submission_log import get_submission_logger
+
+# Maps each problem name (the name of its module in problems/) to the grader that the problem
+# builds once when it is imported. Graders and their constraints are stateless between
+# submissions, so a single instance serves every request.
+GRADERS: Dict[str, IncrementalConstraintGrader] = {}
+
+def register_grader(module_name: str, grader: IncrementalConstraintGrader) -> IncrementalConstraintGrader:
+    """
+    Registers the grader for the problem defined in module_name (e.g. problems.max_profit), which
+    uses the problem's grade table if one has been built, and logs submissions if a submission log
+    is configured
+    """
+    problem_name = module_name.rsplit(".", 1)[-1]
+
+    grader.name = problem_name
+    if os.path.exists(grade_table_path(problem_name)):
+        grader.load_grade_table(grade_table_path(problem_name))
+    grader.submission_logger = get_submission_logger()
+    GRADERS[problem_name] = grader
+
+    return grader
+
+def get_grader(problem_name: str) -> IncrementalConstraintGrader:
+    "Returns the grader for problems/<problem_name>.py, importing the problem module if necessary"
+    if problem_name not in GRADERS:
+        importlib.import_module("problems." + problem_name)
+
+    try:
+        return GRADERS[problem_name]
+    except KeyError:
+        raise KeyError(f"The problem {problem_name} does not register a grader") from None
+
+
+# Maps each problem name to its registered grader and the copy of it that get_live_grader returns
+_live_graders: Dict[str, Tuple[IncrementalConstraintGrader, IncrementalConstraintGrader]] = {}
+
+def get_live_grader(problem_name: str) -> IncrementalConstraintGrader:
+    """
+    Returns a copy of the problem's grader that grades every submission live, without a grade table
+    (which may be out of date) or a submission log, for offline tools such as regrading, exhaustive
+    grading and building grade tables. The registered grader is left untouched, and each process
+    makes its copy once.
+    """
+    grader = get_grader(problem_name)
+    if problem_name not in _live_graders or _live_graders[problem_name][0] is not grader:
+        live_grader = copy.copy(grader)
+        live_grader.grade_table = None
+        live_grader.submission_logger = None
+        _live_graders[problem_name] = (grader, live_grader)
+
+    return _live_graders[problem_name][1]
@@ -0,0 +1,324 @@
+"""
+A minimal model of context-free grammars, with the same interface as the parts of nltk.grammar that
+the grader uses, so that grading does not need to import nltk. See nltk_compat.py for conversions to
+and from nltk's classes.
+"""
+import itertools
+import math
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+class Nonterminal():
+    __slots__ = ("_symbol",)
+
+    def __init__(self, symbol: str) -> None:
+        self._symbol = symbol
+
+    def symbol(self) -> str:
+        return self._symbol
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) == type(other) and self._symbol == other._symbol  # type: ignore[attr-defined]
+
+    def __lt__(self, other: "Nonterminal") -> bool:
+        return self._symbol < other._symbol
+
+    def __hash__(self) -> int:
+        return hash(self._symbol)
+
+    def __repr__(self) -> str:
+        return self._symbol
+
+    def __str__(self) -> str:
+        return self._symbol
+
+
+class TerminalFamily():
+    """
+    A terminal that matches any token formed by concatenating one string from each of its components,
+    e.g. TerminalFamily([["DP", "MaxSum"], ["(i)", "(i,j)"]]) matches "DP(i)", "DP(i,j)", "MaxSum(i)"
+    and "MaxSum(i,j)". A grammar that uses one needs a single production rather than one per token,
+    so its size grows with the total number of strings in the components instead of their product.
+    In a grammar string, it is written as adjacent bracketed alternations: ["DP" | "MaxSum"]["(i)" | "(i,j)"]
+    """
+    __slots__ = ("_components", "_pattern", "_hash")
+
+    def __init__(self, components: Iterable[Iterable[str]]) -> None:
+        self._components = tuple(tuple(component) for component in components)
+        if not self._components or not all(self._components):
+            raise ValueError("A terminal family needs at least one component, and each component at least one string")
+
+        self._pattern = re.compile("".join(
+            "(" + "|".join(re.escape(string) for string in component) + ")" for component in self._components
+        ))
+        self._hash = hash(self._components)
+
+    def components(self) -> Tuple[Tuple[str, ...], ...]:
+        return self._components
+
+    def match(self, token: str) -> Optional[Tuple[str, ...]]:
+        "Returns the string chosen from each component if token is in the family, and None otherwise"
+        match = self._pattern.fullmatch(token)
+        return None if match is None else match.groups()
+
+    def members(self) -> Iterator[str]:
+        "Yields every token in the family, in the order that the components list them"
+        return ("".join(strings) for strings in itertools.product(*self._components))
+
+    def __len__(self) -> int:
+        return math.prod(len(component) for component in self._components)
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) == type(other) and self._components == other._components  # type: ignore[attr-defined]
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __repr__(self) -> str:
+        return "".join("[" + " | ".join(repr(string) for string in component) + "]" for component in self._components)
+
+    def __str__(self) -> str:
+        return repr(self)
+
+
+TerminalT = Union[str, TerminalFamily]
+SymbolT = Union[Nonterminal, TerminalT]
+
+class Production():
+    __slots__ = ("_lhs", "_rhs", "_hash")
+
+    def __init__(self, lhs: Nonterminal, rhs: Iterable[SymbolT]) -> None:
+        self._lhs = lhs
+        self._rhs = tuple(rhs)
+        self._hash = hash((self._lhs, self._rhs))
+
+    def lhs(self) -> Nonterminal:
+        return self._lhs
+
+    def rhs(self) -> Tuple[SymbolT, ...]:
+        return self._rhs
+
+    def __len__(self) -> int:
+        return len(self._rhs)
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) == type(other) and (self._lhs, self._rhs) == (other._lhs, other._rhs)  # type: ignore[attr-defined]
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __str__(self) -> str:
+        # Same format as nltk, since grammar fingerprints are computed from it
+        return f"{self._lhs!r} -> " + " ".join(repr(symbol) for symbol in self._rhs)
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+class CFG():
+    def __init__(self, start: Nonterminal, productions: Iterable[Production]) -> None:
+        self._start = start
+        self._productions = list(productions)
+        self._productions_by_lhs: Dict[Nonterminal, List[Production]] = {}
+        for prod in self._productions:
+            self._productions_by_lhs.setdefault(prod.lhs(), []).append(prod)
+
+    def start(self) -> Nonterminal:
+        return self._start
+
+    def productions(self, lhs: Optional[Nonterminal] = None) -> List[Production]:
+        "Returns every production, or only those whose left-hand side is lhs"
+        if lhs is None:
+            return self._productions
+
+        return self._productions_by_lhs.get(lhs, [])
+
+    @classmethod
+    def fromstring(cls, input: str) -> "CFG":
+        """
+        Reads a grammar in nltk's syntax: one `LHS -> RHS | RHS ...` rule per line, with terminals in
+        single or double quotes, `#` comments, `\\` line continuations and an optional `%start` directive.
+        The start symbol defaults to the left-hand side of the first rule.
+        """
+        start, productions = read_grammar(input)
+        return cls(start, productions)
+
+    def __repr__(self) -> str:
+        return f"<Grammar with {len(self._productions)} productions>"
+
+    def __str__(self) -> str:
+        return "\n".join([f"Grammar with {len(self._productions)} productions (start state = {self._start})"]
+                         + [f"    {prod}" for prod in self._productions])
+
+
+_NONTERMINAL_RE = re.compile(r"( [\w/][\w/^<>-]* ) \s*", re.VERBOSE)
+_TERMINAL_RE = re.compile(r"""( "[^"]+" | '[^']+' ) \s*""", re.VERBOSE)
+_ARROW_RE = re.compile(r"\s* -> \s*", re.VERBOSE)
+_DISJUNCTION_RE = re.compile(r"\| \s*", re.VERBOSE)
+_FAMILY_COMPONENT_RE = re.compile(r"""\[ \s* ( (?: "[^"]+" | '[^']+' ) (?: \s* \| \s* (?: "[^"]+" | '[^']+' ) )* ) \s* \]""", re.VERBOSE)
+_QUOTED_RE = re.compile(r"""( "[^"]+" | '[^']+' )""", re.VERBOSE)
+
+def read_nonterminal(line: str, pos: int) -> Tuple[Nonterminal, int]:
+    match = _NONTERMINAL_RE.match(line, pos)
+    if not match:
+        raise ValueError("Expected a nonterminal, found: " + line[pos:])
+
+    return Nonterminal(match.group(1)), match.end()
+
+
+def read_terminal_family(line: str, pos: int) -> Tuple[TerminalFamily, int]:
+    "Reads a terminal family, i.e. one or more adjacent bracketed alternations of terminals"
+    components: List[List[str]] = []
+    while pos < len(line) and line[pos] == "[":
+        match = _FAMILY_COMPONENT_RE.match(line, pos)
+        if not match:
+            raise ValueError("Expected a bracketed alternation of terminals, found: " + line[pos:])
+        components.append([quoted[1:-1] for quoted in _QUOTED_RE.findall(match.group(1))])
+        pos = match.end()
+
+    while pos < len(line) and line[pos].isspace():
+        pos += 1
+
+    return TerminalFamily(components), pos
+
+
+def read_production(line: str) -> List[Production]:
+    "Reads one rule, returning a production for each alternative on its right-hand side"
+    lhs, pos = read_nonterminal(line, 0)
+
+    match = _ARROW_RE.match(line, pos)
+    if not match:
+        raise ValueError("Expected an arrow")
+    pos = match.end()
+
+    rhs_alternatives: List[List[SymbolT]] = [[]]
+    while pos < len(line):
+        if line[pos] in "'\"":
+            match = _TERMINAL_RE.match(line, pos)
+            if not match:
+                raise ValueError("Unterminated string")
+            rhs_alternatives[-1].append(match.group(1)[1:-1])
+            pos = match.end()
+        elif line[pos] == "[":
+            family, pos = read_terminal_family(line, pos)
+            rhs_alternatives[-1].append(family)
+        elif line[pos] == "|":
+            match = _DISJUNCTION_RE.match(line, pos)
+            assert match is not None
+            rhs_alternatives.append([])
+            pos = match.end()
+        else:
+            nonterminal, pos = read_nonterminal(line, pos)
+            rhs_alternatives[-1].append(nonterminal)
+
+    return [Production(lhs, rhs) for rhs in rhs_alternatives]
+
+
+def read_grammar(input: str) -> Tuple[Nonterminal, List[Production]]:
+    "Returns the start symbol and the productions of a grammar in nltk's syntax"
+    start: Optional[Nonterminal] = None
+    productions: List[Production] = []
+    continued_line = ""
+    for line_number, line in enumerate(input.split("\n")):
+        line = continued_line + line.strip()
+        if line.startswith("#") or line == "":
+            continue
+        if line.endswith("\\"):
+            continued_line = line[:-1].rstrip() + " "
+            continue
+        continued_line = ""
+
+        try:
+            if line[0] == "%":
+                directive, args = line[1:].split(None, 1)
+                if directive != "start":
+                    raise ValueError("Bad directive")
+                start, pos = read_nonterminal(args, 0)
+                if pos != len(args):
+                    raise ValueError("Bad argument to start directive")
+            else:
+                productions += read_production(line)
+        except ValueError as err:
+            raise ValueError(f"Unable to parse line {line_number + 1}: {line}\n{err}") from err
+
+    if not productions:
+        raise ValueError("No productions found!")
+
+    return start or productions[0].lhs(), productions
+
+
+def expand_terminal_families(productions: Iterable[Production]) -> List[Production]:
+    """
+    Replaces each production that contains terminal families with one production per combination of
+    their members, e.g. for clients that only understand plain terminals
+    """
+    expanded: List[Production] = []
+    for prod in productions:
+        choices = [symbol.members() if isinstance(symbol, TerminalFamily) else [symbol] for symbol in prod.rhs()]
+        expanded.extend(Production(prod.lhs(), rhs) for rhs in itertools.product(*choices))
+
+    return expanded
+
+
+class TerminalClassifier():
+    """
+    Finds the terminal of a grammar (a string, or a TerminalFamily) that a token is an instance of. Raises
+    a ValueError if a token could be an instance of more than one terminal, since parsers could not
+    tell which one was meant.
+    """
+    def __init__(self, productions: Iterable[Production]) -> None:
+        terminals: Dict[TerminalT, None] = {
+            symbol: None for prod in productions for symbol in prod.rhs() if not isinstance(symbol, Nonterminal)
+        }
+        self.literals: Set[str] = {terminal for terminal in terminals if isinstance(terminal, str)}
+        self.families: List[TerminalFamily] = [terminal for terminal in terminals if isinstance(terminal, TerminalFamily)]
+
+        matched_by: Dict[str, TerminalT] = {literal: literal for literal in self.literals}
+        for family in self.families:
+            for member in family.members():
+                if member in matched_by:
+                    raise ValueError(f"The token {member!r} matches both {matched_by[member]!r} and {family!r}")
+                matched_by[member] = family
+
+    def classify(self, token: str) -> Optional[TerminalT]:
+        "Returns the terminal that token is an instance of, or None if there is none"
+        if token in self.literals:
+            return token
+
+        for family in self.families:
+            if family.match(token) is not None:
+                return family
+
+        return None
+
+    def classify_all(self, tokens: Sequence[str]) -> List[Optional[TerminalT]]:
+        if not self.families:
+            return list(tokens)
+
+        return [self.classify(token) for token in tokens]
+
+
+class SymbolTable():
+    """
+    Numbers a grammar's symbols in order of first appearance (starting with the start symbol), so the
+    ids are stable across runs. Parse trees store these ids instead of a label per node. The members
+    of each terminal family are numbered too (right after the family), since they are the leaves of
+    parse trees.
+    """
+    def __init__(self, start: Nonterminal, productions: Iterable[Production]) -> None:
+        self.ids: Dict[SymbolT, int] = {start: 0}
+        for prod in productions:
+            for symbol in (prod.lhs(), *prod.rhs()):
+                self.ids.setdefault(symbol, len(self.ids))
+                if isinstance(symbol, TerminalFamily):
+                    for member in symbol.members():
+                        self.ids.setdefault(member, len(self.ids))
+
+        self.symbols: List[SymbolT] = list(self.ids)
+        self.labels: List[str] = [
+            symbol.symbol() if isinstance(symbol, Nonterminal) else str(symbol) for symbol in self.symbols
+        ]
+        self.is_terminal: List[bool] = [not isinstance(symbol, Nonterminal) for symbol in self.symbols]
+
+    def __len__(self) -> int:
+        return len(self.symbols)
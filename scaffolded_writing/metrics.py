@@ -0,0 +1,215 @@
+"""
+Counters and latency histograms for grading, rendered in the Prometheus text format by the /metrics
+route of flask_app.py.
+
+Recording must cost almost nothing, so each thread records into its own shard of the values, without
+taking a lock; the lock is only taken when a thread records for the first time and when the shards are
+collected. Values recorded in other processes (e.g. the workers of a process pool) are not included.
+"""
+import bisect
+import threading
+import weakref
+from typing import Dict, List, Optional, Sequence, Tuple, TypeVar
+
+# Upper bounds (in seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0
+)
+
+# Maps (metric name, label values) to the values recorded for that series: [count] for a counter,
+# and [count, sum, per-bucket counts...] for a histogram
+ShardT = Dict[Tuple[str, Tuple[str, ...]], List[float]]
+
+MetricT = TypeVar("MetricT", bound="Metric")
+
+class MetricsRegistry():
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # The shard of each live thread, and the merged values of threads that have exited
+        self._shards: List[Tuple[weakref.ref, ShardT]] = []
+        self._retired: ShardT = {}
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> "Counter":
+        return self.__register(Counter(self, name, help, tuple(label_names)))
+
+    def histogram(self, name: str, help: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> "Histogram":
+        return self.__register(Histogram(self, name, help, tuple(label_names), tuple(buckets)))
+
+    def __register(self, metric: MetricT) -> MetricT:
+        if metric.name in self.metrics:
+            raise ValueError(f"A metric named {metric.name} is already registered")
+
+        self.metrics[metric.name] = metric
+        return metric
+
+    def shard(self) -> ShardT:
+        "Returns the calling thread's shard, which only that thread writes to"
+        shard: Optional[ShardT] = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self.__retire_dead_shards()
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+
+        return shard
+
+    def __retire_dead_shards(self) -> None:
+        "Merges the shards of threads that have exited into _retired (the lock must be held)"
+        live_shards = []
+        for thread_ref, shard in self._shards:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                live_shards.append((thread_ref, shard))
+            else:
+                merge_shard(self._retired, shard)
+
+        self._shards = live_shards
+
+    def collect(self) -> ShardT:
+        "Returns the sum of every thread's values"
+        with self._lock:
+            self.__retire_dead_shards()
+            total: ShardT = {key: list(values) for key, values in self._retired.items()}
+            for _, shard in self._shards:
+                merge_shard(total, shard)
+
+        return total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._retired.clear()
+            for _, shard in self._shards:
+                shard.clear()
+
+    def render(self) -> str:
+        "Returns every metric in the Prometheus text exposition format"
+        values = self.collect()
+        series_by_metric: Dict[str, List[Tuple[Tuple[str, ...], List[float]]]] = {}
+        for (name, label_values), series_values in sorted(values.items()):
+            series_by_metric.setdefault(name, []).append((label_values, series_values))
+
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for label_values, series_values in series_by_metric.get(metric.name, []):
+                lines.extend(metric.render_series(label_values, series_values))
+
+        return "\n".join(lines) + "\n"
+
+
+def merge_shard(total: ShardT, shard: ShardT) -> None:
+    # list() copies the items, since the shard's own thread may add a series meanwhile
+    for key, values in list(shard.items()):
+        total_values = total.setdefault(key, [0] * len(values))
+        for index, value in enumerate(values):
+            total_values[index] += value
+
+
+def format_labels(label_names: Sequence[str], label_values: Sequence[str], extra: str = "") -> str:
+    labels = [
+        f'{name}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in zip(label_names, label_values)
+    ]
+    if extra:
+        labels.append(extra)
+
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class Metric():
+    type: str
+
+    def __init__(self, registry: MetricsRegistry, name: str, help: str, label_names: Tuple[str, ...]) -> None:
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+
+    def render_series(self, label_values: Tuple[str, ...], values: List[float]) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = [0]
+        values[0] += amount
+
+    def render_series(self, label_values: Tuple[str, ...], values: List[float]) -> List[str]:
+        return [f"{self.name}{format_labels(self.label_names, label_values)} {format_value(values[0])}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, registry: MetricsRegistry, name: str, help: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...]) -> None:
+        super().__init__(registry, name, help, label_names)
+        self.buckets = buckets
+
+    def observe(self, value: float, *label_values: str) -> None:
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        values = shard.get(key)
+        if values is None:
+            # count, sum, then one count per bucket plus one for values above the largest bucket
+            values = shard[key] = [0] * (len(self.buckets) + 3)
+        values[0] += 1
+        values[1] += value
+        values[2 + bisect.bisect_left(self.buckets, value)] += 1
+
+    def render_series(self, label_values: Tuple[str, ...], values: List[float]) -> List[str]:
+        lines = []
+        cumulative_count = 0.0
+        for bound, bucket_count in zip([*map(repr, self.buckets), "+Inf"], values[2:]):
+            cumulative_count += bucket_count
+            labels = format_labels(self.label_names, label_values, f'le="{bound}"')
+            lines.append(f"{self.name}_bucket{labels} {format_value(cumulative_count)}")
+
+        labels = format_labels(self.label_names, label_values)
+        lines.append(f"{self.name}_sum{labels} {repr(float(values[1]))}")
+        lines.append(f"{self.name}_count{labels} {format_value(values[0])}")
+        return lines
+
+
+METRICS = MetricsRegistry()
+
+PARSE_SECONDS = METRICS.histogram(
+    "scaffolded_writing_parse_seconds",
+    "Time to parse a submission and construct its StudentSubmission, including parse cache hits",
+    ["problem"]
+)
+PARSE_ERRORS = METRICS.counter(
+    "scaffolded_writing_parse_errors_total", "Submissions that could not be parsed", ["problem"]
+)
+AMBIGUOUS_PARSES = METRICS.counter(
+    "scaffolded_writing_ambiguous_parses_total", "Submissions with more than one parse tree", ["problem"]
+)
+CONSTRAINT_FAILURES = METRICS.counter(
+    "scaffolded_writing_constraint_failures_total", "Constraint evaluations that were not satisfied",
+    ["problem", "constraint"]
+)
+GRADE_TABLE_HITS = METRICS.counter(
+    "scaffolded_writing_grade_table_hits_total", "Submissions graded by looking them up in a grade table", ["problem"]
+)
+SUBMISSIONS_DROPPED = METRICS.counter(
+    "scaffolded_writing_submissions_dropped_total", "Submissions not logged because the submission log's queue was full",
+    ["problem"]
+)
+# The histogram's _count series is the number of times each constraint was evaluated
+CONSTRAINT_SECONDS = METRICS.histogram(
+    "scaffolded_writing_constraint_seconds", "Time to evaluate a constraint", ["problem", "constraint"]
+)
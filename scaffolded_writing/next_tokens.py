@@ -0,0 +1,175 @@
+"""
+Computes the tokens that can be appended to a partial response, exactly as getPossibleNextTokens
+does in static/scaffolded-writing.js, but incrementally: the parser state for a prefix is cached,
+so extending a prefix by one token only has to process that one token.
+
+The JS function runs a breadth-first search over (stack, remaining input) configurations and
+returns the terminals found on top of the stack once the input is used up, in the order they are
+first found. The BFS visits configurations level by level, and within a level in lexicographic
+order of the sequence of choices (which production was expanded) that led to them. So we can
+reproduce its output by tracking, for every configuration that has consumed the whole prefix,
+its BFS level and its position in that lexicographic order.
+"""
+import html
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from scaffolded_writing.caching import LRUCache
+from scaffolded_writing.cfg import ScaffoldedWritingCFG
+from scaffolded_writing.grammar import Nonterminal, expand_terminal_families
+
+# Marks that the response is complete (the JS enables the submit button when it is a possible next token)
+SENTINEL_TOKEN = '$'
+
+# A symbol is (text, is_terminal), and a stack is an immutable linked list (top symbol, rest of stack)
+JSSymbolT = Tuple[str, bool]
+StackT = Optional[Tuple[JSSymbolT, "StackT"]]  # type: ignore
+
+class Candidate(NamedTuple):
+    "A configuration with a terminal on top of its stack, reached after consuming the whole prefix"
+    level: int
+    rank: int
+    choices: Tuple[int, ...]
+    token: str
+    rest: StackT
+
+
+def find_left_recursion(cfg: ScaffoldedWritingCFG) -> Optional[Nonterminal]:
+    """
+    Returns a nonterminal that is reachable from the start symbol and can derive a string beginning
+    with itself (possibly after nullable symbols), or None if the CFG is not left-recursive.
+    """
+    start = cfg.start()
+    # left_children[A] holds every B such that A -> (nullable symbols) B ... is a production
+    left_children: Dict[Nonterminal, Set[Nonterminal]] = {}
+    for prod in cfg.productions():
+        for symbol in prod.rhs():
+            if not isinstance(symbol, Nonterminal):
+                break
+            left_children.setdefault(prod.lhs(), set()).add(symbol)
+            if symbol not in cfg.nullable:
+                break
+
+    for nonterminal in left_children:
+        if nonterminal != start and not cfg.can_derive(start.symbol(), nonterminal.symbol()):
+            continue
+
+        # Search for a path of left children leading from nonterminal back to itself
+        visited: Set[Nonterminal] = set()
+        stack = list(left_children[nonterminal])
+        while stack:
+            symbol = stack.pop()
+            if symbol == nonterminal:
+                return nonterminal
+            if symbol not in visited:
+                visited.add(symbol)
+                stack.extend(left_children.get(symbol, ()))
+
+    return None
+
+
+class NextTokenParser():
+    def __init__(self, cfg: ScaffoldedWritingCFG, cache_size: int = 4096) -> None:
+        # The BFS in the browser never terminates on left-recursive grammars, and neither would this
+        left_recursive = find_left_recursion(cfg)
+        if left_recursive is not None:
+            raise ValueError(f"Cannot compute next tokens because the CFG is left-recursive in {left_recursive}")
+
+        # Symbols are HTML-escaped the same way as in ScaffoldedWritingCFG.to_json_string, since that
+        # is the form of the grammar (and of the tokens) that the browser works with.
+        self.start: JSSymbolT = (html.escape(cfg.start().symbol()), False)
+        self.productions_by_lhs: Dict[str, List[Tuple[JSSymbolT, ...]]] = {}
+        for prod in expand_terminal_families(cfg.productions()):
+            self.productions_by_lhs.setdefault(html.escape(prod.lhs().symbol()), []).append(tuple(
+                (html.escape(str(symbol)), not isinstance(symbol, Nonterminal)) for symbol in prod.rhs()
+            ))
+
+        # Maps each prefix to its candidates, sorted in the order that the JS BFS would find them
+        self.prefix_states: LRUCache[Tuple[str, ...], List[Candidate]] = LRUCache(maxsize=cache_size)
+
+    def next_tokens(self, prefix: Sequence[str]) -> List[str]:
+        tokens: Dict[str, None] = {}
+        for candidate in self.__candidates(tuple(prefix)):
+            tokens.setdefault(candidate.token)
+
+        return list(tokens)
+
+    def __candidates(self, prefix: Tuple[str, ...]) -> List[Candidate]:
+        # Find the longest prefix whose state is cached (each shorter prefix probed counts as a cache
+        # miss), then extend it one token at a time
+        known_length = len(prefix)
+        candidates = self.prefix_states.get(prefix)
+        while candidates is None and known_length > 0:
+            known_length -= 1
+            candidates = self.prefix_states.get(prefix[:known_length])
+
+        if candidates is None:
+            initial_stack: StackT = ((SENTINEL_TOKEN, True), None)
+            candidates = self.__expand([(0, (self.start, initial_stack))])
+            self.prefix_states.put((), candidates)
+
+        for length in range(known_length + 1, len(prefix) + 1):
+            candidates = self.__advance(candidates, prefix[length - 1])
+            self.prefix_states.put(prefix[:length], candidates)
+
+        return candidates
+
+    def __advance(self, candidates: List[Candidate], token: str) -> List[Candidate]:
+        "Consumes token, returning the candidates for the extended prefix"
+        matches = sorted(
+            (candidate.rank, candidate.choices, candidate.level + 1, candidate.rest)
+            for candidate in candidates if candidate.token == token
+        )
+
+        # Configurations with identical stacks behave identically from now on, so only the one that
+        # the BFS reaches first (lowest level, then lowest position) can contribute anything new.
+        first_position: Dict[StackT, int] = {}
+        for position, (_, _, level, stack) in enumerate(matches):
+            if stack not in first_position or level < matches[first_position[stack]][2]:
+                first_position[stack] = position
+
+        return self.__expand([
+            (level, stack) for position, (_, _, level, stack) in enumerate(matches)
+            if first_position[stack] == position
+        ])
+
+    def __expand(self, frontier: List[Tuple[int, StackT]]) -> List[Candidate]:
+        """
+        frontier lists (BFS level, stack) for each configuration that has just consumed the prefix,
+        in lexicographic order of the choices that led to them. Expands nonterminals until a terminal
+        is on top of each stack, and returns the resulting candidates in BFS order.
+        """
+        candidates: List[Candidate] = []
+
+        for rank, (level, stack) in enumerate(frontier):
+            queue: Deque[Tuple[int, Tuple[int, ...], StackT]] = deque([(level, (), stack)])
+            while queue:
+                current_level, choices, current_stack = queue.popleft()
+                if current_stack is None:
+                    continue
+
+                (text, is_terminal), rest = current_stack
+                if is_terminal:
+                    candidates.append(Candidate(current_level, rank, choices, text, rest))
+                    continue
+
+                for choice, rhs in enumerate(self.productions_by_lhs.get(text, ())):
+                    new_stack = rest
+                    for symbol in reversed(rhs):
+                        new_stack = (symbol, new_stack)
+                    queue.append((current_level + 1, choices + (choice,), new_stack))
+
+        candidates.sort(key=lambda candidate: (candidate.level, candidate.rank, candidate.choices))
+        return candidates
+
+
+# One parser (with its own cache of prefix states) per CFG fingerprint
+NEXT_TOKEN_PARSERS: LRUCache[str, NextTokenParser] = LRUCache(maxsize=64)
+
+def get_possible_next_tokens(cfg: ScaffoldedWritingCFG, prefix: Sequence[str]) -> List[str]:
+    """
+    Returns the same tokens, in the same order, as getPossibleNextTokens(prefix, cfg) in the browser,
+    including SENTINEL_TOKEN if the prefix is a complete response.
+    """
+    parser = NEXT_TOKEN_PARSERS.get_or_compute(cfg.fingerprint, lambda: NextTokenParser(cfg))
+    return parser.next_tokens(prefix)
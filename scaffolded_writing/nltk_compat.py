@@ -0,0 +1,76 @@
+"""
+Conversions between the grader's grammars and parse trees and nltk's, for anyone who wants to use
+nltk's tools (e.g. its parsers or tree drawing) on them. This is the only module that needs nltk,
+which is an optional dependency: `pip install nltk`.
+"""
+from typing import Union
+
+try:
+    import nltk.grammar
+    import nltk.tree
+except ImportError as err:
+    raise ImportError("scaffolded_writing.nltk_compat requires nltk, which is not installed") from err
+
+from scaffolded_writing.grammar import CFG, Nonterminal, Production, SymbolT, expand_terminal_families
+from scaffolded_writing.tree import Tree, TreeNode
+
+def _to_nltk_symbol(symbol: SymbolT) -> Union[nltk.grammar.Nonterminal, str]:
+    return nltk.grammar.Nonterminal(symbol.symbol()) if isinstance(symbol, Nonterminal) else symbol
+
+
+def _from_nltk_symbol(symbol: Union[nltk.grammar.Nonterminal, str]) -> SymbolT:
+    return Nonterminal(symbol.symbol()) if isinstance(symbol, nltk.grammar.Nonterminal) else symbol
+
+
+def to_nltk_grammar(cfg: CFG) -> nltk.grammar.CFG:
+    "Converts cfg into an nltk grammar, with one production per member of each terminal family"
+    return nltk.grammar.CFG(
+        _to_nltk_symbol(cfg.start()),
+        [
+            nltk.grammar.Production(_to_nltk_symbol(prod.lhs()), [_to_nltk_symbol(symbol) for symbol in prod.rhs()])
+            for prod in expand_terminal_families(cfg.productions())
+        ]
+    )
+
+
+def from_nltk_grammar(nltk_cfg: nltk.grammar.CFG, cfg_type: type = CFG) -> CFG:
+    "Converts an nltk grammar into cfg_type, which can be ScaffoldedWritingCFG"
+    return cfg_type(
+        _from_nltk_symbol(nltk_cfg.start()),
+        [
+            Production(_from_nltk_symbol(prod.lhs()), [_from_nltk_symbol(symbol) for symbol in prod.rhs()])
+            for prod in nltk_cfg.productions()
+        ]
+    )
+
+
+def to_nltk_tree(tree: Union[Tree, TreeNode]) -> nltk.tree.Tree:
+    root = nltk.tree.Tree(tree.label(), [])
+    stack = [(tree, root)]
+    while stack:
+        node, nltk_node = stack.pop()
+        for child in node:
+            if not isinstance(child, str):
+                nltk_child = nltk.tree.Tree(child.label(), [])
+                stack.append((child, nltk_child))
+                nltk_node.append(nltk_child)
+            else:
+                nltk_node.append(child)
+
+    return root
+
+
+def from_nltk_tree(nltk_tree: nltk.tree.Tree) -> Tree:
+    root = Tree(nltk_tree.label())
+    stack = [(nltk_tree, root)]
+    while stack:
+        nltk_node, node = stack.pop()
+        for nltk_child in nltk_node:
+            if isinstance(nltk_child, nltk.tree.Tree):
+                child = Tree(nltk_child.label())
+                stack.append((nltk_child, child))
+                node.append(child)
+            else:
+                node.append(nltk_child)
+
+    return root
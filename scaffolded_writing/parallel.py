@@ -0,0 +1,66 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
+from itertools import islice
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Set, Tuple, TypeVar
+
+ItemT = TypeVar('ItemT')
+ResultT = TypeVar('ResultT')
+
+def _do_nothing(*args: Any) -> None:
+    pass
+
+
+def chunked(items: Iterable[ItemT], chunk_size: int) -> Iterator[List[ItemT]]:
+    "Lazily splits items into lists of length chunk_size (the last one may be shorter)"
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bounded_map(
+    fn: Callable[[ItemT], ResultT],
+    items: Iterable[ItemT],
+    *,
+    processes: int,
+    max_pending: int = 0,
+    ordered: bool = False,
+    initializer: Callable[..., None] = _do_nothing,
+    initargs: Tuple[Any, ...] = (),
+) -> Iterator[ResultT]:
+    """
+    Applies fn to every item on a pool of worker processes. Unlike Pool.imap, at most max_pending
+    items (2 * processes by default) are submitted at a time, and items are pulled from the input
+    only as results are consumed, so memory stays flat no matter how long the input is.
+    Results are yielded in input order if ordered is True, and in completion order otherwise.
+    With processes <= 1, everything runs in the current process.
+    """
+    if processes <= 1:
+        initializer(*initargs)
+        yield from map(fn, items)
+        return
+
+    max_pending = max_pending or 2 * processes
+    with ProcessPoolExecutor(processes, initializer=initializer, initargs=initargs) as executor:
+        if ordered:
+            queue: Deque[Future] = deque()
+            for item in items:
+                if len(queue) >= max_pending:
+                    yield queue.popleft().result()
+                queue.append(executor.submit(fn, item))
+
+            while queue:
+                yield queue.popleft().result()
+        else:
+            pending: Set[Future] = set()
+            for item in items:
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                pending.add(executor.submit(fn, item))
+
+            for future in as_completed(pending):
+                yield future.result()
@@ -0,0 +1,362 @@
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+from scaffolded_writing.grammar import (
+    CFG, Nonterminal, Production, SymbolTable, TerminalClassifier, TerminalFamily, TerminalT
+)
+from scaffolded_writing.tree import CompactTreeBuilder, TreeNode
+
+# An Earley item is (production index, dot position, origin)
+ItemT = Tuple[int, int, int]
+# A node of the packed forest is a nonterminal together with the span of tokens that it derives
+SpanT = Tuple[Nonterminal, int, int]
+# A sequence is (production index, dot position, start, end): the symbols after the dot deriving tokens[start:end]
+SequenceT = Tuple[int, int, int, int]
+
+# Tree counts are capped at this value, since we only ever need to distinguish 0, 1, and "more than 1"
+MANY = 2
+
+class AmbiguousParseException(Exception):
+    """
+    Raised if the CFG is ambiguous and there are multiple ways to parse the student submission.
+    """
+    pass
+
+class ParseResult(NamedTuple):
+    "The outcome of parsing a token list. tree is only set if there is exactly one parse tree."
+    num_trees: int
+    tree: Optional[TreeNode]
+
+class ParseForest():
+    """
+    A shared packed parse forest. Every (nonterminal, start, end) span is stored once, along with
+    the productions that can derive it, so the number of parse trees can be counted (and a single
+    tree can be extracted) in polynomial time, even if there are exponentially many trees.
+    """
+    def __init__(self, tokens: Sequence[str], terminals: Sequence[Optional[TerminalT]], productions: List[Production],
+                 start: Nonterminal, symbol_table: SymbolTable, completed: Dict[SpanT, Set[int]]) -> None:
+        self.tokens = tokens
+        # The grammar's terminal that each token is an instance of
+        self.terminals = terminals
+        self.productions = productions
+        self.start = start
+        self.symbol_table = symbol_table
+        self.completed = completed
+
+        # Maps (nonterminal, start) to the list of ends of the completed spans
+        self.span_ends: Dict[Tuple[Nonterminal, int], List[int]] = {}
+        for (lhs, i, j) in completed:
+            self.span_ends.setdefault((lhs, i), []).append(j)
+
+        self._node_counts: Dict[SpanT, int] = {}
+        self._sequence_counts: Dict[SequenceT, int] = {}
+
+    def count_trees(self) -> int:
+        """
+        Returns the number of parse trees for the whole input, capped at MANY.
+        """
+        return self._count((self.start, 0, len(self.tokens)))
+
+    def tree(self) -> TreeNode:
+        """
+        Returns the unique parse tree, raising an AmbiguousParseException if there is more than one. Only
+        the spans on the tree's path are counted, so this is faster than count_trees().
+        """
+        builder = CompactTreeBuilder(self.symbol_table)
+        ids = self.symbol_table.ids
+        # Nodes must be added in preorder, so each entry is a symbol still to be added to the tree, along
+        # with its parent and (for a nonterminal) its span
+        stack: List[Tuple[int, int, Optional[SpanT]]] = [(ids[self.start], -1, (self.start, 0, len(self.tokens)))]
+        while stack:
+            symbol_id, parent, span = stack.pop()
+            node = builder.add(symbol_id, parent)
+            if span is None:
+                continue
+
+            lhs, i, j = span
+            prod_indices = [p for p in self.completed[span] if self._count((p, 0, i, j)) > 0]
+            if len(prod_indices) > 1:
+                raise AmbiguousParseException
+            prod_index = prod_indices[0]
+
+            children: List[Tuple[int, int, Optional[SpanT]]] = []
+            position = i
+            for dot, symbol in enumerate(self.productions[prod_index].rhs()):
+                if not isinstance(symbol, Nonterminal):
+                    children.append((ids[self.tokens[position]], node, None))
+                    position += 1
+                    continue
+
+                split_points = [
+                    m for m in self.span_ends.get((symbol, position), ())
+                    if m <= j and self._count((symbol, position, m)) * self._count((prod_index, dot + 1, m, j)) > 0
+                ]
+                if len(split_points) > 1:
+                    raise AmbiguousParseException
+                m = split_points[0]
+                children.append((ids[symbol], node, (symbol, position, m)))
+                position = m
+            stack.extend(reversed(children))
+
+        return builder.build()
+
+    def _count(self, root: Union[SpanT, SequenceT]) -> int:
+        """
+        Returns the number of trees for a span (nonterminal, i, j), or the number of ways that the
+        symbols after the dot in a production can derive tokens[i:j] for a sequence
+        (production index, dot, i, j), capped at MANY. The forest can be as deep as the input is
+        long, so this uses an explicit stack rather than recursion.
+        """
+        # Each entry is a key along with whether its dependencies have already been pushed
+        stack: List[Tuple[Union[SpanT, SequenceT], bool]] = [(root, False)]
+        while stack:
+            key, expanded = stack.pop()
+            if expanded:
+                self._combine(key)
+                continue
+
+            if key in self._node_counts or key in self._sequence_counts:
+                continue
+
+            if len(key) == 3:
+                # If we reach this span again while still counting it, the grammar has a cycle
+                # (e.g. A -> A), so there are infinitely many trees.
+                self._node_counts[key] = MANY  # type: ignore
+
+            stack.append((key, True))
+            stack.extend((dependency, False) for dependency in self._dependencies(key))
+
+        if len(root) == 3:
+            return self._node_counts[root]  # type: ignore
+        return self._sequence_counts[root]  # type: ignore
+
+    def _dependencies(self, key: Union[SpanT, SequenceT]) -> List[Union[SpanT, SequenceT]]:
+        if len(key) == 3:
+            lhs, i, j = key  # type: ignore
+            return [(prod_index, 0, i, j) for prod_index in self.completed.get(key, ())]  # type: ignore
+
+        prod_index, dot, i, j = key  # type: ignore
+        rhs = self.productions[prod_index].rhs()
+        if dot == len(rhs):
+            return []
+        elif isinstance(rhs[dot], Nonterminal):
+            dependencies: List[Union[SpanT, SequenceT]] = []
+            for m in self.span_ends.get((rhs[dot], i), ()):
+                if m <= j:
+                    dependencies.append((rhs[dot], i, m))
+                    dependencies.append((prod_index, dot + 1, m, j))
+            return dependencies
+        elif i < j and self.terminals[i] == rhs[dot]:
+            return [(prod_index, dot + 1, i + 1, j)]
+        else:
+            return []
+
+    def _combine(self, key: Union[SpanT, SequenceT]) -> None:
+        "Computes the count for key, once the counts of all of its dependencies are known"
+        if len(key) == 3:
+            lhs, i, j = key  # type: ignore
+            count = sum(
+                self._sequence_counts[(prod_index, 0, i, j)] for prod_index in self.completed.get(key, ())  # type: ignore
+            )
+            self._node_counts[key] = min(count, MANY)  # type: ignore
+            return
+
+        prod_index, dot, i, j = key  # type: ignore
+        rhs = self.productions[prod_index].rhs()
+        if dot == len(rhs):
+            count = 1 if i == j else 0
+        elif isinstance(rhs[dot], Nonterminal):
+            count = 0
+            for m in self.span_ends.get((rhs[dot], i), ()):
+                if m <= j:
+                    count += self._node_counts[(rhs[dot], i, m)] * self._sequence_counts[(prod_index, dot + 1, m, j)]
+        elif i < j and self.terminals[i] == rhs[dot]:
+            count = self._sequence_counts[(prod_index, dot + 1, i + 1, j)]
+        else:
+            count = 0
+
+        self._sequence_counts[key] = min(count, MANY)  # type: ignore
+
+
+class EarleyParser():
+    """
+    An Earley parser (with the Aycock-Horspool fix for epsilon productions) that runs in
+    polynomial time on any CFG, including left-recursive and ambiguous ones.
+    """
+    def __init__(self, cfg: CFG) -> None:
+        self.start = cfg.start()
+        self.productions: List[Production] = list(cfg.productions())
+        self.symbol_table = SymbolTable(self.start, self.productions)
+        self.terminal_classifier = TerminalClassifier(self.productions)
+
+        self.productions_by_lhs: Dict[Nonterminal, List[int]] = {}
+        for index, prod in enumerate(self.productions):
+            self.productions_by_lhs.setdefault(prod.lhs(), []).append(index)
+
+        self.nullable = compute_nullable(self.productions)
+        # If set, the trees of a sentence are never counted, and tree() raises an AmbiguousParseException
+        # if a sentence has more than one. ScaffoldedWritingCFG leaves it unset, since its ambiguity check
+        # for grammars that need an Earley parser only covers short sentences.
+        self.unambiguous = False
+
+    def parse(self, tokens: Sequence[str]) -> ParseResult:
+        forest = self.parse_forest(tokens)
+        if forest is None:
+            return ParseResult(0, None)
+        elif self.unambiguous:
+            return ParseResult(1, forest.tree())
+
+        num_trees = forest.count_trees()
+        return ParseResult(num_trees, forest.tree() if num_trees == 1 else None)
+
+    def parse_forest(self, tokens: Sequence[str]) -> Optional[ParseForest]:
+        """
+        Returns the parse forest for tokens, or None if tokens cannot be derived from the start symbol.
+        """
+        n = len(tokens)
+        terminals = self.terminal_classifier.classify_all(tokens)
+        chart: List[Set[ItemT]] = [set() for _ in range(n + 1)]
+        agenda: List[List[ItemT]] = [[] for _ in range(n + 1)]
+        # waiting[i][X] lists the items in chart[i] whose dot is right before the nonterminal X
+        waiting: List[Dict[Nonterminal, List[ItemT]]] = [{} for _ in range(n + 1)]
+        completed: Dict[SpanT, Set[int]] = {}
+
+        def add(i: int, item: ItemT) -> None:
+            if item not in chart[i]:
+                chart[i].add(item)
+                agenda[i].append(item)
+
+        for prod_index in self.productions_by_lhs.get(self.start, ()):
+            add(0, (prod_index, 0, 0))
+
+        for i in range(n + 1):
+            while agenda[i]:
+                prod_index, dot, origin = item = agenda[i].pop()
+                prod = self.productions[prod_index]
+                rhs = prod.rhs()
+
+                if dot == len(rhs):
+                    completed.setdefault((prod.lhs(), origin, i), set()).add(prod_index)
+                    for (waiting_index, waiting_dot, waiting_origin) in waiting[origin].get(prod.lhs(), ()):
+                        add(i, (waiting_index, waiting_dot + 1, waiting_origin))
+                elif isinstance(rhs[dot], Nonterminal):
+                    waiting[i].setdefault(rhs[dot], []).append(item)
+                    for predicted_index in self.productions_by_lhs.get(rhs[dot], ()):
+                        add(i, (predicted_index, 0, i))
+                    if rhs[dot] in self.nullable:
+                        add(i, (prod_index, dot + 1, origin))
+                elif i < n and terminals[i] == rhs[dot]:
+                    add(i + 1, (prod_index, dot + 1, origin))
+
+        if (self.start, 0, n) not in completed:
+            return None
+
+        return ParseForest(tokens, terminals, self.productions, self.start, self.symbol_table, completed)
+
+
+class LL1Parser():
+    """
+    A table-driven predictive parser that parses in a single left-to-right pass without backtracking.
+    It can only be used with grammars whose LL(1) table has no conflicts, and such grammars are
+    never ambiguous, so it always finds either zero or one parse trees.
+    """
+    def __init__(self, start: Nonterminal, productions: List[Production],
+                 table: Dict[Nonterminal, Dict[Optional[TerminalT], int]]) -> None:
+        self.start = start
+        self.productions = productions
+        self.table = table
+        self.symbol_table = SymbolTable(start, productions)
+        self.terminal_classifier = TerminalClassifier(productions)
+        # Grammars without LL(1) conflicts are always unambiguous
+        self.unambiguous = True
+
+    def parse(self, tokens: Sequence[str]) -> ParseResult:
+        position = 0
+        terminals = self.terminal_classifier.classify_all(tokens)
+        if None in terminals:
+            # None is also the lookahead at the end of the input
+            return ParseResult(0, None)
+
+        builder = CompactTreeBuilder(self.symbol_table)
+        # Each stack entry is a symbol that still needs to be matched, along with the node it belongs under
+        stack: List[Tuple[Union[Nonterminal, TerminalT], int]] = [(self.start, -1)]
+
+        while stack:
+            symbol, parent = stack.pop()
+            lookahead = terminals[position] if position < len(tokens) else None
+
+            if isinstance(symbol, Nonterminal):
+                prod_index = self.table[symbol].get(lookahead)
+                if prod_index is None:
+                    return ParseResult(0, None)
+
+                node = builder.add(self.symbol_table.ids[symbol], parent)
+                stack.extend((child, node) for child in reversed(self.productions[prod_index].rhs()))
+            elif symbol == lookahead:
+                builder.add(self.symbol_table.ids[tokens[position]], parent)
+                position += 1
+            else:
+                return ParseResult(0, None)
+
+        if position != len(tokens):
+            return ParseResult(0, None)
+
+        return ParseResult(1, builder.build())
+
+
+def compute_nullable(productions: List[Production]) -> Set[Nonterminal]:
+    "Returns the set of nonterminals that can derive the empty string"
+    nullable: Set[Nonterminal] = set()
+    changed = True
+    while changed:
+        changed = False
+        for prod in productions:
+            if prod.lhs() not in nullable and all(symbol in nullable for symbol in prod.rhs()):
+                nullable.add(prod.lhs())
+                changed = True
+
+    return nullable
+
+
+def find_ambiguous_sentence(cfg: CFG, max_length: int = 12, max_derivations: int = 100_000) -> Optional[List[str]]:
+    """
+    Searches for a sentence with more than one parse tree, returning it if one is found. Every parse tree
+    corresponds to exactly one leftmost derivation, so this enumerates the leftmost derivations of
+    sentences with at most max_length tokens (breadth first) until one sentence is derived twice. The
+    search gives up after max_derivations steps, so a grammar that passes is only known to be
+    unambiguous on the sentences that were reached.
+    """
+    nullable = compute_nullable(list(cfg.productions()))
+
+    def min_length(symbols: Sequence[Union[Nonterminal, TerminalT]]) -> int:
+        "A lower bound on the number of tokens that symbols derive"
+        return sum(1 for symbol in symbols if symbol not in nullable)
+
+    sentences: Set[Tuple[TerminalT, ...]] = set()
+    # Each sentential form is (the terminals before its leftmost nonterminal, the symbols from there on)
+    forms: Deque[Tuple[Tuple[TerminalT, ...], Tuple[Union[Nonterminal, TerminalT], ...]]] = deque([((), (cfg.start(),))])
+    for _ in range(max_derivations):
+        if not forms:
+            break
+
+        prefix, rest = forms.popleft()
+        leading_terminals = 0
+        while leading_terminals < len(rest) and not isinstance(rest[leading_terminals], Nonterminal):
+            leading_terminals += 1
+        prefix, rest = prefix + rest[:leading_terminals], rest[leading_terminals:]  # type: ignore[operator]
+
+        if not rest:
+            if prefix in sentences:
+                return [
+                    next(terminal.members()) if isinstance(terminal, TerminalFamily) else terminal
+                    for terminal in prefix
+                ]
+            sentences.add(prefix)
+            continue
+
+        for prod in cfg.productions(lhs=rest[0]):  # type: ignore[arg-type]
+            expanded = prod.rhs() + rest[1:]
+            if len(prefix) + min_length(expanded) <= max_length:
+                forms.append((prefix, expanded))
+
+    return None
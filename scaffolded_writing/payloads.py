@@ -0,0 +1,87 @@
+"""
+Response bodies that are built once and served many times (e.g. a CFG's JSON), stored along with
+their compressed variants and a strong ETag for each, so that serving them does no work beyond
+choosing a variant.
+"""
+import gzip
+import hashlib
+import zlib
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings in order of preference, when the client accepts more than one equally
+PREFERRED_ENCODINGS = ["br", "gzip", "deflate", "identity"]
+
+class Variant(NamedTuple):
+    encoding: str
+    body: bytes
+    # Unquoted
+    etag: str
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    "Maps each content coding in an Accept-Encoding header to its quality value"
+    qualities: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+
+    return qualities
+
+
+class CompressedPayload():
+    def __init__(self, body: bytes, content_type: str = "application/json") -> None:
+        self.content_type = content_type
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+        bodies = {
+            "identity": body,
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+            "deflate": zlib.compress(body, 9),
+        }
+        if brotli is not None:
+            bodies["br"] = brotli.compress(body)
+
+        # Each encoding is a different representation, so each needs its own strong ETag
+        self.variants: Dict[str, Variant] = {
+            encoding: Variant(encoding, encoded, digest if encoding == "identity" else f"{digest}-{encoding}")
+            for encoding, encoded in bodies.items()
+        }
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Variant:
+        "Returns the smallest variant that the client accepts, based on its Accept-Encoding header"
+        qualities = parse_accept_encoding(accept_encoding)
+        default_quality = qualities.get("*", 0.0)
+
+        candidates: List[Variant] = []
+        for encoding in PREFERRED_ENCODINGS:
+            if encoding not in self.variants:
+                continue
+
+            # identity is acceptable unless it is explicitly refused
+            if encoding == "identity":
+                quality = qualities.get("identity", default_quality if "*" in qualities else 1.0)
+            else:
+                quality = qualities.get(encoding, default_quality)
+            if quality > 0:
+                candidates.append(self.variants[encoding])
+
+        if not candidates:
+            return self.variants["identity"]
+
+        return min(candidates, key=lambda variant: len(variant.body))
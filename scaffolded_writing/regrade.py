@@ -0,0 +1,156 @@
+"""
+Regrades a dump of historical submissions, e.g. after a constraint is fixed.
+
+The input is a JSONL file with one {"problem": ..., "tokens": [...], ...} record per line. Each output
+line is the input record with the grading outcome added: "score", "feedback" and "failed_constraint"
+(the index of the first unsatisfied constraint), or "format_error" if the tokens could not be parsed,
+or "error" if the record could not be graded at all. Output lines are written in input order.
+
+Records are read lazily and graded in chunks on a pool of worker processes, with a bounded number of
+chunks in flight, so memory use does not depend on the size of the input. After each chunk is written,
+the number of input bytes consumed and output bytes written are saved to a checkpoint file, so an
+interrupted run picks up where it stopped when it is started again with the same arguments.
+
+Usage: python -m scaffolded_writing.regrade submissions.jsonl results.jsonl [--processes N]
+"""
+import argparse
+import json
+import os
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from scaffolded_writing.files import atomic_write
+from scaffolded_writing.grader_registry import get_live_grader
+from scaffolded_writing.parallel import bounded_map
+
+class Checkpoint(NamedTuple):
+    input_path: str
+    # Number of input records (non-blank lines) that have been graded and written
+    num_records: int
+    input_offset: int
+    output_offset: int
+
+    def save(self, path: str) -> None:
+        "Atomically replaces the checkpoint file, so that it is never left half-written"
+        with atomic_write(path) as f:
+            json.dump(self._asdict(), f)
+
+    @staticmethod
+    def load(path: str) -> Optional["Checkpoint"]:
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            return Checkpoint(**json.load(f))
+
+
+def regrade_record(record: Any) -> Dict[str, Any]:
+    if not isinstance(record, dict) or not isinstance(record.get("problem"), str) \
+            or not isinstance(record.get("tokens"), list):
+        return {"record": record, "error": 'Expected an object with a "problem" string and a "tokens" list'}
+
+    try:
+        # Graders are registered when their problem module is first imported, so each worker process
+        # loads every problem's grader at most once. Regrading must not reuse the grades in a grade
+        # table, which may have been built before the fix that prompted the regrade.
+        grader = get_live_grader(record["problem"])
+    except (ImportError, KeyError) as err:
+        return {**record, "error": f"Unknown problem: {err}"}
+
+    try:
+        result = grader.grade_result(record["tokens"])
+    except ValueError as err:
+        return {**record, "format_error": str(err)}
+    except Exception as err:
+        return {**record, "error": f"{type(err).__name__}: {err}"}
+
+    return {**record, "score": result.score, "feedback": result.feedback, "failed_constraint": result.failed_constraint}
+
+
+def _regrade_chunk(chunk: Tuple[int, List[bytes]]) -> Tuple[int, int, bytes]:
+    """
+    Takes (input offset after the chunk, input lines) and returns
+    (input offset after the chunk, number of records, output lines)
+    """
+    input_offset, lines = chunk
+    output = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError as err:
+            result: Dict[str, Any] = {"line": line.decode(errors="replace").rstrip("\n"), "error": f"Invalid JSON: {err}"}
+        else:
+            result = regrade_record(record)
+        output.append(json.dumps(result) + "\n")
+
+    return input_offset, len(lines), "".join(output).encode()
+
+
+def read_chunks(input_file: BinaryIO, chunk_size: int) -> Iterator[Tuple[int, List[bytes]]]:
+    "Lazily yields (input offset after the chunk, non-blank lines) for chunks of up to chunk_size lines"
+    lines: List[bytes] = []
+    for line in iter(input_file.readline, b""):
+        if line.strip():
+            lines.append(line)
+        if len(lines) == chunk_size:
+            yield input_file.tell(), lines
+            lines = []
+
+    if lines:
+        yield input_file.tell(), lines
+
+
+def regrade(input_path: str, output_path: str, *, checkpoint_path: Optional[str] = None, processes: int = 1,
+            chunk_size: int = 500) -> int:
+    """
+    Regrades every record in input_path, writing the results to output_path and resuming from the
+    checkpoint if there is one. Returns the total number of records graded.
+    """
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+    checkpoint = Checkpoint.load(checkpoint_path)
+    if checkpoint is None:
+        checkpoint = Checkpoint(os.path.abspath(input_path), 0, 0, 0)
+    elif checkpoint.input_path != os.path.abspath(input_path):
+        raise ValueError(f"The checkpoint {checkpoint_path} is for a different input file, {checkpoint.input_path}")
+
+    with open(input_path, "rb") as input_file, \
+            open(output_path, "r+b" if checkpoint.output_offset > 0 else "wb") as output_file:
+        # Discard anything written after the last checkpoint
+        input_file.seek(checkpoint.input_offset)
+        output_file.truncate(checkpoint.output_offset)
+        output_file.seek(checkpoint.output_offset)
+
+        for input_offset, num_records, output in bounded_map(
+            _regrade_chunk,
+            read_chunks(input_file, chunk_size),
+            processes=processes,
+            ordered=True,
+        ):
+            output_file.write(output)
+            output_file.flush()
+            os.fsync(output_file.fileno())
+
+            checkpoint = Checkpoint(
+                checkpoint.input_path, checkpoint.num_records + num_records, input_offset, output_file.tell()
+            )
+            checkpoint.save(checkpoint_path)
+
+    os.remove(checkpoint_path)
+    return checkpoint.num_records
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Regrade a JSONL dump of submissions.")
+    parser.add_argument("input", help="JSONL file of {problem, tokens, ...} records")
+    parser.add_argument("output", help="JSONL file to write the graded records to")
+    parser.add_argument("--checkpoint", help="checkpoint file (defaults to <output>.checkpoint)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    num_records = regrade(
+        args.input, args.output, checkpoint_path=args.checkpoint, processes=args.processes, chunk_size=args.chunk_size
+    )
+    print(f"Regraded {num_records} records")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
-from nltk.parse import RecursiveDescentParser
-from nltk.tree import Tree
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple
 
+from scaffolded_writing.caching import LRUCache
 from scaffolded_writing.cfg import ScaffoldedWritingCFG
+from scaffolded_writing.parsers import AmbiguousParseException, ParseResult
+from scaffolded_writing.tree import TreeNode
 
 # Note: the ValueError (PARSE_ERROR) is meant to be feedback for the student
 # All other exceptions are intended to prevent developer mistakes during question development
@@ -10,12 +11,6 @@ PARSE_ERROR = ValueError(
     "Your submission could not be parsed. This error may have been caused by submitting an incomplete response."
 )
 
-class AmbiguousParseException(Exception):
-    """
-    Raised if the CFG is ambiguous and there are multiple ways to parse the student submission.
-    """
-    pass
-
 class PathCanNeverExistWarning(Exception):
     """
     To guard against potential mistakes (e.g. typos, updating the CFG without updating the grading code),
@@ -26,22 +21,82 @@ class PathCanNeverExistWarning(Exception):
     """
     pass
 
+class ParseTreeIndex():
+    """
+    Indexes the nodes of a parse tree (both subtrees and leaves) by label, so that a path can be found
+    by following one label at a time. The index only stores node ids of the tree's CompactTree.
+    """
+    def __init__(self, parse_tree: TreeNode) -> None:
+        self.tree = parse_tree.tree
+        self.node_ids_by_label: Dict[str, List[int]] = {}
+
+        labels = self.tree.symbol_table.labels
+        node_ids_by_symbol: Dict[int, List[int]] = {}
+        for node_id in range(parse_tree.id, self.tree.ends[parse_tree.id]):
+            node_ids_by_symbol.setdefault(self.tree.symbols[node_id], []).append(node_id)
+        for symbol, node_ids in node_ids_by_symbol.items():
+            # A terminal and a nonterminal could share a label, in which case both lists are merged in preorder
+            if labels[symbol] in self.node_ids_by_label:
+                node_ids = sorted(self.node_ids_by_label[labels[symbol]] + node_ids)
+            self.node_ids_by_label[labels[symbol]] = node_ids
+
+    def has_path(self, path: Tuple[str, ...]) -> bool:
+        "Returns True iff some downward path in the tree has exactly the given labels"
+        node_ids = self.node_ids_by_label.get(path[0], [])
+
+        parents = self.tree.parents
+        for label in path[1:]:
+            parent_ids = set(node_ids)
+            node_ids = [node_id for node_id in self.node_ids_by_label.get(label, ()) if parents[node_id] in parent_ids]
+
+        return len(node_ids) > 0
+
+    def subtrees_with_label(self, label: str) -> List[TreeNode]:
+        is_terminal = self.tree.symbol_table.is_terminal
+        return [TreeNode(self.tree, node_id) for node_id in self.node_ids_by_label.get(label, ())
+                if not is_terminal[self.tree.symbols[node_id]]]
+
+
+class CachedParse():
+    """
+    The outcome of parsing a token list, along with the index of its parse tree. The index is built
+    the first time a submission needs it and is then shared by every later submission of the same tokens.
+    """
+    def __init__(self, result: ParseResult) -> None:
+        self.num_trees, self.parse_tree = result
+        self._index: Optional[ParseTreeIndex] = None
+
+    @property
+    def index(self) -> ParseTreeIndex:
+        assert self.parse_tree is not None
+        if self._index is None:
+            self._index = ParseTreeIndex(self.parse_tree)
+
+        return self._index
+
+
+# Caches the outcome of parsing (including parse failures and ambiguous parses), keyed by
+# (CFG fingerprint, tokens). The cached parse trees are shared between submissions, so they must
+# never be mutated. Use PARSE_CACHE.resize() to change the cache size (0 disables caching).
+PARSE_CACHE: LRUCache[Tuple[str, Tuple[str, ...]], CachedParse] = LRUCache(maxsize=4096)
+
 class StudentSubmission():
     def __init__(self, token_list: List[str], cfg: ScaffoldedWritingCFG):
         self.token_list = token_list
         self.cfg = cfg
 
-        try:
-            possible_parse_trees = RecursiveDescentParser(cfg).parse_all(token_list)
-        except ValueError:
-            raise PARSE_ERROR
-
-        if len(possible_parse_trees) == 0:
+        self._parsed = PARSE_CACHE.get_or_compute(
+            (cfg.fingerprint, tuple(token_list)),
+            lambda: CachedParse(cfg.parser.parse(token_list))
+        )
+        if self._parsed.num_trees == 0:
             raise PARSE_ERROR
-        elif len(possible_parse_trees) > 1:
+        elif self._parsed.num_trees > 1:
             raise AmbiguousParseException
 
-        self.parse_tree = possible_parse_trees[0]
+        self.parse_tree = self._parsed.parse_tree
+        # Memoizes does_path_exist, since constraints often check the same path more than once
+        self._path_results: Dict[Tuple[str, ...], bool] = {}
 
     def does_path_exist(self, *path: str) -> bool:
         """
@@ -51,30 +106,16 @@ class StudentSubmission():
         """
         assert len(path) > 0
 
+        if path in self._path_results:
+            return self._path_results[path]
+
         if not self.cfg.can_produce_path(*path):
             raise PathCanNeverExistWarning(path)
 
-        # Handle edge case where path is just a single terminal
-        if len(path) == 1 and path[0] in self.token_list:
-            return True
-
-        def does_path_exist_starting_from_node(path: List[str], node: Union[Tree, str]) -> bool:
-            node_label = node if isinstance(node, str) else node.label()
+        self._path_results[path] = self.parse_tree_index.has_path(path)
+        return self._path_results[path]
 
-            if path[0] != node_label:
-                return False
-
-            if len(path) == 1:
-                return True
-
-            # len(path) >= 2, so the current node cannot be a terminal
-            if isinstance(node, str):
-                return False
-
-            # figure out if any of the children can generate the rest of the path
-            return any(does_path_exist_starting_from_node(path[1:], child) for child in node)
-
-        return any(
-            does_path_exist_starting_from_node(list(path), node)
-            for node in self.parse_tree.subtrees()
-        )
+    @property
+    def parse_tree_index(self) -> ParseTreeIndex:
+        "Built on first use and cached along with the parse tree"
+        return self._parsed.index
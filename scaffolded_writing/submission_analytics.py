@@ -0,0 +1,256 @@
+"""
+Summarizes a submission log (see submission_log.py) for instructors' dashboards: for each problem, the
+distribution of scores, the constraints that submissions most often fail, the most common feedback
+and the most frequent wrong sentences.
+
+Submissions are read from the log in chunks. Each chunk is turned into numpy columns (problem codes,
+scores, failed constraints, feedback ids and interned sentences) and counted with vectorized group-bys,
+so a log of hundreds of thousands of submissions is summarized in seconds. The counts are saved to a
+state file along with the id of the last submission read, so each run only reads the submissions
+logged since the previous one.
+
+This is the only module that needs numpy, which is an optional dependency: `pip install numpy`.
+
+Usage: python -m scaffolded_writing.submission_analytics submissions.sqlite [--state analytics.json] [--top N]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError as err:
+    raise ImportError("scaffolded_writing.submission_analytics requires numpy, which is not installed") from err
+
+from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader
+from scaffolded_writing.exhaustive_grading import constraint_name
+from scaffolded_writing.files import atomic_write
+from scaffolded_writing.grader_registry import get_grader
+
+class ProblemStats():
+    "Counts of the logged submissions to one problem"
+    def __init__(self) -> None:
+        self.num_submissions = 0
+        # Submissions that could not be parsed, which have no score
+        self.num_unparseable = 0
+        self.score_counts: Counter[float] = Counter()
+        self.failed_constraint_counts: Counter[int] = Counter()
+        # Keyed by feedback id
+        self.feedback_counts: Counter[int] = Counter()
+        # Sentences that did not receive full credit, keyed by their token ids packed as in the log
+        self.wrong_sentence_counts: Counter[bytes] = Counter()
+
+    def mean_score(self) -> Optional[float]:
+        num_scored = self.num_submissions - self.num_unparseable
+        if num_scored == 0:
+            return None
+
+        return sum(score * count for score, count in self.score_counts.items()) / num_scored
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "num_submissions": self.num_submissions,
+            "num_unparseable": self.num_unparseable,
+            "score_counts": sorted(self.score_counts.items()),
+            "failed_constraint_counts": sorted(self.failed_constraint_counts.items()),
+            "feedback_counts": sorted(self.feedback_counts.items()),
+            "wrong_sentence_counts": sorted((blob.hex(), count) for blob, count in self.wrong_sentence_counts.items()),
+        }
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> "ProblemStats":
+        stats = ProblemStats()
+        stats.num_submissions = data["num_submissions"]
+        stats.num_unparseable = data["num_unparseable"]
+        stats.score_counts.update(dict(data["score_counts"]))
+        stats.failed_constraint_counts.update(dict(data["failed_constraint_counts"]))
+        stats.feedback_counts.update(dict(data["feedback_counts"]))
+        stats.wrong_sentence_counts.update({bytes.fromhex(blob): count for blob, count in data["wrong_sentence_counts"]})
+        return stats
+
+
+def _count_pairs(keys: "np.ndarray", values: "np.ndarray") -> Iterable[Tuple[int, Any, int]]:
+    "Returns (key, value, count) for each distinct pair of corresponding elements of keys and values"
+    if len(keys) == 0:
+        return []
+
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    is_first = np.empty(len(keys), dtype=bool)
+    is_first[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=is_first[1:])
+    is_first[1:] |= values[1:] != values[:-1]
+
+    starts = np.flatnonzero(is_first)
+    counts = np.diff(np.append(starts, len(keys)))
+    return zip(keys[starts].tolist(), values[starts].tolist(), counts.tolist())
+
+
+class SubmissionAnalytics():
+    """
+    Per-problem counts of the submissions in the log at log_path whose ids are at most offset. update()
+    counts the submissions logged since then.
+    """
+    def __init__(self, log_path: str, offset: int = 0, problems: Optional[Dict[str, ProblemStats]] = None) -> None:
+        self.log_path = log_path
+        self.offset = offset
+        self.problems = problems if problems is not None else {}
+
+    def update(self, connection: sqlite3.Connection, chunk_size: int = 50_000) -> int:
+        "Counts the submissions logged after offset, chunk_size rows at a time. Returns how many there were."
+        cursor = connection.execute(
+            "SELECT id, problem, token_ids, score, failed_constraint, feedback_id FROM submissions"
+            " WHERE id > ? ORDER BY id",
+            (self.offset,)
+        )
+        num_read = 0
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return num_read
+
+            self.__count_chunk(rows)
+            num_read += len(rows)
+
+    def __count_chunk(self, rows: List[Tuple[int, str, bytes, Optional[float], Optional[int], Optional[int]]]) -> None:
+        ids, problem_names, sentences, scores, failed_constraints, feedback_ids = zip(*rows)
+
+        problem_codes: Dict[str, int] = {}
+        problem = np.fromiter(
+            (problem_codes.setdefault(name, len(problem_codes)) for name in problem_names), dtype=np.int64, count=len(rows)
+        )
+        # Sentences are interned too, so that they can be grouped by their codes
+        sentence_codes: Dict[bytes, int] = {}
+        sentence = np.fromiter(
+            (sentence_codes.setdefault(blob, len(sentence_codes)) for blob in sentences), dtype=np.int64, count=len(rows)
+        )
+        # NULL scores become NaN, and NULL constraints and feedback become -1
+        score = np.array(scores, dtype=np.float64)
+        failed_constraint = np.array([-1 if index is None else index for index in failed_constraints], dtype=np.int64)
+        feedback_id = np.array([-1 if index is None else index for index in feedback_ids], dtype=np.int64)
+
+        stats = [self.problems.setdefault(name, ProblemStats()) for name in problem_codes]
+        scored = ~np.isnan(score)
+        num_submissions = np.bincount(problem, minlength=len(stats))
+        num_unparseable = np.bincount(problem[~scored], minlength=len(stats))
+        for problem_stats, submitted, unparseable in zip(stats, num_submissions.tolist(), num_unparseable.tolist()):
+            problem_stats.num_submissions += submitted
+            problem_stats.num_unparseable += unparseable
+
+        for code, value, count in _count_pairs(problem[scored], score[scored]):
+            stats[code].score_counts[value] += count
+
+        failed = failed_constraint >= 0
+        for code, index, count in _count_pairs(problem[failed], failed_constraint[failed]):
+            stats[code].failed_constraint_counts[index] += count
+
+        has_feedback = feedback_id >= 0
+        for code, index, count in _count_pairs(problem[has_feedback], feedback_id[has_feedback]):
+            stats[code].feedback_counts[index] += count
+
+        blobs = list(sentence_codes)
+        wrong = scored & (score < 1)
+        for code, sentence_code, count in _count_pairs(problem[wrong], sentence[wrong]):
+            stats[code].wrong_sentence_counts[blobs[sentence_code]] += count
+
+        self.offset = ids[-1]
+
+    def report(self, connection: sqlite3.Connection, top: int = 10) -> Dict[str, Any]:
+        "Returns each problem's dashboard, with the top most common failed constraints, feedback and wrong sentences"
+        tokens: Dict[int, str] = dict(connection.execute("SELECT id, text FROM tokens"))
+        feedback: Dict[int, str] = dict(connection.execute("SELECT id, text FROM feedback"))
+
+        report = {}
+        for problem_name, stats in sorted(self.problems.items()):
+            try:
+                grader: Optional[IncrementalConstraintGrader] = get_grader(problem_name)
+            except (ImportError, KeyError):
+                # The problem was renamed or removed since its submissions were logged
+                grader = None
+
+            report[problem_name] = {
+                "num_submissions": stats.num_submissions,
+                "num_unparseable": stats.num_unparseable,
+                "mean_score": stats.mean_score(),
+                "score_histogram": {str(score): count for score, count in sorted(stats.score_counts.items())},
+                "failed_constraints": {
+                    (str(index) if grader is None else constraint_name(grader, index)): count
+                    for index, count in stats.failed_constraint_counts.most_common(top)
+                },
+                "feedback": {feedback[index]: count for index, count in stats.feedback_counts.most_common(top)},
+                "wrong_sentences": [
+                    {"tokens": [tokens[token_id] for token_id in np.frombuffer(blob, dtype="<i4").tolist()], "count": count}
+                    for blob, count in stats.wrong_sentence_counts.most_common(top)
+                ],
+            }
+
+        return report
+
+    def save(self, path: str) -> None:
+        "Atomically replaces the state file, so that it is never left half-written"
+        with atomic_write(path) as f:
+            json.dump({
+                "log_path": self.log_path,
+                "offset": self.offset,
+                "problems": {problem_name: stats.to_json() for problem_name, stats in self.problems.items()},
+            }, f)
+
+    @staticmethod
+    def load(path: str) -> Optional["SubmissionAnalytics"]:
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            data = json.load(f)
+        return SubmissionAnalytics(
+            data["log_path"], data["offset"],
+            {problem_name: ProblemStats.from_json(stats) for problem_name, stats in data["problems"].items()}
+        )
+
+
+def update_analytics(log_path: str, state_path: Optional[str] = None, *, chunk_size: int = 50_000,
+                     top: int = 10) -> Dict[str, Any]:
+    """
+    Counts the submissions logged since the state file was last saved (or every submission, if there is
+    no state file yet), saves the new state and returns each problem's dashboard
+    """
+    state_path = state_path or log_path + ".analytics"
+    analytics = SubmissionAnalytics.load(state_path)
+    if analytics is None:
+        analytics = SubmissionAnalytics(os.path.abspath(log_path))
+    elif analytics.log_path != os.path.abspath(log_path):
+        raise ValueError(f"The state file {state_path} is for a different submission log, {analytics.log_path}")
+
+    connection = sqlite3.connect(log_path)
+    try:
+        analytics.update(connection, chunk_size)
+        analytics.save(state_path)
+        return analytics.report(connection, top)
+    finally:
+        connection.close()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarize a submission log for each problem.")
+    parser.add_argument("log", help="SQLite database written by SCAFFOLDED_WRITING_SUBMISSION_LOG")
+    parser.add_argument("--state", help="file that the counts are saved to between runs (defaults to <log>.analytics)")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--top", type=int, default=10, help="failed constraints, feedback and wrong sentences to list")
+    parser.add_argument("--output", help="file to write the JSON report to (defaults to stdout)")
+    args = parser.parse_args(argv)
+
+    report = update_analytics(args.log, args.state, chunk_size=args.chunk_size, top=args.top)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Logs every graded submission (its problem, tokens, score, feedback and grading latency) to a local
+SQLite database for later analysis. Graders hand each submission to a SubmissionLogger, which only puts
+it on a bounded in-memory queue; a background thread drains the queue and writes the submissions in
+batches, so disk latency never adds to the latency of grading. The database is in WAL mode, so it can
+be read while submissions are being written, and so that the worker processes of a pool can each
+write to it.
+
+Tokens and feedback strings are interned: a submission stores its tokens as a blob of little-endian
+int32 ids into the tokens table, and its feedback as an id into the feedback table. Its score is NULL
+(and its feedback is the error message) if it could not be parsed.
+
+register_grader gives every grader the process's logger if these environment variables are set:
+    SCAFFOLDED_WRITING_SUBMISSION_LOG           path of the database (logging is off if it is unset)
+    SCAFFOLDED_WRITING_SUBMISSION_LOG_OVERFLOW  "drop" (default) to drop submissions while the queue
+                                                is full, or "block" to make grading wait for room
+"""
+import logging
+import multiprocessing.util
+import os
+import queue
+import sqlite3
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from scaffolded_writing.metrics import SUBMISSIONS_DROPPED
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tokens (id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE);
+    CREATE TABLE IF NOT EXISTS feedback (id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE);
+    CREATE TABLE IF NOT EXISTS submissions (
+        id INTEGER PRIMARY KEY,
+        time REAL NOT NULL,
+        problem TEXT NOT NULL,
+        token_ids BLOB NOT NULL,
+        score REAL,
+        failed_constraint INTEGER,
+        feedback_id INTEGER REFERENCES feedback (id),
+        grading_seconds REAL NOT NULL
+    );
+"""
+
+OVERFLOW_POLICIES = ("drop", "block")
+
+# (time, problem, tokens, score, failed constraint, feedback, grading seconds)
+EntryT = Tuple[float, str, Tuple[str, ...], Optional[float], Optional[int], Optional[str], float]
+
+logger = logging.getLogger(__name__)
+
+def pack_token_ids(token_ids: Sequence[int]) -> bytes:
+    return struct.pack(f"<{len(token_ids)}i", *token_ids)
+
+
+def unpack_token_ids(blob: bytes) -> Tuple[int, ...]:
+    return struct.unpack(f"<{len(blob) // 4}i", blob)
+
+
+class SubmissionLogger():
+    """
+    Writes logged submissions to the SQLite database at path from a background thread, in batches of at
+    most batch_size, committing at least every flush_interval seconds. At most max_queue submissions wait
+    to be written; what happens to a submission logged while the queue is full depends on overflow.
+    """
+    def __init__(self, path: str, *, max_queue: int = 10_000, batch_size: int = 500,
+                 flush_interval: float = 1.0, overflow: str = "drop") -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"The overflow policy must be one of {OVERFLOW_POLICIES}, not {overflow!r}")
+
+        self.path = path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.__start()
+
+    def __start(self) -> None:
+        "Starts the writer thread, with a new queue. A forked process starts its own, since threads do not survive a fork."
+        self._pid = os.getpid()
+        self._queue: "queue.Queue[Optional[EntryT]]" = queue.Queue(self.max_queue)
+        self._closed = False
+        self._writer = threading.Thread(target=self.__write_entries, name="submission-logger", daemon=True)
+        self._writer.start()
+        # Writes the queued submissions when the process exits. Unlike an atexit handler, this also runs
+        # in multiprocessing workers, which exit with os._exit. Each process registers its own, since a
+        # worker starts with none.
+        multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    def log(self, problem: str, tokens: Sequence[str], score: Optional[float], failed_constraint: Optional[int],
+            feedback: Optional[str], grading_seconds: float) -> None:
+        "Queues a submission to be written. Returns right away unless the queue is full and overflow is 'block'."
+        if self._pid != os.getpid():
+            self.__start()
+        if self._closed:
+            return
+
+        entry = (time.time(), problem, tuple(tokens), score, failed_constraint, feedback, grading_seconds)
+        if self.overflow == "block":
+            self._queue.put(entry)
+            return
+
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            SUBMISSIONS_DROPPED.inc(problem)
+
+    def flush(self) -> None:
+        "Waits until every submission logged so far has been written"
+        self._queue.join()
+
+    def close(self) -> None:
+        "Writes the submissions still in the queue and stops the writer thread. Later submissions are not logged."
+        if self._closed or self._pid != os.getpid():
+            return
+
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    def __write_entries(self) -> None:
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            if connection.execute("PRAGMA user_version").fetchone()[0] not in (0, SCHEMA_VERSION):
+                raise ValueError(f"{self.path} is not a version {SCHEMA_VERSION} submission log")
+            connection.executescript(SCHEMA)
+            connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+            token_ids: Dict[str, int] = dict(connection.execute("SELECT text, id FROM tokens"))
+            feedback_ids: Dict[str, int] = dict(connection.execute("SELECT text, id FROM feedback"))
+        except (sqlite3.Error, ValueError):
+            logger.exception("Not logging submissions to %s", self.path)
+            connection.close()
+            self.__discard_entries()
+            return
+
+        done = False
+        while not done:
+            # Block until there is something to write, then keep taking submissions until the batch is
+            # full or flush_interval has passed
+            batch: List[EntryT] = []
+            entry = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if entry is None:
+                    done = True
+                else:
+                    batch.append(entry)
+                if done or len(batch) >= self.batch_size:
+                    break
+                try:
+                    entry = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+
+            try:
+                with connection:
+                    self.__insert(connection, batch, token_ids, feedback_ids)
+            except sqlite3.Error:
+                logger.exception("Could not log %d submissions to %s", len(batch), self.path)
+                # The ids interned in the failed transaction were rolled back too
+                token_ids = dict(connection.execute("SELECT text, id FROM tokens"))
+                feedback_ids = dict(connection.execute("SELECT text, id FROM feedback"))
+            finally:
+                for _ in range(len(batch) + done):
+                    self._queue.task_done()
+
+        connection.close()
+
+    def __discard_entries(self) -> None:
+        "Empties the queue for as long as the logger is open, so that logging never blocks"
+        while self._queue.get() is not None:
+            self._queue.task_done()
+        self._queue.task_done()
+
+    @staticmethod
+    def __insert(connection: sqlite3.Connection, batch: List[EntryT], token_ids: Dict[str, int],
+                 feedback_ids: Dict[str, int]) -> None:
+        def intern(table: str, ids: Dict[str, int], text: str) -> int:
+            if text not in ids:
+                # Another process may have interned the same string since this one last looked
+                connection.execute(f"INSERT OR IGNORE INTO {table} (text) VALUES (?)", (text,))
+                ids[text], = connection.execute(f"SELECT id FROM {table} WHERE text = ?", (text,)).fetchone()
+            return ids[text]
+
+        connection.executemany(
+            "INSERT INTO submissions (time, problem, token_ids, score, failed_constraint, feedback_id, grading_seconds)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    logged_at, problem, pack_token_ids([intern("tokens", token_ids, token) for token in tokens]),
+                    score, failed_constraint, None if feedback is None else intern("feedback", feedback_ids, feedback),
+                    grading_seconds,
+                )
+                for logged_at, problem, tokens, score, failed_constraint, feedback, grading_seconds in batch
+            ]
+        )
+
+
+_process_logger: Optional[SubmissionLogger] = None
+
+def get_submission_logger() -> Optional[SubmissionLogger]:
+    "Returns the logger configured by the environment variables, or None if submissions are not logged"
+    global _process_logger
+    path = os.environ.get("SCAFFOLDED_WRITING_SUBMISSION_LOG")
+    if not path:
+        return None
+
+    if _process_logger is None:
+        _process_logger = SubmissionLogger(
+            path, overflow=os.environ.get("SCAFFOLDED_WRITING_SUBMISSION_LOG_OVERFLOW", "drop")
+        )
+
+    return _process_logger
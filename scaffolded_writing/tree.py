@@ -0,0 +1,239 @@
+"""
+Parse trees with the same interface as the parts of nltk.tree.Tree that the grader uses. The parsers
+produce CompactTrees, which store a tree's nodes in a few integer arrays; Tree is a simple mutable tree.
+Parse trees can be as deep as the input is long, so nothing here recurses over the tree.
+"""
+from array import array
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from scaffolded_writing.grammar import SymbolTable
+
+class Tree(list):
+    "A labeled node whose children (the list's items) are Trees or leaf strings"
+    def __init__(self, label: str, children: Iterable[Union["Tree", str]] = ()) -> None:
+        super().__init__(children)
+        self._label = label
+
+    def label(self) -> str:
+        return self._label
+
+    def set_label(self, label: str) -> None:
+        self._label = label
+
+    def subtrees(self, filter: Optional[Callable[["Tree"], bool]] = None) -> Iterator["Tree"]:
+        "Yields this tree and every subtree in preorder, optionally only those for which filter returns True"
+        stack: List[Tree] = [self]
+        while stack:
+            node = stack.pop()
+            if filter is None or filter(node):
+                yield node
+            stack.extend(child for child in reversed(node) if isinstance(child, Tree))
+
+    def leaves(self) -> List[str]:
+        "Returns the leaves from left to right"
+        leaves: List[str] = []
+        stack: List[Union[Tree, str]] = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Tree):
+                stack.extend(reversed(node))
+            else:
+                leaves.append(node)
+
+        return leaves
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, TreeNode):
+            return NotImplemented
+
+        stack: List[Tuple[object, object]] = [(self, other)]
+        while stack:
+            node, other_node = stack.pop()
+            if not isinstance(node, Tree):
+                if node != other_node:
+                    return False
+            elif type(node) is not type(other_node) or node._label != other_node._label \
+                    or len(node) != len(other_node):  # type: ignore[attr-defined, arg-type]
+                return False
+            else:
+                stack.extend(zip(node, other_node))  # type: ignore[call-overload]
+
+        return True
+
+    def __ne__(self, other: object) -> bool:
+        return not self == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._label!r}, {list.__repr__(self)})"
+
+    def __str__(self) -> str:
+        "Returns the tree in bracketed form, e.g. (S (NP Jason) (VP ate))"
+        parts: List[str] = []
+        # Each entry is a node to print, or None to close the most recently opened bracket
+        stack: List[Union[Tree, str, None]] = [self]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                parts.append(")")
+            elif isinstance(node, Tree):
+                parts.append(f" ({node._label}" if parts else f"({node._label}")
+                stack.append(None)
+                stack.extend(reversed(node))
+            else:
+                parts.append(f" {node}")
+
+        return "".join(parts)
+
+
+class CompactTree():
+    """
+    A read-only parse tree stored as parallel arrays indexed by node id, with nodes numbered in preorder:
+    each node's symbol id (into symbol_table), its parent (-1 for the root), and the id just past the
+    end of its subtree. A node's subtree is therefore the contiguous range of ids [node, ends[node]),
+    its first child (if any) is node + 1, and the sibling after it (if any) is ends[node]. Use TreeNode
+    to view a node with the same interface as Tree.
+    """
+    __slots__ = ("symbol_table", "symbols", "parents", "ends")
+
+    def __init__(self, symbol_table: SymbolTable, symbols: "array[int]", parents: "array[int]",
+                 ends: "array[int]") -> None:
+        self.symbol_table = symbol_table
+        self.symbols = symbols
+        self.parents = parents
+        self.ends = ends
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def root(self) -> "TreeNode":
+        return TreeNode(self, 0)
+
+    def children(self, node: int) -> Iterator[int]:
+        child, end = node + 1, self.ends[node]
+        while child < end:
+            yield child
+            child = self.ends[child]
+
+
+class CompactTreeBuilder():
+    "Collects the nodes of a parse tree in preorder (so a parent is always added before its children)"
+    def __init__(self, symbol_table: SymbolTable) -> None:
+        self.symbol_table = symbol_table
+        self.symbols = array("i")
+        self.parents = array("i")
+
+    def add(self, symbol_id: int, parent: int) -> int:
+        "Adds a node as the next child of parent (or as the root if parent is -1), returning its id"
+        self.symbols.append(symbol_id)
+        self.parents.append(parent)
+        return len(self.symbols) - 1
+
+    def build(self) -> "TreeNode":
+        "Returns the root of the tree"
+        num_nodes = len(self.symbols)
+        ends = array("i", range(1, num_nodes + 1))
+        # Every node's descendants come after it, so visiting nodes in reverse order finishes each
+        # subtree before extending its parent's
+        parents = self.parents
+        for node in range(num_nodes - 1, 0, -1):
+            if ends[node] > ends[parents[node]]:
+                ends[parents[node]] = ends[node]
+
+        return CompactTree(self.symbol_table, self.symbols, parents, ends).root()
+
+
+class TreeNode():
+    """
+    A read-only view of a nonterminal node of a CompactTree, with the same interface as Tree: its
+    children are TreeNodes for nonterminals and strings for terminals.
+    """
+    __slots__ = ("tree", "id")
+
+    def __init__(self, tree: CompactTree, id: int) -> None:
+        self.tree = tree
+        self.id = id
+
+    def label(self) -> str:
+        return self.tree.symbol_table.labels[self.tree.symbols[self.id]]
+
+    def __child(self, child: int) -> Union["TreeNode", str]:
+        symbol = self.tree.symbols[child]
+        if self.tree.symbol_table.is_terminal[symbol]:
+            return self.tree.symbol_table.labels[symbol]
+        return TreeNode(self.tree, child)
+
+    def __iter__(self) -> Iterator[Union["TreeNode", str]]:
+        return (self.__child(child) for child in self.tree.children(self.id))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.tree.children(self.id))
+
+    def __getitem__(self, index: int) -> Union["TreeNode", str]:
+        children = list(self.tree.children(self.id))
+        return self.__child(children[index])
+
+    def subtrees(self, filter: Optional[Callable[["TreeNode"], bool]] = None) -> Iterator["TreeNode"]:
+        "Yields this node and every nonterminal node below it in preorder, optionally only those for which filter returns True"
+        is_terminal, symbols = self.tree.symbol_table.is_terminal, self.tree.symbols
+        for node in range(self.id, self.tree.ends[self.id]):
+            if not is_terminal[symbols[node]]:
+                subtree = TreeNode(self.tree, node)
+                if filter is None or filter(subtree):
+                    yield subtree
+
+    def leaves(self) -> List[str]:
+        "Returns the leaves from left to right"
+        is_terminal, labels = self.tree.symbol_table.is_terminal, self.tree.symbol_table.labels
+        return [labels[symbol] for symbol in self.tree.symbols[self.id:self.tree.ends[self.id]] if is_terminal[symbol]]
+
+    def to_tree(self) -> Tree:
+        "Copies the subtree into a (mutable) Tree"
+        root = Tree(self.label())
+        stack: List[Tuple[TreeNode, Tree]] = [(self, root)]
+        while stack:
+            node, copy = stack.pop()
+            for child in node:
+                if isinstance(child, str):
+                    copy.append(child)
+                else:
+                    child_copy = Tree(child.label())
+                    copy.append(child_copy)
+                    stack.append((child, child_copy))
+
+        return root
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Tree):
+            return self.to_tree() == other
+        if not isinstance(other, TreeNode):
+            return NotImplemented
+
+        # Two subtrees are equal iff they have the same labels in preorder and the same shape
+        size = self.tree.ends[self.id] - self.id
+        if other.tree.ends[other.id] - other.id != size:
+            return False
+
+        for offset in range(size):
+            node, other_node = self.id + offset, other.id + offset
+            symbol, other_symbol = self.tree.symbols[node], other.tree.symbols[other_node]
+            if self.tree.symbol_table.labels[symbol] != other.tree.symbol_table.labels[other_symbol] \
+                    or self.tree.symbol_table.is_terminal[symbol] != other.tree.symbol_table.is_terminal[other_symbol]:
+                return False
+            if offset > 0 and self.tree.parents[node] - self.id != other.tree.parents[other_node] - other.id:
+                return False
+
+        return True
+
+    def __ne__(self, other: object) -> bool:
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"TreeNode({self.label()!r}, {self.id})"
+
+    def __str__(self) -> str:
+        return str(self.to_tree())
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import threading
+from typing import Any, Dict, List, Tuple
+
+import asgi_app
+import flask_app
+from scaffolded_writing.grader_registry import get_grader
+
+async def request(app: Any, method: str, path: str, body: bytes = b"") -> Tuple[int, Dict[str, str], bytes]:
+    "Sends one request to the ASGI app, returning (status, headers, body)"
+    scope = {"type": "http", "method": method, "path": path, "headers": [(b"content-type", b"application/json")]}
+    received = [{"type": "http.request", "body": body, "more_body": False}]
+    sent: List[Dict[str, Any]] = []
+
+    async def receive() -> Dict[str, Any]:
+        return received.pop(0)
+
+    async def send(message: Dict[str, Any]) -> None:
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start, response_body = sent
+    headers = {name.decode(): value.decode() for name, value in start["headers"]}
+    return start["status"], headers, response_body["body"]
+
+
+def verify_asgi_app_matches_flask_app() -> None:
+    app = asgi_app.create_app("thread", workers=2)
+    client = flask_app.app.test_client()
+    tokens = json.loads(client.post("/max_profit/next_tokens", json=[]).data)
+    sentence = list(next(get_grader("max_profit").question_cfg.generate_sentences()))
+
+    async def run() -> None:
+        for path, body in [
+            ("/max_profit/next_tokens", []),
+            ("/max_profit/next_tokens", tokens[:1]),
+            ("/max_profit/submit", sentence),
+            ("/max_profit/submit_batch", [sentence, tokens[:1]]),
+        ]:
+            status, headers, response_body = await request(app, "POST", path, json.dumps(body).encode())
+            flask_response = client.post(path, json=body)
+            assert (status, headers["content-type"], response_body) \
+                == (flask_response.status_code, flask_response.content_type, flask_response.data)
+
+        # Pages are served by the Flask app
+        status, _, response_body = await request(app, "GET", "/max_profit/problem")
+        assert status == 200 and response_body == client.get("/max_profit/problem").data
+
+        status, _, _ = await request(app, "POST", "/max_profit/next_tokens", b"{not json")
+        assert status == 400
+
+    asyncio.run(run())
+
+
+def verify_asgi_app_rejects_requests_when_busy() -> None:
+    app = asgi_app.create_app("thread", workers=1, max_pending=1)
+    release = threading.Event()
+    app.grading_executor.executor.submit(release.wait)
+
+    async def run() -> None:
+        # The only worker is blocked, so this request waits in the queue...
+        queued = asyncio.create_task(request(app, "POST", "/max_profit/next_tokens", b"[]"))
+        await asyncio.sleep(0.05)
+        assert app.grading_executor.num_pending == 1
+
+        # ...and one more request is rejected right away, while pages are still served
+        status, headers, _ = await request(app, "POST", "/max_profit/next_tokens", b"[]")
+        assert status == 503 and headers["retry-after"] == str(asgi_app.RETRY_AFTER_SECONDS)
+        status, _, _ = await request(app, "GET", "/")
+        assert status == 200
+
+        release.set()
+        status, _, _ = await queued
+        assert status == 200 and app.grading_executor.num_pending == 0
+
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+import pytest
+import time
+
+from scaffolded_writing.caching import CacheStats, LRUCache
+
+
+class VerifyLRUCache:
+    def verify_least_recently_used_entry_is_evicted(self) -> None:
+        cache: LRUCache[str, int] = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+
+        # "b" is now the least recently used entry
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+        assert cache.stats() == CacheStats(hits=3, misses=1, evictions=1, expirations=0, size=2, maxsize=2)
+
+    def verify_get_or_compute(self) -> None:
+        cache: LRUCache[str, int] = LRUCache(maxsize=2)
+        calls = []
+
+        def compute() -> int:
+            calls.append(None)
+            return 42
+
+        assert cache.get_or_compute("answer", compute) == 42
+        assert cache.get_or_compute("answer", compute) == 42
+        assert len(calls) == 1
+
+    def verify_falsy_values_are_cached(self) -> None:
+        cache: LRUCache[str, int] = LRUCache(maxsize=2)
+        cache.put("zero", 0)
+        assert cache.get_or_compute("zero", lambda: 1) == 0
+
+    def verify_resize_and_clear(self) -> None:
+        cache: LRUCache[int, int] = LRUCache(maxsize=10)
+        for i in range(10):
+            cache.put(i, i)
+
+        cache.resize(3)
+        assert len(cache) == 3
+        assert cache.stats().evictions == 7
+        assert cache.get(9) == 9
+
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.stats() == CacheStats(hits=0, misses=0, evictions=0, expirations=0, size=0, maxsize=3)
+
+    def verify_ttl(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        now = 1000.0
+        monkeypatch.setattr(time, "monotonic", lambda: now)
+
+        cache: LRUCache[str, int] = LRUCache(maxsize=2, ttl=10)
+        cache.put("a", 1)
+
+        now += 9
+        assert cache.get("a") == 1
+
+        now += 1
+        assert cache.get("a") is None
+        assert cache.stats().expirations == 1
+        assert len(cache) == 0
+
+        with pytest.raises(ValueError, match="must be positive"):
+            LRUCache(maxsize=2, ttl=0)
+
+    def verify_disabled_cache(self) -> None:
+        cache: LRUCache[str, int] = LRUCache(maxsize=0)
+        cache.put("a", 1)
+        assert cache.get("a") is None
+
+        with pytest.raises(ValueError, match="must be nonnegative"):
+            LRUCache(maxsize=-1)
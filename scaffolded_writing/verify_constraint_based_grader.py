@@ -1,7 +1,12 @@
+import importlib
+import sys
+from pathlib import Path
+
 import pytest
 import scaffolded_writing.dp_utils as sw_du
 from scaffolded_writing.dp_cfgs import PARTITION_SUM_CFG as cfg
-from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader
+from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader, constraint_fingerprint
+from scaffolded_writing.grader_registry import GRADERS, get_grader
 from shared_utils import get_partial_score
 from typing import List, Dict, Any
 
@@ -94,3 +99,154 @@ def verify_incremental_constraint_grader(student_tokens: List[str],
     # Assert we get feedback if we didn't get full credit
     if expected_grade < 1.0:
         assert data['feedback'][question_name]
+
+
+def verify_incremental_constraint_grader_result_cache() -> None:
+    grader = IncrementalConstraintGrader(sw_du.DPStudentSubmission, cfg)
+    grader.add_constraint(sw_du.DeclareFunctionConstraint(), 0.05)
+    grader.add_constraint(sw_du.CorrectOutputNounAndExtremalAdj("sum", "maximum"))
+    grader.enable_result_cache(maxsize=8)
+
+    tokens = ["define", "DP(i)", "to be the", "answer", "that can be obtained", "."]
+    first_result = grader.grade_tokens(tokens)
+    assert grader.grade_tokens(tokens) == first_result
+    assert first_result[0] == 0.05
+
+    # Format errors are cached as well
+    for _ in range(2):
+        with pytest.raises(ValueError, match="could not be parsed"):
+            grader.grade_tokens(["define"])
+
+    stats = grader.result_cache_stats()
+    assert stats is not None
+    assert (stats.hits, stats.misses, stats.size) == (2, 2, 2)
+
+
+def verify_incremental_constraint_grader_grade_many() -> None:
+    grader = IncrementalConstraintGrader(sw_du.DPStudentSubmission, cfg)
+    grader.add_constraint(sw_du.DeclareFunctionConstraint(), 0.05)
+    grader.add_constraint(sw_du.CorrectOutputNounAndExtremalAdj("sum", "maximum"))
+
+    partial_credit = ["define", "DP(i)", "to be the", "answer", "that can be obtained", "."]
+    full_credit = ["define", "DP(i)", "to be the", "maximum", "sum", "that can be obtained", "."]
+    outcomes = grader.grade_many([partial_credit, ["define"], full_credit, partial_credit])
+
+    assert outcomes[0] == grader.grade_result(partial_credit)
+    assert outcomes[0].score == 0.05 and outcomes[0].failed_constraint == 1
+    assert isinstance(outcomes[1], ValueError)
+    assert outcomes[2] == (1.0, None, None)
+    # Repeated token lists are only graded once
+    assert outcomes[3] is outcomes[0]
+
+    with pytest.raises(ValueError, match="No constraints set"):
+        IncrementalConstraintGrader(sw_du.DPStudentSubmission, cfg).grade_many([partial_credit])
+
+
+def verify_incremental_constraint_grader_fingerprint() -> None:
+    def build_grader(correct_noun: str, partial_credit: float) -> IncrementalConstraintGrader:
+        grader = IncrementalConstraintGrader(sw_du.DPStudentSubmission, cfg)
+        grader.add_constraint(sw_du.DeclareFunctionConstraint(), partial_credit)
+        grader.add_constraint(sw_du.CorrectOutputNounAndExtremalAdj(correct_noun, "maximum"))
+        return grader
+
+    assert build_grader("sum", 0.05).fingerprint == build_grader("sum", 0.05).fingerprint
+    assert build_grader("sum", 0.05).fingerprint != build_grader("sum", 0.1).fingerprint
+    assert build_grader("sum", 0.05).fingerprint != build_grader("answer", 0.05).fingerprint
+
+
+def verify_fingerprint_covers_constraint_code(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    constraint_source = """
+import scaffolded_writing.dp_utils as sw_du
+
+class NameIsDP(sw_du.Constraint[sw_du.DPStudentSubmission]):
+    def is_satisfied(self, submission):
+        return submission.func_name == {name!r}
+
+    def get_feedback(self, submission):
+        return "Name it DP"
+"""
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    def load_grader(name: str) -> IncrementalConstraintGrader:
+        # A fixed version of the module is written to the same file and imported anew
+        (tmp_path / "fingerprinted_constraint.py").write_text(constraint_source.format(name=name))
+        sys.modules.pop("fingerprinted_constraint", None)
+        module = importlib.import_module("fingerprinted_constraint")
+        grader = IncrementalConstraintGrader(sw_du.DPStudentSubmission, cfg)
+        grader.add_constraint(module.NameIsDP())
+        return grader
+
+    assert load_grader("DP").fingerprint == load_grader("DP").fingerprint
+    assert load_grader("DP").fingerprint != load_grader("MaxSum").fingerprint
+
+    # Without a source file, the bytecode is hashed
+    def exec_constraint(name: str) -> sw_du.Constraint:
+        namespace: Dict[str, Any] = {"__name__": "not_a_module"}
+        exec(constraint_source.format(name=name), namespace)
+        return namespace["NameIsDP"]()
+
+    assert constraint_fingerprint(exec_constraint("DP")) == constraint_fingerprint(exec_constraint("DP"))
+    assert constraint_fingerprint(exec_constraint("DP")) != constraint_fingerprint(exec_constraint("MaxSum"))
+
+
+@pytest.mark.parametrize(
+    "constraint, student_tokens",
+    [(sw_du.CorrectOutputNounAndExtremalAdj("sum", "maximum"),
+      ["define", "DP(i)", "to be the", "sum", "that can be obtained", "."]),
+     (sw_du.ExplainParamsConstraint(variables_in_problem=["n"]),
+      ["define", "DP(i)", "to be the", "sum", "that can be obtained", "using", "at most", "t", "2-digit terms", "."]),
+     (sw_du.DecoupledParametersConstraint(SUBARRAY="an array index", COMPARISON_RHS="the number of terms"),
+      ["define", "DP(i,j)", "to be the", "sum", "that can be obtained", "from",
+       "A[i..j]", "using", "at most", "j", "2-digit terms", "."])
+     ]
+)
+def verify_constraints_are_stateless(constraint: sw_du.Constraint, student_tokens: List[str]) -> None:
+    submission = sw_du.DPStudentSubmission(student_tokens, cfg)
+
+    state_before = dict(vars(constraint))
+    verdict = constraint.evaluate(submission)
+
+    assert not verdict.is_satisfied
+    assert constraint.explain(submission, verdict) == constraint.get_feedback(submission)
+    assert vars(constraint) == state_before
+
+
+def verify_constraint_must_override_a_method_pair() -> None:
+    submission = sw_du.DPStudentSubmission(["define", "DP(i)", "to be the", "sum", "that can be obtained", "."], cfg)
+
+    class FeedbackOnly(sw_du.Constraint[sw_du.DPStudentSubmission]):
+        def get_feedback(self, submission: sw_du.DPStudentSubmission) -> str:
+            return "feedback"
+
+    with pytest.raises(TypeError, match="is_satisfied"):
+        FeedbackOnly()
+
+    class CheckOnly(sw_du.Constraint[sw_du.DPStudentSubmission]):
+        def is_satisfied(self, submission: sw_du.DPStudentSubmission) -> bool:
+            return False
+
+    with pytest.raises(TypeError, match="get_feedback"):
+        CheckOnly()
+    with pytest.raises(TypeError, match="is_satisfied"):
+        sw_du.RestrictionImposedOnCorrectSide(prefix_token="", suffix_token="", prefix_position="", suffix_position="")
+
+    class EvaluateAndExplain(sw_du.Constraint[sw_du.DPStudentSubmission]):
+        def evaluate(self, submission: sw_du.DPStudentSubmission) -> sw_du.Verdict:
+            return sw_du.Verdict(False)
+
+        def explain(self, submission: sw_du.DPStudentSubmission, verdict: sw_du.Verdict) -> str:
+            return "feedback"
+
+    constraint = EvaluateAndExplain()
+    assert not constraint.is_satisfied(submission)
+    assert constraint.get_feedback(submission) == "feedback"
+
+
+def verify_grader_registry() -> None:
+    from problems import max_profit
+
+    assert get_grader("max_profit") is max_profit.GRADER
+    assert GRADERS["max_profit"] is max_profit.GRADER
+
+    with pytest.raises(ModuleNotFoundError):
+        get_grader("not_a_problem")
@@ -0,0 +1,149 @@
+import pytest
+
+from scaffolded_writing.cfg import AmbiguousGrammarError, ScaffoldedWritingCFG
+from scaffolded_writing.dfa import DFAParser, GrammarNotCompilableError, GrammarTooLargeError
+from scaffolded_writing.dp_cfgs import PARTITION_SUM_CFG
+from scaffolded_writing.parsers import AmbiguousParseException, EarleyParser, find_ambiguous_sentence
+from scaffolded_writing.student_submission import StudentSubmission
+
+cfg = ScaffoldedWritingCFG.fromstring("""
+    SENTENCE -> SUBJECT VERB OBJECT "." | INTERJECTION "!"
+    SUBJECT -> NOUN
+    NOUN -> "Jason" | "the squirrel"
+    VERB -> "ate" | "fought" | "kicked" | "hugged"
+    OBJECT -> NOUN | EPSILON
+    INTERJECTION -> "Wow" | "Ouch"
+    EPSILON ->
+""")
+
+ambiguous_cfg = ScaffoldedWritingCFG.fromstring("""
+    S -> A A
+    A -> "a" | "a" "a"
+""", check_ambiguity=False)
+
+
+def verify_dfa_membership_and_next_tokens() -> None:
+    dfa = DFAParser(cfg)
+
+    assert dfa.accepts(["Jason", "ate", "."])
+    assert dfa.accepts(["Jason", "ate", "the squirrel", "."])
+    assert not dfa.accepts(["Jason", "ate"])
+    assert not dfa.accepts(["ate"])
+    assert not dfa.accepts([])
+
+    assert dfa.next_tokens([]) == ["Jason", "the squirrel", "Wow", "Ouch"]
+    assert dfa.next_tokens(["Jason", "ate"]) == ["Jason", "the squirrel", "."]
+    assert dfa.next_tokens(["Jason", "ate", "."]) == []
+    assert dfa.next_tokens(["ate"]) == []
+
+
+def verify_dfa_is_minimized() -> None:
+    dfa = DFAParser(cfg)
+
+    # Both nouns lead to the same state, and so do all four verbs
+    assert dfa.run(["Jason"]) == dfa.run(["the squirrel"])
+    assert dfa.run(["Jason", "ate"]) == dfa.run(["the squirrel", "hugged"])
+    assert len(dfa.transitions) < len(dfa.state_positions)
+
+
+@pytest.mark.parametrize("grammar", [cfg, ambiguous_cfg, PARTITION_SUM_CFG])
+def verify_dfa_parser_matches_earley_parser(grammar: ScaffoldedWritingCFG) -> None:
+    dfa, earley = DFAParser(grammar), EarleyParser(grammar)
+
+    for index, sentence in enumerate(grammar.generate_sentences()):
+        if index % 50 == 0:
+            assert dfa.parse(sentence) == earley.parse(sentence)
+            assert dfa.parse(sentence[:-1]) == earley.parse(sentence[:-1])
+            assert dfa.parse(sentence + sentence[:1]) == earley.parse(sentence + sentence[:1])
+
+
+def verify_dfa_counts_parse_trees() -> None:
+    dfa = DFAParser(ambiguous_cfg)
+
+    assert dfa.parse(["a", "a"]).num_trees == 1
+    assert dfa.parse(["a", "a", "a"]).num_trees > 1
+    assert dfa.parse(["a", "a", "a"]).tree is None
+    assert dfa.parse(["a", "a", "a", "a"]).num_trees == 1
+
+
+@pytest.mark.parametrize("grammar,strategy", [
+    ("""
+        S -> A A
+        A -> "a" | "a" "a"
+    """, "DFA"),
+    ("""
+        S -> "a" OPTIONAL
+        OPTIONAL -> EPSILON | EPSILON EPSILON
+        EPSILON ->
+    """, "Earley"),
+    ('S -> S S | "a"', "Earley"),
+])
+def verify_ambiguous_grammars_are_rejected(grammar: str, strategy: str) -> None:
+    with pytest.raises(AmbiguousGrammarError) as error:
+        ScaffoldedWritingCFG.fromstring(grammar)
+
+    unchecked_cfg = ScaffoldedWritingCFG.fromstring(grammar, check_ambiguity=False)
+    assert unchecked_cfg.parsing_strategy == strategy
+    assert not unchecked_cfg.parser.unambiguous
+    assert EarleyParser(unchecked_cfg).parse(error.value.witness).num_trees > 1
+
+
+def verify_unambiguous_grammars_stop_at_the_first_tree() -> None:
+    assert cfg.parser.unambiguous and PARTITION_SUM_CFG.parser.unambiguous
+    assert cfg.parser.find_ambiguous_sentence() is None
+    assert find_ambiguous_sentence(cfg) is None
+
+    earley = EarleyParser(PARTITION_SUM_CFG)
+    for index, sentence in enumerate(PARTITION_SUM_CFG.generate_sentences()):
+        if index % 50 == 0:
+            assert PARTITION_SUM_CFG.parser.parse(sentence) == earley.parse(sentence)
+            assert PARTITION_SUM_CFG.parser.parse(sentence[:-1]) == earley.parse(sentence[:-1])
+
+    # Recursive grammars without LL(1) conflicts are unambiguous, so they are not searched
+    list_cfg = ScaffoldedWritingCFG.fromstring("""
+        LIST -> ITEM REST
+        REST -> "," LIST | EPSILON
+        ITEM -> "x" | "y"
+        EPSILON ->
+    """)
+    assert list_cfg.parsing_strategy == "LL(1)" and list_cfg.parser.unambiguous
+
+    # The check for grammars that need an Earley parser only covers short sentences, so their trees are still counted
+    earley_cfg = ScaffoldedWritingCFG.fromstring('LIST -> LIST "," ITEM | ITEM\nITEM -> "x" | "y"')
+    assert earley_cfg.parsing_strategy == "Earley" and not earley_cfg.parser.unambiguous
+    assert earley_cfg.parser.parse(["x", ",", "y", ",", "x"]).num_trees == 1
+
+    long_witness_cfg = ScaffoldedWritingCFG.fromstring(f"""
+        S -> "a" S | T
+        T -> {' "b"' * 13} | U
+        U -> {' "b"' * 13}
+    """)
+    assert long_witness_cfg.parsing_strategy == "Earley"
+    with pytest.raises(AmbiguousParseException):
+        StudentSubmission(["b"] * 13, long_witness_cfg)
+
+    forest = EarleyParser(long_witness_cfg).parse_forest(["a"] + ["b"] * 13)
+    assert forest is not None and forest.count_trees() == 2
+    with pytest.raises(AmbiguousParseException):
+        forest.tree()
+
+
+def verify_uncompilable_grammars() -> None:
+    with pytest.raises(GrammarNotCompilableError, match="recursive"):
+        DFAParser(ScaffoldedWritingCFG.fromstring("""
+            LIST -> ITEM "," LIST | ITEM
+            ITEM -> "x"
+        """))
+
+    with pytest.raises(GrammarNotCompilableError, match="empty string in more than one way"):
+        DFAParser(ScaffoldedWritingCFG.fromstring("""
+            S -> "a" OPTIONAL
+            OPTIONAL -> EPSILON | EPSILON EPSILON
+            EPSILON ->
+        """, check_ambiguity=False))
+
+    with pytest.raises(GrammarTooLargeError):
+        DFAParser(cfg, max_states=5)
+
+    with pytest.raises(GrammarTooLargeError):
+        DFAParser(cfg, max_positions=10)
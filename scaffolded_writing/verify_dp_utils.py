@@ -7,14 +7,17 @@ from scaffolded_writing.dp_utils import (
     DecoupledParametersConstraint,
     DescriptiveFunctionName,
     ExplainParamsConstraint,
+    ExplainParamsVerdict,
     NoDoubleEndedParameterization,
     NoIrrelevantRestrictions,
     ReducesRecursivelyConstraint,
     concat_into_production_rule,
+    get_terminal_variables,
     list_to_english
 )
 
 from scaffolded_writing.dp_cfgs import PARTITION_SUM_CFG as cfg
+from scaffolded_writing.cfg import ScaffoldedWritingCFG
 from typing import List
 
 class VerifyDPStudentSubmission:
@@ -49,6 +52,35 @@ class VerifyDPStudentSubmission:
              "A[1..n]", "under the constraint that", "A[1]", "is part of a", "j-digit", "term", "."], cfg)
         assert submission.mentioned_variables == {'n', 'j'}
 
+    def verify_fields_are_computed_lazily(self) -> None:
+        submission = DPStudentSubmission(
+            ["define", "DP(i,j)", "to be the", "maximum", "sum", "that can be obtained", "from",
+             "A[1..i]", "using", "at most", "t", "2-digit terms", "."], cfg)
+        assert submission._function_declaration is None and submission._mentioned_variables is None
+        assert DeclareFunctionConstraint().is_satisfied(submission)
+        assert submission._mentioned_variables is None and submission._parameters_in_field == {}
+
+        assert submission.get_parameters_in_field("SUBARRAY") == {"i"}
+        assert submission.get_parameters_in_field("SUBARRAY") is submission.get_parameters_in_field("SUBARRAY")
+        assert submission.get_parameters_in_field("TERM_LENGTH") == set()
+        assert submission.mentioned_variables is submission.mentioned_variables
+
+    def verify_terminal_variables(self) -> None:
+        assert cfg.terminal_variables["A[i..j]"] == {"i", "j"}
+        assert cfg.terminal_variables["MaxSum(i,j)"] == {"i", "j"}
+        assert cfg.terminal_variables["the rest of the array"] == set()
+        assert set(cfg.terminal_variables) == {token for sentence in cfg.generate_sentences() for token in sentence}
+
+        # A plain ScaffoldedWritingCFG works too, with its terminal variables computed on first use
+        plain_cfg = ScaffoldedWritingCFG(cfg.start(), cfg.productions())
+        submission = DPStudentSubmission(
+            ["define", "DP(i,j)", "to be the", "maximum", "sum", "that can be obtained", "from",
+             "A[1..i]", "using", "at most", "t", "2-digit terms", "."], plain_cfg)
+        assert submission.mentioned_variables == {"i", "t"}
+        assert submission.get_parameters_in_field("SUBARRAY") == {"i"}
+        assert get_terminal_variables(plain_cfg) == cfg.terminal_variables
+        assert get_terminal_variables(plain_cfg) is get_terminal_variables(ScaffoldedWritingCFG(cfg.start(), cfg.productions()))
+
 class VerifyDPConstraints:
     def verify_declare_function_constraint(self) -> None:
         submission = DPStudentSubmission(
@@ -106,18 +138,22 @@ class VerifyDPConstraints:
              "A[i..n]", "using", "at most", "t", "2-digit terms", "."], cfg)
         constraint = ExplainParamsConstraint(variables_in_problem=['n'])
         assert not constraint.is_satisfied(submission)
-        assert constraint.unexplained_params == {'j'}
-        assert constraint.undefined_variables == {'t'}
-        assert not constraint.mentioned_params_without_explaining
+        verdict = constraint.evaluate(submission)
+        assert isinstance(verdict, ExplainParamsVerdict)
+        assert verdict.unexplained_params == {'j'}
+        assert verdict.undefined_variables == {'t'}
+        assert not verdict.mentioned_params_without_explaining
 
         submission = DPStudentSubmission(
             ["define", "DP(i,j)", "to be the", "maximum", "sum", "that can be obtained",
              "for i and j", "."], cfg)
         constraint = ExplainParamsConstraint(variables_in_problem=["n", "t"])
         assert not constraint.is_satisfied(submission)
-        assert constraint.unexplained_params == set()
-        assert constraint.undefined_variables == set()
-        assert constraint.mentioned_params_without_explaining
+        verdict = constraint.evaluate(submission)
+        assert isinstance(verdict, ExplainParamsVerdict)
+        assert verdict.unexplained_params == set()
+        assert verdict.undefined_variables == set()
+        assert verdict.mentioned_params_without_explaining
 
         submission = DPStudentSubmission(
             ["define", "DP(i)", "to be the", "maximum", "sum", "that can be obtained", "from",
@@ -231,7 +267,13 @@ class VerifyDPConstraints:
 class VerifyMiscellaneousUtils:
     def verify_concat_into_production_rule(self) -> None:
         assert concat_into_production_rule(["DP", "MaxSum"], ["(i)", "(i,j)"]) == \
-            '"DP(i)" | "DP(i,j)" | "MaxSum(i)" | "MaxSum(i,j)"'
+            '["DP" | "MaxSum"]["(i)" | "(i,j)"]'
+        cfg = ScaffoldedWritingCFG.fromstring(
+            f'START -> "the subproblem" | {concat_into_production_rule(["DP", "MaxSum"], ["(i)", "(i,j)"])}'
+        )
+        assert sorted(cfg.generate_sentences()) == \
+            [("DP(i)",), ("DP(i,j)",), ("MaxSum(i)",), ("MaxSum(i,j)",), ("the subproblem",)]
+
     @pytest.mark.parametrize(
         "input,expected",
         [(["i"], "i"),
@@ -0,0 +1,90 @@
+import pytest
+
+from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader
+from scaffolded_writing.dp_utils import DeclareFunctionConstraint, DPStudentSubmission
+from scaffolded_writing.exhaustive_grading import LanguageReport, grade_language, grade_sentences
+from scaffolded_writing.grader_registry import get_grader
+from scaffolded_writing.cfg import ScaffoldedWritingCFG
+
+cfg = ScaffoldedWritingCFG.fromstring("""
+    SENTENCE -> SUBJECT VERB OBJECT "." | INTERJECTION "!"
+    SUBJECT -> NOUN
+    NOUN -> "Jason" | "the squirrel"
+    VERB -> "ate" | "fought" | "kicked" | "hugged"
+    OBJECT -> NOUN | EPSILON
+    INTERJECTION -> "Wow" | "Ouch"
+    EPSILON ->
+""")
+
+recursive_cfg = ScaffoldedWritingCFG.fromstring("""
+    LIST -> LIST "," ITEM | ITEM
+    ITEM -> "x" | "y"
+""")
+
+
+def verify_generate_sentences() -> None:
+    sentences = list(cfg.generate_sentences())
+
+    assert len(sentences) == cfg.count_sentences() == len(set(sentences)) == 2 * 4 * 3 + 2
+    assert ("Jason", "ate", "the squirrel", ".") in sentences
+    assert ("the squirrel", "hugged", ".") in sentences
+    assert ("Wow", "!") in sentences
+
+
+def verify_generate_sentences_rejects_infinite_language() -> None:
+    assert cfg.is_finite()
+    assert not recursive_cfg.is_finite()
+
+    with pytest.raises(ValueError, match="infinitely many sentences"):
+        recursive_cfg.generate_sentences()
+
+
+def verify_grade_language() -> None:
+    grader = get_grader("max_profit")
+    report = grade_language("max_profit", max_examples=2)
+
+    assert report.num_sentences == grader.question_cfg.count_sentences()
+    assert sum(report.score_histogram.values()) == report.num_sentences
+    assert report.score_histogram[1.0] == 1
+    assert report.num_ambiguous == 0
+    assert len(report.exception_counts) == 0
+
+    # Every sentence without full credit failed exactly one constraint and received feedback
+    assert sum(report.failures_by_constraint.values()) == report.num_sentences - report.score_histogram[1.0]
+    assert sum(report.feedback_counts.values()) == report.num_sentences - report.score_histogram[1.0]
+    assert report.failures_by_constraint["0: DeclareFunctionConstraint"] == report.score_histogram[0.0]
+    assert all(len(examples) <= 2 for examples in report.examples_by_constraint.values())
+
+
+def verify_grade_language_in_parallel() -> None:
+    serial_report = grade_language("max_profit").to_json()
+    parallel_report = grade_language("max_profit", processes=2, chunk_size=100).to_json()
+
+    for key in ["num_sentences", "score_histogram", "feedback_counts"]:
+        assert serial_report[key] == parallel_report[key]
+
+
+def verify_report_records_exceptions() -> None:
+    report = grade_sentences(get_grader("max_profit"), [["define"], ["define"]], max_examples=1)
+
+    assert report.num_sentences == 2
+    description, = report.exception_counts
+    assert description.startswith("ValueError: Your submission could not be parsed.")
+    assert report.exception_counts[description] == 2
+    assert report.exception_examples[description] == [["define"]]
+
+    merged_report = LanguageReport(max_examples=3)
+    merged_report.merge(report)
+    merged_report.merge(report)
+    assert merged_report.exception_counts[description] == 4
+    assert merged_report.exception_examples[description] == [["define"], ["define"]]
+
+
+def verify_misconfigured_grader_is_rejected() -> None:
+    grader = IncrementalConstraintGrader(DPStudentSubmission, get_grader("max_profit").question_cfg)
+    with pytest.raises(ValueError, match="No constraints set"):
+        grade_sentences(grader, [["define"]])
+
+    grader.add_constraint(DeclareFunctionConstraint(), 0.5)
+    with pytest.raises(ValueError, match="doesn't grant full credit"):
+        grade_sentences(grader, [["define"]])
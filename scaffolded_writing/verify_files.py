@@ -0,0 +1,36 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from scaffolded_writing.files import atomic_write
+
+def verify_atomic_write_replaces_the_file(tmp_path: Path) -> None:
+    path = str(tmp_path / "state.json")
+    with open(path, "w") as f:
+        f.write("old")
+
+    with atomic_write(path) as f:
+        f.write("new")
+        # Readers see the old file until the block exits
+        with open(path) as old:
+            assert old.read() == "old"
+
+    with open(path) as f:
+        assert f.read() == "new"
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def verify_failed_atomic_write_leaves_no_temporary_file(tmp_path: Path) -> None:
+    path = str(tmp_path / "table.sgt")
+    with open(path, "wb") as f:
+        f.write(b"old")
+
+    with pytest.raises(RuntimeError):
+        with atomic_write(path, "wb") as f:
+            f.write(b"half of the new")
+            raise RuntimeError("Interrupted")
+
+    with open(path, "rb") as f:
+        assert f.read() == b"old"
+    assert os.listdir(tmp_path) == ["table.sgt"]
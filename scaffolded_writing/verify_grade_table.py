@@ -0,0 +1,130 @@
+from pathlib import Path
+
+import pytest
+
+import flask_app
+from scaffolded_writing.build_grade_table import build_grade_table
+from scaffolded_writing.constraint_based_grader import GradeResult, IncrementalConstraintGrader
+from scaffolded_writing.grade_table import HEADER, GradeTable, write_grade_table
+from scaffolded_writing.exhaustive_grading import grade_language
+from scaffolded_writing.grader_registry import get_grader, get_live_grader
+from scaffolded_writing.regrade import regrade_record
+from scaffolded_writing.metrics import METRICS
+
+def verify_write_and_read_grade_table(tmp_path: Path) -> None:
+    path = str(tmp_path / "table.sgt")
+    rows = [
+        (["Jason", "ate", "."], (1.0, None, None)),
+        (["Jason", "ate"], (0.5, "Where's the period?", 1)),
+        (["Jason ate", "."], (0.5, "Where's the period?", 1)),
+        (["the squirrel", "ate", "."], (0.0, "Who is the squirrel?", 0)),
+    ]
+    assert write_grade_table(path, "f" * 64, rows) == 4
+
+    table = GradeTable(path)
+    assert table.fingerprint == "f" * 64
+    assert len(table) == 4
+    for tokens, row in rows:
+        assert table.get(tokens) == row
+    assert table.get(["Jason"]) is None
+    assert table.get([]) is None
+    table.close()
+
+    # Feedback strings are stored once
+    assert Path(path).read_bytes().count(b"Where's the period?") == 1
+
+    with pytest.raises(ValueError, match="same sentence"):
+        write_grade_table(path, "f" * 64, rows + rows[:1])
+
+    Path(path).write_bytes(b"not a grade table" * 10)
+    with pytest.raises(ValueError, match="not a version"):
+        GradeTable(path)
+
+
+def verify_grader_uses_grade_table(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    grader: IncrementalConstraintGrader = get_grader("max_profit")
+    path = str(tmp_path / "max_profit.sgt")
+    sentences = [list(tokens) for tokens in grader.question_cfg.generate_sentences()]
+
+    assert build_grade_table("max_profit", path, chunk_size=500) == len(sentences)
+    try:
+        assert grader.load_grade_table(path)
+
+        # Live grading is never needed for the sentences in the table
+        def grade_live(tokens):
+            raise AssertionError("Graded live")
+        monkeypatch.setattr(grader, "_IncrementalConstraintGrader__evaluate_constraints", grade_live)
+        grade_results = [grader.grade_result(tokens) for tokens in sentences]
+        monkeypatch.undo()
+
+        grader.grade_table = None
+        assert grade_results == [grader.grade_result(tokens) for tokens in sentences]
+        assert grader.load_grade_table(path)
+
+        # Sentences that are not in the table are graded live
+        with pytest.raises(ValueError):
+            grader.grade_result(sentences[0][:-1])
+
+        METRICS.clear()
+        client = flask_app.app.test_client()
+        response = client.post("/max_profit/submit", json=sentences[0])
+        assert response.get_data(as_text=True) == (grade_results[0].feedback or "Good job!")
+        assert METRICS.collect()[("scaffolded_writing_grade_table_hits_total", ("max_profit",))] == [1]
+
+        # Constraint failures are counted for sentences looked up in the table too
+        index, result = next((index, result) for index, result in enumerate(grade_results) if result.failed_constraint is not None)
+        METRICS.clear()
+        grader.grade_result(sentences[index])
+        constraint_name = grader.constraint_names[result.failed_constraint]
+        assert METRICS.collect()[("scaffolded_writing_constraint_failures_total", ("max_profit", constraint_name))] == [1]
+    finally:
+        grader.grade_table = None
+
+
+def verify_out_of_date_grade_table_is_ignored(tmp_path: Path) -> None:
+    grader: IncrementalConstraintGrader = get_grader("max_profit")
+    tokens = list(next(grader.question_cfg.generate_sentences()))
+
+    path = str(tmp_path / "max_profit.sgt")
+    write_grade_table(path, "0" * 64, [(tokens, (0.25, "Stale feedback", 0))])
+    assert not grader.load_grade_table(path)
+    assert grader.grade_table is None
+    assert grader.grade_result(tokens) != GradeResult(0.25, "Stale feedback", 0)
+
+    assert not grader.load_grade_table(str(tmp_path / "missing.sgt"))
+
+    # A truncated table is rejected instead of being read past its end
+    write_grade_table(path, grader.fingerprint, [(tokens, (0.25, "Stale feedback", 0))])
+    Path(path).write_bytes(Path(path).read_bytes()[:HEADER.size + 8])
+    assert not grader.load_grade_table(path)
+
+
+def verify_offline_tools_grade_live(tmp_path: Path) -> None:
+    grader: IncrementalConstraintGrader = get_grader("max_profit")
+    sentences = [list(tokens) for tokens in grader.question_cfg.generate_sentences()]
+    live_results = [grader.grade_result(tokens) for tokens in sentences]
+
+    # A table with the current fingerprint whose grades are wrong, e.g. one built before a bug fix
+    # that did not change the grader's code
+    path = str(tmp_path / "max_profit.sgt")
+    write_grade_table(path, grader.fingerprint, [(tokens, (0.25, "Stale feedback", 0)) for tokens in sentences])
+    try:
+        assert grader.load_grade_table(path)
+        assert grader.grade_result(sentences[0]) == GradeResult(0.25, "Stale feedback", 0)
+
+        live_grader = get_live_grader("max_profit")
+        assert live_grader is not grader and live_grader is get_live_grader("max_profit")
+        assert live_grader.grade_table is None and live_grader.fingerprint == grader.fingerprint
+
+        record = regrade_record({"problem": "max_profit", "tokens": sentences[0]})
+        assert (record["score"], record["feedback"]) == live_results[0][:2]
+        assert "Stale feedback" not in grade_language("max_profit").feedback_counts
+
+        # Building a table in this process leaves the registered grader's table in place
+        assert build_grade_table("max_profit", str(tmp_path / "rebuilt.sgt")) == len(sentences)
+        assert grader.grade_table is not None and grader.grade_table.path == path
+        rebuilt = GradeTable(str(tmp_path / "rebuilt.sgt"))
+        assert [GradeResult(*rebuilt.get(tokens)) for tokens in sentences] == live_results
+        rebuilt.close()
+    finally:
+        grader.grade_table = None
@@ -0,0 +1,190 @@
+import subprocess
+import sys
+
+import pytest
+
+from scaffolded_writing.cfg import ScaffoldedWritingCFG
+from scaffolded_writing.dp_cfgs import PARTITION_SUM_CFG
+from scaffolded_writing.grammar import CFG, Nonterminal, Production, SymbolTable, TerminalFamily, expand_terminal_families
+from scaffolded_writing.parsers import EarleyParser, LL1Parser
+from scaffolded_writing.tree import CompactTreeBuilder, Tree
+
+grammar_string = """
+    # A comment
+    %start SENTENCE
+    NOUN -> "Jason" | 'the "squirrel"'
+    SENTENCE -> NOUN VERB \\
+        OBJECT "." | "Wow" "!"
+    VERB -> "ate" | "fought"
+    OBJECT -> NOUN | EPSILON
+    EPSILON ->
+"""
+
+def verify_fromstring() -> None:
+    cfg = CFG.fromstring(grammar_string)
+    sentence, noun, verb, obj, epsilon = (
+        Nonterminal(symbol) for symbol in ["SENTENCE", "NOUN", "VERB", "OBJECT", "EPSILON"]
+    )
+
+    assert cfg.start() == sentence
+    assert cfg.productions(lhs=noun) == [Production(noun, ["Jason"]), Production(noun, ['the "squirrel"'])]
+    assert cfg.productions(lhs=sentence) == [
+        Production(sentence, [noun, verb, obj, "."]),
+        Production(sentence, ["Wow", "!"]),
+    ]
+    assert cfg.productions(lhs=epsilon) == [Production(epsilon, [])]
+    assert len(cfg.productions()) == 9
+    assert str(cfg.productions(lhs=sentence)[0]) == "SENTENCE -> NOUN VERB OBJECT '.'"
+
+    with pytest.raises(ValueError, match="line 2"):
+        CFG.fromstring('S -> "a"\nS "b"')
+    with pytest.raises(ValueError, match="Unterminated string"):
+        CFG.fromstring('S -> "a')
+    with pytest.raises(ValueError, match="No productions"):
+        CFG.fromstring("# Nothing here")
+
+
+def verify_fromstring_matches_nltk() -> None:
+    nltk_grammar = pytest.importorskip("nltk.grammar")
+    from scaffolded_writing.nltk_compat import from_nltk_grammar, to_nltk_grammar
+
+    partition_sum_string = "\n".join(str(prod) for prod in expand_terminal_families(PARTITION_SUM_CFG.productions()))
+    for grammar in [grammar_string, partition_sum_string]:
+        nltk_cfg = nltk_grammar.CFG.fromstring(grammar)
+        cfg = CFG.fromstring(grammar)
+
+        assert str(cfg.start()) == str(nltk_cfg.start())
+        assert [str(prod) for prod in cfg.productions()] == [str(prod) for prod in nltk_cfg.productions()]
+        assert to_nltk_grammar(cfg).productions() == nltk_cfg.productions()
+        assert from_nltk_grammar(nltk_cfg).productions() == cfg.productions()
+
+    assert from_nltk_grammar(nltk_cfg, ScaffoldedWritingCFG).fingerprint == PARTITION_SUM_CFG.fingerprint
+
+
+def verify_terminal_families() -> None:
+    family_grammar = """
+        START -> "define" DECLARATION "."
+        DECLARATION -> "the subproblem" | ["DP" | 'Max"Sum']["(i)" | "(i,j)"]
+    """
+    family = TerminalFamily([["DP", 'Max"Sum'], ["(i)", "(i,j)"]])
+    cfg = ScaffoldedWritingCFG.fromstring(family_grammar)
+    assert cfg.productions(lhs=Nonterminal("DECLARATION"))[1].rhs() == (family,)
+    assert CFG.fromstring("\n".join(str(prod) for prod in cfg.productions())).productions() == cfg.productions()
+    assert family.match('Max"Sum(i,j)') == ('Max"Sum', "(i,j)")
+    assert family.match("DP(j)") is None
+    assert list(family.members()) == ["DP(i)", "DP(i,j)", 'Max"Sum(i)', 'Max"Sum(i,j)']
+
+    # Every parser reads the members of the family, and the trees' leaves are the tokens themselves
+    flat_cfg = ScaffoldedWritingCFG(cfg.start(), expand_terminal_families(cfg.productions()))
+    assert cfg.count_sentences() == flat_cfg.count_sentences() == 5
+    assert list(cfg.generate_sentences()) == list(flat_cfg.generate_sentences())
+    for parser in [cfg.parser, LL1Parser(cfg.start(), cfg.productions(), cfg.ll1_table), EarleyParser(cfg)]:
+        result = parser.parse(["define", "DP(i,j)", "."])
+        assert result.num_trees == 1 and result.tree is not None
+        assert result.tree == Tree("START", ["define", Tree("DECLARATION", ["DP(i,j)"]), "."])
+        assert parser.parse(["define", "DP(k)", "."]).num_trees == 0
+    assert cfg.parser.next_tokens(["define"]) == flat_cfg.parser.next_tokens(["define"])
+    assert cfg.can_produce_path("DECLARATION", "DP(i)")
+    assert not cfg.can_produce_path("DECLARATION", str(family))
+
+    # The browser is sent the equivalent flat grammar
+    assert cfg.to_json_string() == flat_cfg.to_json_string()
+    assert cfg.fingerprint == flat_cfg.fingerprint
+
+    with pytest.raises(ValueError, match="matches both"):
+        ScaffoldedWritingCFG.fromstring('START -> "DP(i)" | ["DP" | "Memo"]["(i)"]')
+
+
+def verify_tree() -> None:
+    tree = Tree("S", [Tree("NP", ["Jason"]), Tree("VP", [Tree("V", ["ate"]), Tree("NP", [])])])
+
+    assert tree.label() == "S"
+    assert tree.leaves() == ["Jason", "ate"]
+    assert [subtree.label() for subtree in tree.subtrees()] == ["S", "NP", "VP", "V", "NP"]
+    assert list(tree.subtrees(filter=lambda subtree: subtree.label() == "NP")) == [tree[0], tree[1][1]]
+    assert str(tree) == "(S (NP Jason) (VP (V ate) (NP)))"
+    assert tree == Tree("S", [Tree("NP", ["Jason"]), Tree("VP", [Tree("V", ["ate"]), Tree("NP", [])])])
+    assert tree[0] != Tree("VP", ["Jason"])
+
+    # Deep trees don't hit the recursion limit
+    deep_tree = Tree("LIST", ["x"])
+    for _ in range(5000):
+        deep_tree = Tree("LIST", [deep_tree, "x"])
+    assert deep_tree.leaves() == ["x"] * 5001
+    assert sum(1 for _ in deep_tree.subtrees()) == 5001
+
+
+def verify_compact_tree() -> None:
+    cfg = CFG.fromstring(grammar_string)
+    noun, verb, obj, epsilon = (Nonterminal(symbol) for symbol in ["NOUN", "VERB", "OBJECT", "EPSILON"])
+
+    symbol_table = SymbolTable(cfg.start(), cfg.productions())
+    assert symbol_table.symbols[:3] == [cfg.start(), noun, "Jason"]
+
+    builder = CompactTreeBuilder(symbol_table)
+    root = builder.add(symbol_table.ids[cfg.start()], -1)
+    builder.add(symbol_table.ids["Jason"], builder.add(symbol_table.ids[noun], root))
+    builder.add(symbol_table.ids["ate"], builder.add(symbol_table.ids[verb], root))
+    builder.add(symbol_table.ids[epsilon], builder.add(symbol_table.ids[obj], root))
+    builder.add(symbol_table.ids["."], root)
+    tree = builder.build()
+
+    expected = Tree("SENTENCE", [
+        Tree("NOUN", ["Jason"]), Tree("VERB", ["ate"]), Tree("OBJECT", [Tree("EPSILON", [])]), "."
+    ])
+    assert tree == expected and expected == tree
+    assert tree.to_tree() == expected
+    assert str(tree) == "(SENTENCE (NOUN Jason) (VERB ate) (OBJECT (EPSILON)) .)"
+    assert tree.label() == "SENTENCE"
+    assert len(tree) == 4 and tree[3] == "." and tree[2].label() == "OBJECT"
+    assert [child if isinstance(child, str) else child.label() for child in tree] == ["NOUN", "VERB", "OBJECT", "."]
+    assert tree.leaves() == ["Jason", "ate", "."]
+    assert tree[2].leaves() == []
+    assert [subtree.label() for subtree in tree.subtrees()] == ["SENTENCE", "NOUN", "VERB", "OBJECT", "EPSILON"]
+    assert [subtree.leaves() for subtree in tree.subtrees(lambda subtree: subtree.label() == "NOUN")] == [["Jason"]]
+    assert tree[2][0] == Tree("EPSILON", []) and tree[0] != tree[2][0]
+
+    # Trees from different grammars compare by their labels and shape
+    assert EarleyParser(cfg).parse(["Jason", "ate", "."]).tree == tree
+    other_tree = EarleyParser(cfg).parse(["Jason", "ate", "Jason", "."]).tree
+    assert other_tree != tree and other_tree[2][0] == tree[0]
+
+    # Deep trees don't hit the recursion limit
+    list_cfg = CFG.fromstring('LIST -> LIST "x" | "x"')
+    builder = CompactTreeBuilder(SymbolTable(list_cfg.start(), list_cfg.productions()))
+    list_id, x_id = builder.symbol_table.ids[list_cfg.start()], builder.symbol_table.ids["x"]
+    # Add the left spine of LIST nodes first, then the "x" under each of them, from the bottom up
+    for node in range(5001):
+        builder.add(list_id, node - 1)
+    for node in reversed(range(5001)):
+        builder.add(x_id, node)
+    deep_tree = builder.build()
+    assert deep_tree.leaves() == ["x"] * 5001
+    assert sum(1 for _ in deep_tree.subtrees()) == 5001
+    assert deep_tree == deep_tree.to_tree()
+    assert str(deep_tree).startswith("(LIST (LIST (LIST")
+
+
+def verify_nltk_tree_round_trip() -> None:
+    nltk_tree = pytest.importorskip("nltk.tree")
+    from scaffolded_writing.nltk_compat import from_nltk_tree, to_nltk_tree
+
+    tree = Tree("S", [Tree("NP", ["Jason"]), Tree("VP", [Tree("V", ["ate"]), Tree("NP", [])])])
+    assert to_nltk_tree(tree) == nltk_tree.Tree.fromstring("(S (NP Jason) (VP (V ate) (NP)))")
+    assert from_nltk_tree(to_nltk_tree(tree)) == tree
+
+    cfg = CFG.fromstring(grammar_string)
+    parsed_tree = EarleyParser(cfg).parse(["Jason", "ate", "."]).tree
+    assert to_nltk_tree(parsed_tree) == nltk_tree.Tree.fromstring("(SENTENCE (NOUN Jason) (VERB ate) (OBJECT (EPSILON)) .)")
+
+
+def verify_problems_load_without_nltk() -> None:
+    # Importing every problem must not import nltk, which is slow to load
+    code = (
+        "import importlib, pkgutil, sys, problems\n"
+        "for module in pkgutil.iter_modules(problems.__path__):\n"
+        "    importlib.import_module('problems.' + module.name)\n"
+        "print(any(name == 'nltk' or name.startswith('nltk.') for name in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "False"
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader
+from scaffolded_writing.grader_registry import get_grader
+from scaffolded_writing.metrics import METRICS, MetricsRegistry
+
+def verify_counters_and_histograms() -> None:
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    latency = registry.histogram("latency_seconds", "Latency", buckets=[0.1, 1.0])
+
+    requests.inc('say "hi"\n')
+    requests.inc('say "hi"\n', amount=2)
+    for value in [0.05, 0.1, 0.5, 3.0]:
+        latency.observe(value)
+
+    assert registry.render() == "\n".join([
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="say \\"hi\\"\\n"} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]) + "\n"
+
+    with pytest.raises(ValueError, match="already registered"):
+        registry.counter("requests_total", "Requests again")
+
+
+def verify_values_from_every_thread_are_collected() -> None:
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests")
+
+    def record() -> None:
+        for _ in range(1000):
+            requests.inc()
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    record()
+
+    assert registry.collect() == {("requests_total", ()): [9000]}
+    # The shards of the threads that exited were merged when collecting
+    assert len(registry._shards) == 1
+
+    registry.clear()
+    assert registry.collect() == {}
+
+
+def verify_grader_records_metrics() -> None:
+    grader: IncrementalConstraintGrader = get_grader("max_profit")
+    sentence = list(next(grader.question_cfg.generate_sentences()))
+    METRICS.clear()
+
+    failed_constraint = grader.grade_result(sentence).failed_constraint
+    with pytest.raises(ValueError):
+        grader.grade_result(sentence[:-1])
+
+    values = METRICS.collect()
+    assert values[("scaffolded_writing_parse_seconds", ("max_profit",))][0] == 2
+    assert values[("scaffolded_writing_parse_errors_total", ("max_profit",))] == [1]
+
+    num_evaluated = len(grader.constraints) if failed_constraint is None else failed_constraint + 1
+    for name in grader.constraint_names[:num_evaluated]:
+        assert values[("scaffolded_writing_constraint_seconds", ("max_profit", name))][0] >= 1
+    if failed_constraint is not None:
+        failed_name = grader.constraint_names[failed_constraint]
+        assert values[("scaffolded_writing_constraint_failures_total", ("max_profit", failed_name))] == [1]
@@ -0,0 +1,133 @@
+import json
+import random
+from collections import deque
+from typing import Any, Dict, List, Sequence
+
+import pytest
+
+from scaffolded_writing.cfg import ScaffoldedWritingCFG
+from scaffolded_writing.grader_registry import get_grader
+from scaffolded_writing.grammar import Nonterminal
+from scaffolded_writing.next_tokens import (
+    SENTINEL_TOKEN,
+    NextTokenParser,
+    find_left_recursion,
+    get_possible_next_tokens,
+)
+
+cfg = ScaffoldedWritingCFG.fromstring("""
+    SENTENCE -> SUBJECT VERB OBJECT "." | INTERJECTION "!"
+    SUBJECT -> NOUN
+    NOUN -> "Jason" | "the squirrel" | "the <b>squirrel</b>"
+    VERB -> "ate" | "fought" | "kicked" | "hugged"
+    OBJECT -> NOUN | EPSILON
+    INTERJECTION -> "Wow" | "Ouch"
+    EPSILON ->
+""")
+
+ambiguous_cfg = ScaffoldedWritingCFG.fromstring("""
+    S -> "a" S | A "a" S | "b" | EPSILON
+    A -> "a" | "a" "b" | EPSILON
+    EPSILON ->
+""", check_ambiguity=False)
+
+left_recursive_cfg = ScaffoldedWritingCFG.fromstring("""
+    LIST -> OPTIONAL_COMMA LIST "x" | "x"
+    OPTIONAL_COMMA -> "," | EPSILON
+    EPSILON ->
+""", check_ambiguity=False)
+
+def js_possible_next_tokens(prefix: Sequence[str], json_cfg: Dict[str, Any]) -> List[str]:
+    "A line-by-line port of getPossibleNextTokens in static/scaffolded-writing.js"
+    possible_next_tokens: Dict[str, None] = {}
+    configs_to_explore = deque([{
+        "stack": [{"text": SENTINEL_TOKEN, "isTerminal": True}, {"text": json_cfg["start"], "isTerminal": False}],
+        "remainingInput": list(reversed(prefix)),
+    }])
+
+    while configs_to_explore:
+        curr_config = configs_to_explore.popleft()
+        if len(curr_config["stack"]) == 0:
+            continue
+
+        curr_symbol = curr_config["stack"].pop()
+        if curr_symbol["isTerminal"]:
+            if len(curr_config["remainingInput"]) == 0:
+                possible_next_tokens.setdefault(curr_symbol["text"])
+            elif curr_symbol["text"] == curr_config["remainingInput"].pop():
+                configs_to_explore.append(curr_config)
+        else:
+            for prod in json_cfg["productions"]:
+                if prod["lhs"] == curr_symbol["text"]:
+                    configs_to_explore.append({
+                        "stack": curr_config["stack"] + list(reversed(prod["rhs"])),
+                        "remainingInput": list(curr_config["remainingInput"]),
+                    })
+
+    return list(possible_next_tokens)
+
+
+def verify_next_tokens() -> None:
+    parser = NextTokenParser(cfg)
+
+    assert parser.next_tokens([]) == ["Wow", "Ouch", "Jason", "the squirrel", "the &lt;b&gt;squirrel&lt;/b&gt;"]
+    assert parser.next_tokens(["Jason"]) == ["ate", "fought", "kicked", "hugged"]
+    assert parser.next_tokens(["Jason", "ate"]) == ["Jason", "the squirrel", "the &lt;b&gt;squirrel&lt;/b&gt;", "."]
+    assert parser.next_tokens(["Jason", "ate", "."]) == [SENTINEL_TOKEN]
+    assert parser.next_tokens(["Jason", "ate", ".", SENTINEL_TOKEN]) == []
+    assert parser.next_tokens(["ate"]) == []
+
+
+@pytest.mark.parametrize("grammar", [cfg, ambiguous_cfg], ids=["cfg", "ambiguous_cfg"])
+def verify_next_tokens_match_js(grammar: ScaffoldedWritingCFG) -> None:
+    json_cfg = json.loads(grammar.to_json_string())
+    parser = NextTokenParser(grammar)
+
+    prefixes: List[List[str]] = [[]]
+    for prefix in prefixes:
+        tokens = js_possible_next_tokens(prefix, json_cfg)
+        assert parser.next_tokens(prefix) == tokens
+        if len(prefix) < 5:
+            prefixes.extend(prefix + [token] for token in tokens if token != SENTINEL_TOKEN)
+
+
+@pytest.mark.parametrize("problem_name", ["max_profit", "partition_digits_basic_version"])
+def verify_next_tokens_match_js_for_problem(problem_name: str) -> None:
+    grammar = get_grader(problem_name).question_cfg
+    json_cfg = json.loads(grammar.to_json_string())
+
+    # Walk random paths through the grammar, checking every prefix along the way
+    rng = random.Random(0)
+    for _ in range(20):
+        prefix: List[str] = []
+        while True:
+            tokens = js_possible_next_tokens(prefix, json_cfg)
+            assert get_possible_next_tokens(grammar, prefix) == tokens
+            if tokens == [SENTINEL_TOKEN]:
+                break
+            prefix.append(rng.choice([token for token in tokens if token != SENTINEL_TOKEN]))
+
+
+def verify_prefix_states_are_cached() -> None:
+    parser = NextTokenParser(cfg, cache_size=2)
+
+    parser.next_tokens(["Jason", "ate"])
+    assert len(parser.prefix_states) == 2
+    assert parser.prefix_states.get(("Jason", "ate")) is not None
+
+    # Extending a cached prefix finds its state with one lookup after missing on the new prefix
+    parser.prefix_states.clear()
+    parser.next_tokens(["Jason"])
+    assert parser.prefix_states.stats().hits == 0
+    parser.next_tokens(["Jason", "ate"])
+    assert parser.prefix_states.stats().hits == 1
+    assert parser.prefix_states.get(("Jason", "ate")) is not None
+
+
+def verify_left_recursive_cfg_is_rejected() -> None:
+    assert find_left_recursion(cfg) is None
+    assert find_left_recursion(ambiguous_cfg) is None
+    assert find_left_recursion(left_recursive_cfg) == Nonterminal("LIST")
+
+    with pytest.raises(ValueError, match="left-recursive in LIST"):
+        NextTokenParser(left_recursive_cfg)
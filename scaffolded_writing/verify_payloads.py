@@ -0,0 +1,51 @@
+import gzip
+import json
+import zlib
+
+from scaffolded_writing.cfg import ScaffoldedWritingCFG
+from scaffolded_writing.payloads import CompressedPayload, parse_accept_encoding
+
+cfg = ScaffoldedWritingCFG.fromstring("""
+    SENTENCE -> SUBJECT VERB OBJECT "." | INTERJECTION "!"
+    SUBJECT -> NOUN
+    NOUN -> "Jason" | "the squirrel" | "the <b>squirrel</b>"
+    VERB -> "ate" | "fought" | "kicked" | "hugged"
+    OBJECT -> NOUN | EPSILON
+    INTERJECTION -> "Wow" | "Ouch"
+    EPSILON ->
+""")
+
+def verify_parse_accept_encoding() -> None:
+    assert parse_accept_encoding(None) == {}
+    assert parse_accept_encoding("gzip, deflate;q=0.5, br;q=abc, *;q=0") == {
+        "gzip": 1.0, "deflate": 0.5, "br": 0.0, "*": 0.0
+    }
+
+
+def verify_negotiation() -> None:
+    payload = CompressedPayload(b"[" + b"1, " * 1000 + b"1]")
+
+    assert payload.negotiate(None).encoding == "identity"
+    assert payload.negotiate("gzip").encoding == "gzip"
+    assert payload.negotiate("deflate, gzip;q=0").encoding == "deflate"
+    assert payload.negotiate("gzip;q=0, deflate;q=0").encoding == "identity"
+    assert payload.negotiate("*").encoding in {"br", "gzip", "deflate"}
+
+    # Nothing is acceptable, so fall back to the uncompressed body
+    assert payload.negotiate("identity;q=0").encoding == "identity"
+
+    etags = {variant.etag for variant in payload.variants.values()}
+    assert len(etags) == len(payload.variants)
+    assert CompressedPayload(b"[1]").variants["gzip"].etag not in etags
+
+
+def verify_cfg_json_payload() -> None:
+    json_string = cfg.to_json_string()
+    assert cfg.to_json_string() is json_string
+    assert json.loads(json_string)["productions"][5]["rhs"][0]["text"] == "the &lt;b&gt;squirrel&lt;/b&gt;"
+
+    payload = cfg.json_payload
+    assert payload is cfg.json_payload
+    assert payload.variants["identity"].body == json_string.encode()
+    assert gzip.decompress(payload.variants["gzip"].body) == json_string.encode()
+    assert zlib.decompress(payload.variants["deflate"].body) == json_string.encode()
@@ -0,0 +1,88 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from scaffolded_writing import regrade
+from scaffolded_writing.grader_registry import get_grader
+
+def write_submissions(path: Path) -> List[Dict[str, Any]]:
+    grader = get_grader("partition_digits_basic_version")
+    records: List[Dict[str, Any]] = [
+        {"id": index, "problem": "partition_digits_basic_version", "tokens": list(sentence)}
+        for index, sentence in zip(range(40), grader.question_cfg.generate_sentences())
+    ]
+    records.append({"id": 40, "problem": "partition_digits_basic_version", "tokens": ["not", "a", "sentence"]})
+    records.append({"id": 41, "problem": "no_such_problem", "tokens": []})
+
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.write("\n{not json\n")
+
+    return records
+
+
+def read_results(path: Path) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def verify_regrade(tmp_path: Path) -> None:
+    input_path, output_path = tmp_path / "submissions.jsonl", tmp_path / "results.jsonl"
+    records = write_submissions(input_path)
+
+    assert regrade.regrade(str(input_path), str(output_path), processes=2, chunk_size=3) == len(records) + 1
+    assert not os.path.exists(str(output_path) + ".checkpoint")
+
+    results = read_results(output_path)
+    assert [result.get("id") for result in results] == [record["id"] for record in records] + [None]
+
+    grader = get_grader("partition_digits_basic_version")
+    for record, result in zip(records[:40], results):
+        score, feedback = grader.grade_tokens(record["tokens"])
+        assert (result["score"], result["feedback"]) == (score, feedback)
+        assert result["tokens"] == record["tokens"]
+
+    assert "format_error" in results[40]
+    assert results[41]["error"].startswith("Unknown problem")
+    assert results[42]["error"].startswith("Invalid JSON")
+
+
+def verify_regrade_resumes_from_checkpoint(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    input_path = tmp_path / "submissions.jsonl"
+    write_submissions(input_path)
+    regrade.regrade(str(input_path), str(tmp_path / "expected.jsonl"), chunk_size=5)
+
+    output_path = tmp_path / "results.jsonl"
+    regrade_chunk = regrade._regrade_chunk
+    num_chunks = 0
+
+    def interrupted_regrade_chunk(chunk: Tuple[int, List[bytes]]) -> Tuple[int, int, bytes]:
+        nonlocal num_chunks
+        num_chunks += 1
+        if num_chunks == 3:
+            raise KeyboardInterrupt
+        return regrade_chunk(chunk)
+
+    monkeypatch.setattr(regrade, "_regrade_chunk", interrupted_regrade_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        regrade.regrade(str(input_path), str(output_path), chunk_size=5)
+    monkeypatch.undo()
+
+    checkpoint = regrade.Checkpoint.load(str(output_path) + ".checkpoint")
+    assert checkpoint is not None and checkpoint.num_records == 10
+
+    # Output written after the checkpoint is discarded on resume
+    with open(output_path, "a") as f:
+        f.write('{"partial": ')
+
+    assert regrade.regrade(str(input_path), str(output_path), chunk_size=5) == 43
+    assert output_path.read_bytes() == (tmp_path / "expected.jsonl").read_bytes()
+
+    # A checkpoint for another input is rejected rather than silently applied
+    checkpoint._replace(input_path="/elsewhere.jsonl").save(str(output_path) + ".checkpoint")
+    with pytest.raises(ValueError, match="different input file"):
+        regrade.regrade(str(input_path), str(output_path), chunk_size=5)
@@ -2,8 +2,15 @@ import pytest
 
 from typing import List
 
-from scaffolded_writing.student_submission import StudentSubmission, PathCanNeverExistWarning, AmbiguousParseException
+from scaffolded_writing.grammar import Nonterminal
+from scaffolded_writing.student_submission import (
+    PARSE_CACHE,
+    AmbiguousParseException,
+    PathCanNeverExistWarning,
+    StudentSubmission,
+)
 from scaffolded_writing.cfg import ScaffoldedWritingCFG
+from scaffolded_writing.parsers import EarleyParser, LL1Parser
 
 cfg = ScaffoldedWritingCFG.fromstring("""
     SENTENCE -> SUBJECT VERB OBJECT "." | INTERJECTION "!"
@@ -18,6 +25,22 @@ cfg = ScaffoldedWritingCFG.fromstring("""
 ambiguous_cfg = ScaffoldedWritingCFG.fromstring("""
     S -> A A
     A -> "a" | "a" "a"
+""", check_ambiguity=False)
+
+highly_ambiguous_cfg = ScaffoldedWritingCFG.fromstring("""
+    S -> S S | "a"
+""", check_ambiguity=False)
+
+right_recursive_cfg = ScaffoldedWritingCFG.fromstring("""
+    LIST -> ITEM REST
+    REST -> "," LIST | EPSILON
+    ITEM -> "x" | "y"
+    EPSILON ->
+""")
+
+left_recursive_cfg = ScaffoldedWritingCFG.fromstring("""
+    LIST -> LIST "," ITEM | ITEM
+    ITEM -> "x" | "y"
 """)
 
 
@@ -33,6 +56,107 @@ class VerifyStudentSubmission:
         with pytest.raises(AmbiguousParseException):
             StudentSubmission(["a", "a", "a"], ambiguous_cfg)
 
+    def verify_many_parses_exception(self) -> None:
+        # The number of parse trees grows exponentially with the length of this submission
+        with pytest.raises(AmbiguousParseException):
+            StudentSubmission(["a"] * 40, highly_ambiguous_cfg)
+
+    def verify_left_recursive_cfg(self) -> None:
+        submission = StudentSubmission(["x", ",", "y", ",", "x"], left_recursive_cfg)
+        assert submission.does_path_exist("LIST", "LIST", "LIST", "ITEM", "x")
+        assert not submission.does_path_exist("LIST", "LIST", "LIST", "ITEM", "y")
+
+        with pytest.raises(ValueError, match="could not be parsed"):
+            StudentSubmission(["x", ",", ","], left_recursive_cfg)
+
+    def verify_long_left_recursive_input(self) -> None:
+        # The parse tree is as deep as the input is long, so this must not recurse once per token
+        tokens = ["x"] + [",", "y"] * 2000
+        submission = StudentSubmission(tokens, left_recursive_cfg)
+
+        assert submission.parse_tree.leaves() == tokens
+        node, depth = submission.parse_tree, 1
+        while len(node) == 3:
+            assert node.label() == "LIST" and node[1] == "," and node[2][0] == "y"
+            node, depth = node[0], depth + 1
+        assert depth == 2001 and node[0][0] == "x"
+        assert submission.does_path_exist("LIST", "LIST", "ITEM", "x")
+
+        with pytest.raises(ValueError, match="could not be parsed"):
+            StudentSubmission(tokens + [","], left_recursive_cfg)
+
+    def verify_parsing_strategy(self) -> None:
+        assert cfg.parsing_strategy == "DFA"
+        assert ambiguous_cfg.parsing_strategy == "DFA"
+        assert right_recursive_cfg.parsing_strategy == "LL(1)"
+        assert left_recursive_cfg.parsing_strategy == "Earley"
+
+        assert cfg.first_sets[Nonterminal("SENTENCE")] == {"Jason", "the squirrel", "Wow", "Ouch"}
+        assert cfg.follow_sets[Nonterminal("OBJECT")] == {"."}
+
+    @pytest.mark.parametrize(
+        "tokens",
+        [
+            ["Jason", "fought", "the squirrel", "."],
+            ["Jason", "fought", "."],
+            ["Ouch", "!"],
+            ["Ouch", "."],
+            ["Jason", "fought", "the squirrel"],
+            ["Jason", "fought", "the squirrel", ".", "."],
+            [],
+        ]
+    )
+    def verify_parsers_agree(self, tokens: List[str]) -> None:
+        ll1_parser = LL1Parser(cfg.start(), list(cfg.productions()), cfg.ll1_table)
+        assert cfg.parser.parse(tokens) == ll1_parser.parse(tokens) == EarleyParser(cfg).parse(tokens)
+
+    def verify_parse_cache(self) -> None:
+        PARSE_CACHE.clear()
+
+        first_submission = StudentSubmission(["Jason", "ate", "."], cfg)
+        second_submission = StudentSubmission(["Jason", "ate", "."], cfg)
+        assert first_submission.parse_tree is second_submission.parse_tree
+
+        # Parse failures and ambiguous parses are cached too
+        for _ in range(2):
+            with pytest.raises(ValueError, match="could not be parsed"):
+                StudentSubmission(["ate", "Jason", "."], cfg)
+
+            with pytest.raises(AmbiguousParseException):
+                StudentSubmission(["a", "a", "a"], ambiguous_cfg)
+
+        assert PARSE_CACHE.stats().hits == 3
+        assert PARSE_CACHE.stats().misses == 3
+
+    def verify_cfg_fingerprint(self) -> None:
+        grammar = """
+            S -> "a" B
+            B -> "b" | "c"
+        """
+        edited_grammar = """
+            S -> "a" B
+            B -> "b" | "d"
+        """
+
+        assert ScaffoldedWritingCFG.fromstring(grammar).fingerprint == \
+            ScaffoldedWritingCFG.fromstring(grammar).fingerprint
+        assert ScaffoldedWritingCFG.fromstring(grammar).fingerprint != \
+            ScaffoldedWritingCFG.fromstring(edited_grammar).fingerprint
+
+    def verify_can_derive(self) -> None:
+        assert cfg.can_derive("SENTENCE", "NOUN")
+        assert cfg.can_derive("SENTENCE", "the squirrel")
+        assert cfg.can_derive("OBJECT", "EPSILON")
+        assert cfg.can_derive("SUBJECT", "Jason")
+
+        assert not cfg.can_derive("SUBJECT", "VERB")
+        assert not cfg.can_derive("SUBJECT", "SUBJECT")
+        assert not cfg.can_derive("NOUN", "ate")
+        assert not cfg.can_derive("Jason", "Jason")
+        assert not cfg.can_derive("INTERSECTION", "Wow")
+
+        assert left_recursive_cfg.can_derive("LIST", "LIST")
+
     def verify_does_path_exist(self) -> None:
         submission = StudentSubmission(["Jason", "fought", "the squirrel", "."], cfg)
 
@@ -95,6 +219,21 @@ class VerifyStudentSubmission:
         with pytest.raises(PathCanNeverExistWarning):
             submission.does_path_exist(*path)
 
+    def verify_parse_tree_index(self) -> None:
+        submission = StudentSubmission(["Jason", "hugged", "the squirrel", "."], cfg)
+        index = submission.parse_tree_index
+
+        assert index is submission.parse_tree_index
+        # The index is cached along with the parse tree, so resubmitting the same tokens reuses it
+        assert index is StudentSubmission(["Jason", "hugged", "the squirrel", "."], cfg).parse_tree_index
+        assert [subtree.leaves() for subtree in index.subtrees_with_label("NOUN")] == [["Jason"], ["the squirrel"]]
+        assert index.subtrees_with_label("Jason") == []
+        assert index.has_path(("SENTENCE", "OBJECT", "NOUN"))
+        assert not index.has_path(("SENTENCE", "NOUN"))
+
+        # The NOUN under OBJECT and the NOUN under SUBJECT are different nodes
+        assert not index.has_path(("SUBJECT", "NOUN", "the squirrel"))
+
     def verify_behavior_with_epsilon_productions(self) -> None:
         # OBJECT has a child in this parse tree, so its epsilon production was not used
         submission = StudentSubmission(["Jason", "fought", "the squirrel", "."], cfg)
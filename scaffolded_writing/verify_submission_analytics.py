@@ -0,0 +1,95 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from scaffolded_writing import submission_analytics
+from scaffolded_writing.exhaustive_grading import constraint_name
+from scaffolded_writing.grader_registry import get_grader
+from scaffolded_writing.submission_analytics import SubmissionAnalytics
+from scaffolded_writing.submission_log import SubmissionLogger
+
+def log_submissions(path: str, submissions) -> None:
+    submission_logger = SubmissionLogger(path)
+    for submission in submissions:
+        submission_logger.log(*submission, 0.001)
+    submission_logger.close()
+
+
+def verify_dashboards(tmp_path: Path) -> None:
+    log_path = str(tmp_path / "submissions.sqlite")
+    wrong, right = ["define", "DP(i)"], ["define", "DP(i)", "."]
+    log_submissions(log_path, [
+        ("p", wrong, 0.5, 1, "Explain i"),
+        ("p", right, 1.0, None, None),
+        ("p", wrong, 0.5, 1, "Explain i"),
+        ("p", ["define"], 0.0, 0, "Define DP"),
+        ("p", ["define", "oops"], None, None, "Could not parse"),
+        ("q", wrong, 0.0, 2, "Explain i"),
+    ])
+
+    report = submission_analytics.update_analytics(log_path, chunk_size=4, top=1)
+    assert report == {
+        "p": {
+            "num_submissions": 5,
+            "num_unparseable": 1,
+            "mean_score": 0.5,
+            "score_histogram": {"0.0": 1, "0.5": 2, "1.0": 1},
+            "failed_constraints": {"1": 2},
+            "feedback": {"Explain i": 2},
+            "wrong_sentences": [{"tokens": wrong, "count": 2}],
+        },
+        "q": {
+            "num_submissions": 1,
+            "num_unparseable": 0,
+            "mean_score": 0.0,
+            "score_histogram": {"0.0": 1},
+            "failed_constraints": {"2": 1},
+            "feedback": {"Explain i": 1},
+            "wrong_sentences": [{"tokens": wrong, "count": 1}],
+        },
+    }
+
+    # Registered problems name their constraints
+    grader = get_grader("max_profit")
+    results = ((list(sentence), grader.grade_result(list(sentence))) for sentence in grader.question_cfg.generate_sentences())
+    sentence, result = next((sentence, result) for sentence, result in results if result.failed_constraint is not None)
+    log_submissions(log_path, [("max_profit", sentence, result.score, result.failed_constraint, result.feedback)])
+    report = submission_analytics.update_analytics(log_path)
+    assert report["max_profit"]["failed_constraints"] == {constraint_name(grader, result.failed_constraint): 1}
+    assert report["max_profit"]["wrong_sentences"] == [{"tokens": sentence, "count": 1}]
+    assert report["p"]["num_submissions"] == 5
+
+
+def verify_updates_are_incremental(tmp_path: Path) -> None:
+    log_path, state_path = str(tmp_path / "submissions.sqlite"), str(tmp_path / "analytics.json")
+    submissions = [
+        ("p", ["define", "DP(i)"] + ["x"] * (index % 3), index % 4 / 4, index % 4, f"Feedback {index % 4}")
+        for index in range(50)
+    ]
+    log_submissions(log_path, submissions[:20])
+    first_report = submission_analytics.update_analytics(log_path, state_path, chunk_size=7)
+    assert first_report["p"]["num_submissions"] == 20
+
+    # Only the new submissions are read, and the counts match those of reading the whole log at once
+    log_submissions(log_path, submissions[20:])
+    connection = sqlite3.connect(log_path)
+    analytics = SubmissionAnalytics.load(state_path)
+    assert analytics is not None and analytics.offset == 20
+    assert analytics.update(connection, chunk_size=7) == 30 and analytics.offset == 50
+    assert analytics.update(connection) == 0
+
+    from_scratch = SubmissionAnalytics(analytics.log_path)
+    assert from_scratch.update(connection) == 50
+    assert analytics.report(connection) == from_scratch.report(connection)
+    assert submission_analytics.update_analytics(log_path, state_path, chunk_size=7) == from_scratch.report(connection)
+    connection.close()
+
+    with open(state_path) as f:
+        assert json.load(f)["offset"] == 50
+
+    with pytest.raises(ValueError, match="different submission log"):
+        submission_analytics.update_analytics(str(tmp_path / "other.sqlite"), state_path)
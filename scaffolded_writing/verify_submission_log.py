@@ -0,0 +1,140 @@
+import functools
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+import flask_app
+from scaffolded_writing.constraint_based_grader import IncrementalConstraintGrader
+from scaffolded_writing.grader_registry import get_grader
+from scaffolded_writing.metrics import METRICS
+from scaffolded_writing.submission_log import SubmissionLogger, unpack_token_ids
+
+def read_submissions(path: str):
+    connection = sqlite3.connect(path)
+    tokens = dict(connection.execute("SELECT id, text FROM tokens"))
+    feedback = dict(connection.execute("SELECT id, text FROM feedback"))
+    rows = [
+        (problem, [tokens[token_id] for token_id in unpack_token_ids(token_ids)], score, failed_constraint,
+         feedback.get(feedback_id), grading_seconds)
+        for problem, token_ids, score, failed_constraint, feedback_id, grading_seconds in connection.execute(
+            "SELECT problem, token_ids, score, failed_constraint, feedback_id, grading_seconds FROM submissions ORDER BY id"
+        )
+    ]
+    journal_mode, = connection.execute("PRAGMA journal_mode").fetchone()
+    connection.close()
+    return rows, journal_mode
+
+
+def verify_submissions_are_written_in_batches(tmp_path: Path) -> None:
+    path = str(tmp_path / "submissions.sqlite")
+    submission_logger = SubmissionLogger(path, batch_size=2, flush_interval=0.01)
+    submission_logger.log("p", ["define", "DP(i)"], 0.5, 1, "Explain i", 0.001)
+    submission_logger.log("p", ["define", "DP(i)", "."], 1.0, None, None, 0.002)
+    submission_logger.flush()
+    submission_logger.log("q", ["define"], None, None, "Could not parse", 0.003)
+    submission_logger.close()
+
+    rows, journal_mode = read_submissions(path)
+    assert journal_mode == "wal"
+    assert rows == [
+        ("p", ["define", "DP(i)"], 0.5, 1, "Explain i", 0.001),
+        ("p", ["define", "DP(i)", "."], 1.0, None, None, 0.002),
+        ("q", ["define"], None, None, "Could not parse", 0.003),
+    ]
+
+    # A new logger reuses the interned ids, and nothing is logged after it is closed
+    submission_logger = SubmissionLogger(path)
+    submission_logger.log("p", ["define", "DP(i)"], 0.5, 1, "Explain i", 0.004)
+    submission_logger.close()
+    submission_logger.log("p", ["define"], 0.0, 0, "Unlogged", 0.005)
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT COUNT(*) FROM tokens").fetchone() == (3,)
+    assert connection.execute("SELECT COUNT(*) FROM feedback").fetchone() == (2,)
+    assert connection.execute("SELECT COUNT(*) FROM submissions").fetchone() == (4,)
+    connection.close()
+
+    with pytest.raises(ValueError, match="overflow policy"):
+        SubmissionLogger(path, overflow="wait")
+
+
+def verify_full_queue_drops_submissions(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = str(tmp_path / "submissions.sqlite")
+    writing = threading.Event()
+    release = threading.Event()
+    insert = SubmissionLogger._SubmissionLogger__insert  # type: ignore[attr-defined]
+
+    def slow_insert(*args):
+        writing.set()
+        release.wait()
+        insert(*args)
+    monkeypatch.setattr(SubmissionLogger, "_SubmissionLogger__insert", staticmethod(slow_insert))
+
+    METRICS.clear()
+    submission_logger = SubmissionLogger(path, max_queue=2, batch_size=1)
+    submission_logger.log("p", ["a"], 1.0, None, None, 0.0)
+    writing.wait()
+    for _ in range(5):
+        submission_logger.log("p", ["b"], 1.0, None, None, 0.0)
+    release.set()
+    submission_logger.close()
+
+    rows, _ = read_submissions(path)
+    assert [tokens for _, tokens, *_ in rows] == [["a"], ["b"], ["b"]]
+    assert METRICS.collect()[("scaffolded_writing_submissions_dropped_total", ("p",))] == [3]
+
+
+_worker_logger: Optional[SubmissionLogger] = None
+
+def log_from_worker(path: str, index: int) -> int:
+    "Logs a submission with the worker's own logger, which is created the first time, as get_submission_logger does"
+    global _worker_logger
+    if _worker_logger is None:
+        _worker_logger = SubmissionLogger(path, flush_interval=60)
+    _worker_logger.log("p", [str(index)], 1.0, None, None, 0.0)
+    return os.getpid()
+
+
+def verify_pool_workers_write_their_submissions(tmp_path: Path) -> None:
+    path = str(tmp_path / "submissions.sqlite")
+    # Nothing is written before the workers exit, so the submissions are only logged if the workers'
+    # loggers are closed when they do
+    with ProcessPoolExecutor(2) as executor:
+        worker_pids = set(executor.map(functools.partial(log_from_worker, path), range(100)))
+
+    assert os.getpid() not in worker_pids
+    rows, _ = read_submissions(path)
+    assert sorted(int(tokens[0]) for _, tokens, *_ in rows) == list(range(100))
+
+
+def verify_graders_log_submissions(tmp_path: Path) -> None:
+    path = str(tmp_path / "submissions.sqlite")
+    grader: IncrementalConstraintGrader = get_grader("max_profit")
+    sentence = list(next(grader.question_cfg.generate_sentences()))
+    result = grader.grade_result(sentence)
+    with pytest.raises(ValueError) as parse_error:
+        grader.grade_result(sentence[:-1])
+
+    grader.submission_logger = SubmissionLogger(path)
+    try:
+        client = flask_app.app.test_client()
+        client.post("/max_profit/submit", json=sentence)
+        client.post("/max_profit/submit_batch", json=[sentence, sentence[:-1], sentence])
+        # Grading for other purposes is not logged
+        grader.grade_result(sentence)
+        grader.submission_logger.close()
+    finally:
+        grader.submission_logger = None
+
+    rows, _ = read_submissions(path)
+    assert [row[:5] for row in rows] == [
+        ("max_profit", sentence, result.score, result.failed_constraint, result.feedback),
+        ("max_profit", sentence, result.score, result.failed_constraint, result.feedback),
+        ("max_profit", sentence[:-1], None, None, str(parse_error.value)),
+        ("max_profit", sentence, result.score, result.failed_constraint, result.feedback),
+    ]
+    assert all(grading_seconds >= 0 for *_, grading_seconds in rows)
@@ -1,7 +1,9 @@
 // contains logic specific to standalone website (not shared by PL)
 
 entered_tokens = [];
-setUpScaffoldedWritingQuestion("", entered_tokens, cfg);
+if (typeof cfgPromise !== 'undefined') {
+    cfgPromise.then(cfg => setUpScaffoldedWritingQuestion("", entered_tokens, cfg));
+}
 
 $('.question-grade').click(async e => {
     $('#feedback').text('');